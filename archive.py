@@ -0,0 +1,127 @@
+"""
+Архив закрытых заказов — чтобы orders/order_items не росли вечно рядом
+с живым каталогом и корзинами.
+
+Заказы done/cancel старше N дней фоновый run() переносит кусками в
+помесячные файлы <dir>/orders-YYYY-MM.jsonl.gz (месяц — по дате
+создания): по JSON-строке на заказ вместе со строками (снимок названия
+и цены, см. migrations.v9_archive). Файлы только дописываются — каждый
+кусок добавляет к gzip новый member, gzip.open читает их подряд.
+
+Кусок — одна транзакция писателя: прочитать заказы, дописать и fsync
+файлы, удалить заказы (строки уходят каскадом). Упала запись файла —
+откат, заказы на месте; упал COMMIT после записи — при следующем
+проходе заказ допишется ещё раз, find() берёт первую копию.
+Таблица archive (месяц → диапазон id) говорит, какой файл открыть:
+find() распаковывает один-два месяца, а не весь архив.
+
+Дневные агрегаты (sales.py) уже посчитаны и остаются в базе; пересчёт
+sales.rebuild не трогает дни до archive_until. Архив ждёт, пока
+sales.backfill досчитает историю.
+
+users.first_order (реф-скидка — на первый заказ) заказы, перенесённые после
+v12, уже проставили. Тем, чьи заказы ушли сюда раньше, его один раз
+дописывает first_orders() по файлам (миграция v14); архив ждёт и его.
+"""
+
+import asyncio, datetime as dt, gzip, json, os
+
+BATCH = 200
+
+# +status: идти по orders_created без сортировки, а не по orders_status_id
+# с сортировкой всех закрытых заказов на каждый кусок
+TAKE  = """SELECT id,user_id,created,status,total,discount,pay_method,delivery FROM orders
+           WHERE created>=? AND created<? AND +status IN ('done','cancel') ORDER BY created LIMIT ?"""
+ITEMS = "SELECT order_id,flavour_id,name,qty,price FROM order_items WHERE order_id IN ({})"
+
+
+def path(folder:str, month:str): return os.path.join(folder, f"orders-{month}.jsonl.gz")
+
+
+def move(con, folder:str, until:str, since:str="", limit:int=BATCH):
+    """Один кусок: закрытые заказы, созданные в [since, until), → архив.
+    Внутри db.tx(...). → (перенесено заказов, created последнего) — since
+    следующего куска, чтобы не листать заново старые pending/paid."""
+    orders = con.execute(TAKE, (since, until, limit)).fetchall()
+    if not orders: return 0, since
+    ids = [o[0] for o in orders]
+    items = {}
+    for oid, *it in con.execute(ITEMS.format(",".join("?"*len(ids))), ids): items.setdefault(oid, []).append(it)
+    months = {}
+    for oid, uid, created, status, total, discount, method, delivery in orders:
+        months.setdefault(created[:7], []).append(
+            {"id": oid, "user_id": uid, "created": created, "status": status, "total": total,
+             "discount": discount, "pay_method": method, "delivery": delivery, "items": items.get(oid, [])})
+    os.makedirs(folder, exist_ok=True)
+    for month, recs in months.items():
+        with open(path(folder, month), "ab") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as z:
+                z.write("".join(json.dumps(r, ensure_ascii=False)+"\n" for r in recs).encode())
+            raw.flush(); os.fsync(raw.fileno())
+        con.execute("""INSERT INTO archive(month,first_id,last_id,orders) VALUES(?,?,?,?)
+                       ON CONFLICT DO UPDATE SET first_id=MIN(first_id,excluded.first_id),
+                           last_id=MAX(last_id,excluded.last_id), orders=orders+excluded.orders""",
+                    (month, min(r["id"] for r in recs), max(r["id"] for r in recs), len(recs)))
+    con.execute(f"DELETE FROM orders WHERE id IN ({','.join('?'*len(ids))})", ids)
+    return len(ids), orders[-1][2]
+
+
+async def run(db, folder:str, days:int) -> int:
+    """Перенести всё, что старше days дней, по транзакции на кусок. → заказов."""
+    if await db.fetchone("SELECT 1 FROM sales_backfill UNION ALL SELECT 1 FROM first_order_backfill"): return 0
+    until = (dt.datetime.now(dt.timezone.utc).date()-dt.timedelta(days=days)).isoformat()
+    # граница — до переноса: sales.rebuild не должен пересчитать день, часть которого уже в архиве
+    await db.execute("UPDATE archive_until SET day=MAX(day,?)", (until,))
+    n, since = 0, ""
+    while True:
+        k, since = await db.tx(lambda con: move(con, folder, until, since))
+        if not k: return n
+        n += k
+
+
+def first_ids(folder:str, months) -> dict:
+    """user_id → id его самого раннего заказа в файлах месяцев (синхронно,
+    читает с диска; пропавший файл — ошибка, а не «заказов не было»)."""
+    first = {}
+    for month in months:
+        with gzip.open(path(folder, month), "rb") as f:
+            for line in f:
+                r = json.loads(line)
+                if r["id"] < first.get(r["user_id"], r["id"]+1): first[r["user_id"]] = r["id"]
+    return first
+
+async def first_orders(db, folder:str) -> int:
+    """Один раз после v14: users.first_order по архиву тем, у кого его нет.
+    → пользователей, кому проставлен."""
+    if not await db.fetchone("SELECT 1 FROM first_order_backfill"): return 0
+    months = [m for m, in await db.fetchall("SELECT month FROM archive")]
+    first = await asyncio.to_thread(first_ids, folder, months)
+    def fill(con):
+        n = con.executemany("""INSERT INTO users(id,first_order) VALUES(?,?) ON CONFLICT(id)
+                               DO UPDATE SET first_order=excluded.first_order WHERE first_order IS NULL""",
+                            list(first.items())).rowcount
+        con.execute("DELETE FROM first_order_backfill")
+        return n
+    return await db.tx(fill)
+
+
+def scan(folder:str, months, oid:int):
+    """Найти заказ в файлах месяцев → dict или None (синхронно, читает с диска)."""
+    head = b'{"id": %d,' % oid
+    for month in months:
+        try:
+            with gzip.open(path(folder, month), "rb") as f:
+                for line in f:
+                    if line.startswith(head): return json.loads(line)
+        except FileNotFoundError:
+            continue
+    return None
+
+async def find(db, folder:str, oid:int):
+    """Заказ из архива → dict (id, user_id, created, status, total, discount,
+    pay_method, delivery, items [(flavour_id, name, qty, price)]) или None;
+    у заказов, ушедших в архив до v11, delivery нет."""
+    months = [m for m, in await db.fetchall("SELECT month FROM archive WHERE first_id<=? AND last_id>=?",
+                                            (oid, oid))]
+    if not months: return None
+    return await asyncio.to_thread(scan, folder, months, oid)
@@ -0,0 +1,96 @@
+"""
+Архив закрытых заказов (archive.py) на истории в N заказов (по умолчанию
+500k за ~2 года, как в bench_sales): перенос всего старше 180 дней
+кусками, пока идут новые заказы; размер живых данных базы до/после
+(страницы без freelist и после VACUUM) и размер архива; карточка заказа
+из базы против карточки из архива; сверка — в архиве и в базе ровно
+исходные заказы, агрегаты «📊 Статистика» не изменились, удаление
+товара не стирает строки заказов.
+
+    python bench/bench_archive.py [заказов]
+"""
+import asyncio, glob, gzip, json, os, random, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import DB
+import archive, migrations, sales, shop
+from bench_sales import history, snapshot, FLAVOURS
+from bench_load import pct
+
+DAYS = 180
+
+
+def past(con):
+    """Агрегаты до сегодняшнего дня — новые заказы бенча их не меняют."""
+    day = sales.today().isoformat()
+    return tuple([r for r in rows if r[0] < day] for rows in snapshot(con))
+
+
+def live_mb(con):
+    (pages,), (free,), (size,) = (con.execute(f"PRAGMA {p}").fetchone() for p in ("page_count", "freelist_count", "page_size"))
+    return (pages-free)*size/1e6
+
+
+async def main(n):
+    folder = tempfile.mkdtemp(); dbpath = os.path.join(folder, "bench.db")
+    db = DB(dbpath); await db.raw(migrations.migrate)
+    t = time.perf_counter(); await db.raw(lambda con: history(con, n))
+    await db.execute("UPDATE order_items SET name='Pod – f'||flavour_id")
+    await db.tx(sales.rebuild)
+    print(f"история: {n} заказов за {time.perf_counter()-t:.1f}с, живых данных {await db.raw(live_mb):.0f} МБ")
+    total0 = await db.fetchone("SELECT COUNT(*),SUM(total) FROM orders")
+    kept = await db.raw(past)
+
+    # перенос, тем временем — новые заказы
+    arch = os.path.join(folder, "archive")
+    t = time.perf_counter(); job = asyncio.create_task(archive.run(db, arch, DAYS))
+    lat = []
+    while not job.done():
+        uid = 10**6+len(lat); t1 = time.perf_counter()
+        await db.execute("INSERT INTO carts(user_id,flavour_id,qty) VALUES(?,?,1)", (uid, 1+uid % FLAVOURS))
+        await db.tx(lambda con: shop.place_order(con, uid, "card"))
+        lat.append(time.perf_counter()-t1)
+    moved = await job
+    files = glob.glob(os.path.join(arch, "*.gz"))
+    size = sum(map(os.path.getsize, files))
+    print(f"архив: {moved} заказов за {time.perf_counter()-t:.1f}с, {len(files)} файлов, {size/1e6:.1f} МБ; "
+          f"параллельно {len(lat)} заказов, p50={pct(lat, .5):.1f}мс p99={pct(lat, .99):.1f}мс")
+    before = os.path.getsize(dbpath)
+    await db.raw(lambda con: con.execute("VACUUM"))
+    print(f"база: живых данных {await db.raw(live_mb):.0f} МБ, файл {before/1e6:.0f} → "
+          f"{os.path.getsize(dbpath)/1e6:.0f} МБ после VACUUM")
+
+    # сверка: база + архив = история, агрегаты не тронуты (и пересчёт их не трогает)
+    ids, tot = set(), 0.0
+    for fn in files:
+        with gzip.open(fn, "rt", encoding="utf-8") as f:
+            for line in f:
+                o = json.loads(line); ids.add(o["id"]); tot += o["total"]
+                assert o["status"] in ("done", "cancel") and o["items"]
+    cnt, s = await db.fetchone(f"SELECT COUNT(*),SUM(total) FROM orders WHERE id<={n}")
+    assert (len(ids)+cnt, round(tot+s, 2)) == (total0[0], round(total0[1], 2)) and len(ids) == moved
+    assert kept == await db.raw(past)
+    await db.tx(sales.rebuild)
+    assert kept == await db.raw(past), "пересчёт задел архивные дни"
+    print("сверка: база + архив = история, агрегаты те же")
+
+    # карточка заказа: из базы и из архива
+    hot = [i for i, in await db.fetchall("SELECT id FROM orders WHERE id<=? LIMIT 200", (n,))]
+    cold = random.Random(1).sample(sorted(ids), 50)
+    q = "SELECT o.status,oi.name,oi.qty,oi.price FROM orders o JOIN order_items oi ON oi.order_id=o.id WHERE o.id=?"
+    for label, xs, fn in (("из базы", hot, lambda i: db.fetchall(q, (i,))),
+                          ("из архива", cold, lambda i: archive.find(db, arch, i))):
+        ts = []
+        for i in xs:
+            t = time.perf_counter(); assert await fn(i); ts.append(time.perf_counter()-t)
+        print(f"карточка {label:<10} p50={pct(ts, .5):7.2f}мс p99={pct(ts, .99):7.2f}мс")
+
+    # снимок строки: удалили товар — строки заказа на месте
+    oid = hot[0]
+    await db.execute("DELETE FROM products WHERE id=1")
+    rows = await db.fetchall(q, (oid,))
+    assert rows and all(r[1] for r in rows)
+    print(f"товар удалён, заказ #{oid}: {rows[0][1]} ×{rows[0][2]} — на месте")
+    db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500_000))
@@ -0,0 +1,47 @@
+"""
+Стоимость диспетчеризации callback'а в aiogram в зависимости от числа
+хендлеров: цепочка `lambda c: c.data.startswith(...)` + ручной split/int
+против одного хендлера с callbacks.Router. Кнопка — последняя в цепочке
+(худший случай для линейного перебора). Хендлеры ничего не отправляют.
+
+    python bench/bench_callbacks.py [итераций]
+"""
+import asyncio, os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from aiogram import Bot, Dispatcher, types
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from callbacks import CB, Router
+
+def update(data):
+    return types.Update(**{"update_id": 1, "callback_query": {
+        "id": "1", "chat_instance": "1", "data": data,
+        "from": {"id": 5, "is_bot": False, "first_name": "u"}}})
+
+async def per_call(dp, upd, n):
+    Bot.set_current(dp.bot)
+    for _ in range(200): await dp.process_update(upd)
+    t = time.perf_counter()
+    for _ in range(n): await dp.process_update(upd)
+    return (time.perf_counter()-t)/n*1e6
+
+async def main(n):
+    bot = Bot("123456:BENCH")
+    print(f"{'хендлеров':>9} {'lambda-цепочка':>15} {'Router':>10}   мкс/callback")
+    for k in (8, 32, 128, 512):
+        lin = Dispatcher(bot, storage=MemoryStorage())
+        for i in range(k):
+            async def h(c, _i=i): _, a, b = c.data.split(":"); int(a), int(b)
+            lin.callback_query_handler(lambda c, p=f"p{i}:": c.data.startswith(p), state="*")(h)
+
+        rt, one = Router(), Dispatcher(bot, storage=MemoryStorage())
+        for i in range(k):
+            async def h(c, d): pass
+            rt(CB(f"p{i}", a=int, b=int))(h)
+        one.callback_query_handler(state="*")(rt.dispatch)
+
+        upd = update(f"p{k-1}:12:3")
+        print(f"{k:>9} {await per_call(lin, upd, n):>15.1f} {await per_call(one, upd, n):>10.1f}")
+    await (await bot.get_session()).close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,49 @@
+"""
+Стресс-тест checkout: сотни одновременных заказов на «горячие» вкусы.
+Проверяет, что склад не уходит в минус и продано ровно столько, сколько
+было, и печатает пропускную способность.
+
+    python bench/bench_checkout.py [покупателей] [вкусов] [остаток]
+"""
+import asyncio, os, sys, tempfile, time, random
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import DB
+import shop, migrations
+
+async def main(buyers, skus, stock):
+    db = DB(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    await db.raw(migrations.migrate)
+    await db.executemany("INSERT INTO flavours(id,name,price,stock) VALUES(?,?,100,?)", [(i, f"hot{i}", stock) for i in range(1, skus+1)])
+    await db.executemany("INSERT INTO users(id) VALUES(?)", [(u,) for u in range(buyers)])
+    rnd = random.Random(1)
+    await db.executemany("INSERT INTO carts VALUES(?,?,?)",
+        [(u, f, rnd.randint(1,3)) for u in range(buyers) for f in rnd.sample(range(1, skus+1), min(2, skus))])
+
+    ok = short = 0
+    async def buy(uid):
+        nonlocal ok, short
+        try:
+            if await db.tx(lambda con: shop.place_order(con, uid, "card", 60)): ok += 1
+        except shop.OutOfStock: short += 1
+
+    t = time.perf_counter()
+    await asyncio.gather(*(buy(u) for u in range(buyers)))
+    dt = time.perf_counter()-t
+
+    left = dict(await db.fetchall("SELECT id,stock FROM flavours"))
+    sold = dict(await db.fetchall("SELECT flavour_id,SUM(qty) FROM order_items GROUP BY flavour_id"))
+    assert min(left.values()) >= 0, f"oversold: {left}"
+    assert all(left[f]+sold.get(f,0) == stock for f in left), "stock/order_items mismatch"
+    print(f"{buyers} checkout за {dt*1000:.0f}мс ({buyers/dt:.0f}/с): заказов {ok}, отказов {short}, "
+          f"остаток {sorted(left.values())}")
+
+    # отмена возвращает резерв
+    oid, = await db.fetchone("SELECT MIN(id) FROM orders")
+    await db.tx(lambda con: shop.set_status(con, oid, "cancel"))
+    back = dict(await db.fetchall("SELECT id,stock FROM flavours"))
+    assert sum(back.values()) > sum(left.values())
+    db.close()
+
+if __name__ == "__main__":
+    a = [int(x) for x in sys.argv[1:]]
+    asyncio.run(main(*(a + [500, 3, 200][len(a):])))
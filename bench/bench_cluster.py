@@ -0,0 +1,116 @@
+"""
+Многопроцессный режим (cluster.py): bot.py отдельным процессом против
+фейкового Bot API, WORKERS = 1, 2, 4 … (1 — обычный одиночный процесс,
+больше — front + воркеры). Для каждого N:
+
+• пропускная способность — пользователи параллельно, у каждого по очереди
+  категория → товар → вкус и inline-поиск; апдейт обработан, когда пришёл
+  его answerCallbackQuery / answerInlineQuery;
+• изоляция — то же, пока админ без остановки гоняет «📤 Экспорт» каталога
+  на 100k вкусов (тяжёлый хендлер): p50/p99 остальных пользователей.
+
+Рост пропускной способности с N упирается в число ядер (печатается):
+на одном ядре процессы делят его и выигрыш — только в изоляции.
+
+    python bench/bench_cluster.py [пользователей] [--workers 1,2,4]
+"""
+import argparse, asyncio, os, random, signal, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from fake_tg import FakeTelegram
+from bench_load import pct, seed
+from db import DB
+import migrations
+
+ADMIN = 1
+CATS = ["Одноразовые системы", "Многоразовые системы", "Жидкости", "Разное"]
+BIG = 20_000                                    # товаров × 5 вкусов — каталог для экспорта
+HOT = 200                                       # товары, которые листают пользователи
+QUERIES = ["prod1", "f12", "prod19 f19", "f7-3", "prod"]
+
+
+class Answers:
+    """id callback/inline-запроса → future; резолвит слушатель фейкового API."""
+    def __init__(self, fake):
+        self.wait, self.docs = {}, asyncio.Queue()
+        fake.listeners.append(self.heard)
+
+    def heard(self, t, method, d):
+        if method == "senddocument": self.docs.put_nowait(t)
+        if f := self.wait.pop(d.get("callback_query_id") or d.get("inline_query_id"), None): f.set_result(t)
+
+    async def send(self, fake, u):
+        key = (u.get("callback_query") or u.get("inline_query"))["id"]
+        f = self.wait[key] = asyncio.get_running_loop().create_future()
+        t = time.perf_counter(); await fake.push(u)
+        return await f - t
+
+
+async def ready(fake, ans, uid):
+    """Ждать, пока бот поднимется: апдейты до skip_updates при старте теряются."""
+    while True:
+        u = fake.inline(uid, "prod")
+        try: return await asyncio.wait_for(ans.send(fake, u), 1)
+        except asyncio.TimeoutError: ans.wait.pop(u["inline_query"]["id"], None)
+
+
+def flow(fake, rnd, u, n):
+    out = []
+    while len(out) < n:
+        p = rnd.randint(1, HOT)
+        out += [fake.callback(u, f"cat:{CATS[p % len(CATS)]}"), fake.callback(u, f"prd:{p}"),
+                fake.callback(u, f"flv:{(p-1)*5+rnd.randint(1, 5)}"), fake.inline(u, rnd.choice(QUERIES))]
+    return out[:n]
+
+
+async def users(fake, ans, flows):
+    lat = []
+    async def one(ups):
+        for u in ups: lat.append(await ans.send(fake, u))
+    t = time.perf_counter(); await asyncio.gather(*map(one, flows))
+    return lat, time.perf_counter()-t
+
+
+async def run(n, base, path, fake, ans, a, uid0):
+    env = dict(os.environ, BOT_TOKEN="123456:BENCH", BOT_API_URL=base, ADMINS=str(ADMIN), DB_PATH=path,
+               RESERVE_MIN="0", ARCHIVE_DAYS="0", WORKERS=str(n), PUBLIC_URL="")
+    proc = await asyncio.create_subprocess_exec(sys.executable, os.path.join(os.path.dirname(__file__), "..", "bot.py"),
+                                                env=env, stderr=asyncio.subprocess.DEVNULL)
+    rnd = random.Random(n)
+    try:
+        await ready(fake, ans, uid0-1)
+        # прогрев: по апдейту от каждого — все воркеры поднялись, кеш каталога полон
+        await users(fake, ans, [flow(fake, rnd, u, 4) for u in range(uid0, uid0+a.users)])
+        lat, dt = await users(fake, ans, [flow(fake, rnd, u, a.updates) for u in range(uid0+10**5, uid0+10**5+a.users)])
+        print(f"N={n}: {len(lat)} апдейтов за {dt:.2f}с — {len(lat)/dt:6.0f}/с, p50={pct(lat, .5):6.1f}мс p99={pct(lat, .99):6.1f}мс",
+              end="")
+        stop = asyncio.Event()
+        async def admin():
+            k = 0
+            while not stop.is_set():
+                await fake.push(fake.callback(ADMIN, "io:csv")); await ans.docs.get(); k += 1
+            return k
+        job = asyncio.create_task(admin()); await asyncio.sleep(0.5)
+        lat, dt = await users(fake, ans, [flow(fake, rnd, u, a.updates) for u in range(uid0+2*10**5, uid0+2*10**5+a.users)])
+        stop.set(); k = await job
+        print(f" | с экспортом ({k} шт): p50={pct(lat, .5):6.1f}мс p99={pct(lat, .99):7.1f}мс")
+    finally:
+        proc.send_signal(signal.SIGTERM); await proc.wait()
+
+
+async def main(a):
+    fake = FakeTelegram(); base = await fake.start(); ans = Answers(fake)
+    path = os.path.join(tempfile.mkdtemp(), "cluster.db")
+    db = DB(path); await db.raw(migrations.migrate); await seed(db, CATS, BIG, 5)
+    # листаемые категории — по HOT/4 товаров; остальное — в категории, которую никто не открывает
+    await db.execute("UPDATE products SET category='Склад' WHERE id>?", (HOT,)); db.close()
+    print(f"ядер: {os.cpu_count()}, пользователей: {a.users} × {a.updates} апдейтов, каталог {BIG*5} вкусов")
+    for i, n in enumerate(map(int, a.workers.split(","))):
+        await run(n, base, path, fake, ans, a, 10**6*(i+1))
+    await fake.stop()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("users", nargs="?", type=int, default=200)
+    ap.add_argument("--updates", type=int, default=8)
+    ap.add_argument("--workers", default="1,2,4")
+    asyncio.run(main(ap.parse_args()))
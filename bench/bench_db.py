@@ -0,0 +1,71 @@
+"""
+p99 задержки «хендлера» при конкурентных апдейтах: старый синхронный
+sqlite3 в event loop против асинхронного db.DB.
+
+Апдейты приходят с постоянной частотой; задержка = ответ − приход.
+Отдельно меряется лаг event loop — сколько ждёт «чужой» лёгкий хендлер.
+
+    python bench/bench_db.py [апдейтов] [апд/с]
+"""
+import asyncio, os, sqlite3, statistics, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import DB
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS flavours(id INTEGER PRIMARY KEY, product_id INT, name TEXT, price REAL, stock INT);
+CREATE TABLE IF NOT EXISTS carts(user_id INT, flavour_id INT, qty INT, PRIMARY KEY(user_id,flavour_id));
+"""
+UPSERT = """INSERT INTO carts VALUES(?,?,1)
+            ON CONFLICT(user_id,flavour_id) DO UPDATE SET qty=qty+1"""
+READ   = "SELECT id,name,price,stock FROM flavours WHERE product_id=?"
+
+def seed(path):
+    con = sqlite3.connect(path); con.executescript(SCHEMA)
+    con.executemany("INSERT INTO flavours VALUES(?,?,?,?,?)",
+                    [(i, i%50, f"f{i}", 100, 10) for i in range(5000)])
+    con.commit(); con.close()
+
+def pct(xs, p): xs = sorted(xs); return xs[min(len(xs)-1, int(len(xs)*p))]*1000
+
+async def run(handler, n, rate):
+    lat, lag, done = [], [], False
+    async def one(i, t):
+        await handler(i); lat.append(time.perf_counter()-t)
+    async def probe():
+        while not done:
+            t = time.perf_counter(); await asyncio.sleep(0.001)
+            lag.append(time.perf_counter()-t-0.001)
+    p, tasks, t0 = asyncio.create_task(probe()), [], time.perf_counter()
+    for i in range(n):
+        due = t0 + i/rate
+        if (w := due-time.perf_counter()) > 0: await asyncio.sleep(w)
+        tasks.append(asyncio.create_task(one(i, due)))
+    await asyncio.gather(*tasks); done = True; await p
+    return lat, lag
+
+async def main(n, rate):
+    d = tempfile.mkdtemp()
+    old, new = os.path.join(d, "old.db"), os.path.join(d, "new.db")
+    seed(old); seed(new)
+
+    con = sqlite3.connect(old, check_same_thread=False); cur = con.cursor()
+    async def sync_handler(i):
+        cur.execute(READ, (i%50,)); cur.fetchall()
+        cur.execute(UPSERT, (i%997, i%5000)); con.commit()
+        await asyncio.sleep(0)                       # «ответ» в Telegram
+
+    db = DB(new)
+    async def async_handler(i):
+        await db.fetchall(READ, (i%50,))
+        await db.execute(UPSERT, (i%997, i%5000))
+        await asyncio.sleep(0)
+
+    for name, h in (("sqlite3 в loop", sync_handler), ("db.DB", async_handler)):
+        lat, lag = await run(h, n, rate)
+        print(f"{name:15} p50={pct(lat,.5):7.2f}мс p99={pct(lat,.99):7.2f}мс "
+              f"mean={statistics.mean(lat)*1000:6.2f}мс | лаг loop p99={pct(lag,.99):6.2f}мс")
+    db.close(); con.close()
+
+if __name__ == "__main__":
+    a = sys.argv[1:]
+    asyncio.run(main(int(a[0]) if a else 2000, int(a[1]) if len(a)>1 else 500))
@@ -0,0 +1,149 @@
+"""
+Мастера: движок flows.py против рукописного FSM, который он заменил
+(«Добавить» на Add.* со step%2 в loop — копия ниже). Настоящий
+Dispatcher и fsm_storage.SQLiteStorage; ответы бота в сеть не уходят
+(Message/CallbackQuery.answer подменены), сохранение товара выключено — меряется сам
+шаг мастера: мкс на шаг и обращений к хранилищу на шаг. Плюс загрузка,
+проверка и компиляция всех *_flow.json.
+
+    python bench/bench_flow.py [мастеров]
+"""
+import asyncio, os, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from aiogram import Bot, Dispatcher, types
+from aiogram.dispatcher import FSMContext
+from aiogram.dispatcher.filters.state import State, StatesGroup
+from callbacks import Router, FW
+from db import DB
+from fsm_storage import SQLiteStorage
+import flows, migrations
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+CATS = ['Одноразовые системы', 'Многоразовые системы', 'Жидкости', 'Разное']
+
+
+# ── как было: мастер «Добавить» до flows.py (с одним вкусом, без записи в базу);
+#    в оригинале step%2: после цены шаг 2 снова попадал в «имя», и количество
+#    становилось новым вкусом — здесь step%3, обращения к хранилищу те же ──
+class Add(StatesGroup):
+    cat=State(); name=State(); desc=State(); flav_cnt=State(); flav_loop=State()
+
+def to_int(text): return text.isdigit() and int(text)
+
+def legacy(dp):
+    @dp.message_handler(text="➕ Добавить", state="*")
+    async def add_cat(m,state:FSMContext):
+        await m.answer("Категория:"); await Add.cat.set()
+
+    @dp.message_handler(state=Add.cat)
+    async def add_name(m,state:FSMContext):
+        if m.text not in CATS: return await m.answer("Кнопка!")
+        await state.update_data(cat=m.text)
+        await m.answer("Название:"); await Add.next()
+
+    @dp.message_handler(state=Add.name)
+    async def add_desc(m,state:FSMContext):
+        await state.update_data(name=m.text); await m.answer("Описание:"); await Add.next()
+
+    @dp.message_handler(state=Add.desc)
+    async def add_cnt(m,state:FSMContext):
+        await state.update_data(desc=m.text); await m.answer("Сколько вкусов? (0 — без вкуса)"); await Add.next()
+
+    @dp.message_handler(state=Add.flav_cnt)
+    async def cnt_ok(m,state:FSMContext):
+        if not to_int(m.text): return await m.answer("Число!")
+        await state.update_data(total=int(m.text),step=0,fl=[])
+        await m.answer("Вкус №1:"); await Add.flav_loop.set()
+
+    @dp.message_handler(state=Add.flav_loop)
+    async def loop(m,state:FSMContext):
+        d=await state.get_data(); step=d["step"]; fl=d["fl"]; total=d["total"]
+        if step%3==0:
+            fl.append({"name":m.text}); d.update(fl=fl,step=step+1)
+            await state.update_data(**d); await m.answer("Цена,₽:")
+        elif step%3==1:
+            if not to_int(m.text): return await m.answer("Введите число.")
+            fl[-1]["price"]=int(m.text); d.update(step=step+1)
+            await state.update_data(**d); await m.answer("Количество:")
+        else:
+            if not to_int(m.text): return await m.answer("Введите число.")
+            fl[-1]["qty"]=int(m.text); d.update(step=step+1)
+            await state.update_data(**d)
+            if len(fl)==total: await state.get_data(); await state.finish()
+            else: await m.answer(f"Вкус №{len(fl)+1}:")
+
+LEGACY = ["➕ Добавить", "Одноразовые системы", "Elf Bar", "описание", "1", "мята", "450", "7"]
+
+
+# ── сейчас: add_product_flow.json через flows.Engine ──
+def engine(dp, buttons):
+    async def exists(key, value, d): return None
+    async def done(m, uid, d): pass
+    wizard = flows.Engine(flows.load_all(ROOT), FW, {"check_existing": exists})
+    wizard.bind("add_product", done)
+    @dp.message_handler(text="➕ Добавить", state="*")
+    async def add_cat(m,state:FSMContext): await wizard.start("add_product", m, state)
+    @dp.message_handler(state=wizard.states)
+    async def flow_step(m,state:FSMContext,raw_state): await wizard.message(m, state, raw_state)
+    route = Router()
+    @route(FW)
+    async def flow_button(c,d):
+        await wizard.callback(c, d, dp.current_state(chat=c.message.chat.id, user=c.from_user.id))
+    dp.callback_query_handler(state="*")(route.dispatch)
+    b = lambda k, v: ("cb", wizard.button("add_product", k, v)) if buttons else \
+                     wizard.flows["add_product"].label(k, v)
+    return ["➕ Добавить", b("cat", "Одноразовые системы"), "Elf Bar", "мята", "450", "7", "описание", b("ok", True)]
+
+
+def update(uid, i, x):
+    user = {"id": uid, "is_bot": False, "first_name": "a"}
+    msg = {"message_id": i, "date": 0, "chat": {"id": uid, "type": "private"}, "from": user, "text": "…"}
+    if isinstance(x, tuple):
+        return types.Update(update_id=i, callback_query={"id": str(i), "chat_instance": "1", "data": x[1],
+                                                          "from": user, "message": msg})
+    return types.Update(update_id=i, message={**msg, "text": x})
+
+
+class Counted(SQLiteStorage):
+    """Обращения к хранилищу: чтения состояния/данных и записи."""
+    n = {"read": 0, "write": 0}
+    async def get_state(self, **kw):   self.n["read"] += 1;  return await super().get_state(**kw)
+    async def get_data(self, **kw):    self.n["read"] += 1;  return await super().get_data(**kw)
+    async def set_state(self, **kw):   self.n["write"] += 1; return await super().set_state(**kw)
+    async def set_data(self, **kw):    self.n["write"] += 1; return await super().set_data(**kw)
+    async def update_data(self, **kw): self.n["write"] += 1; return await super().update_data(**kw)
+
+
+async def run(name, setup, users):
+    db = DB(os.path.join(tempfile.mkdtemp(), "flow.db")); await db.raw(migrations.migrate)
+    bot = Bot("123456:BENCH"); st = Counted(db)
+    dp = Dispatcher(bot, storage=st); steps = setup(dp)
+    Bot.set_current(bot); Dispatcher.set_current(dp)
+    ups = [[update(u, k, x) for k, x in enumerate(steps)] for u in range(1, users+1)]
+    # апдейт — в своей задаче, как при polling: StateFilter кеширует состояние в contextvar
+    for u in ups[:50]:                                  # прогрев
+        for x in u: await asyncio.create_task(dp.process_update(x))
+    Counted.n.update(read=0, write=0)
+    t = time.perf_counter()
+    for u in ups[50:]:
+        for x in u: await asyncio.create_task(dp.process_update(x))
+    dt = time.perf_counter()-t; n = (users-50)*len(steps)
+    assert await st.get_state(chat=users, user=users) is None, "мастер не дошёл до конца"
+    print(f"{name:34} {dt/n*1e6:7.1f} мкс/шаг   чтений {Counted.n['read']/n:4.2f}  записей {Counted.n['write']/n:4.2f} на шаг")
+    await st.close(); db.close(); await (await bot.get_session()).close()
+
+
+async def main(users):
+    async def quiet(self, *a, **kw): pass
+    types.Message.answer = types.CallbackQuery.answer = quiet
+
+    t = time.perf_counter()
+    for _ in range(100): fl = flows.load_all(ROOT)
+    print(f"загрузка и проверка {len(fl)} *_flow.json: {(time.perf_counter()-t)*10:.2f} мс "
+          f"({sum(len(f.steps) for f in fl.values())} шагов)")
+    await run("рукописный FSM (Add.*)", lambda dp: (legacy(dp), LEGACY)[1], users)
+    await run("flows.Engine, ответы текстом", lambda dp: engine(dp, False), users)
+    await run("flows.Engine, выбор кнопками", lambda dp: engine(dp, True), users)
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000))
@@ -0,0 +1,55 @@
+"""
+FSM-хранилища: MemoryStorage против fsm_storage.SQLiteStorage.
+
+Прогон мастера «Добавить» (шаги set_state/update_data/get_data, как в
+loop) для множества админов-«пользователей»: шагов/с, коммитов в базу,
+память под брошенные состояния (tracemalloc).
+
+    python bench/bench_fsm.py [пользователей] [шагов]
+"""
+import asyncio, os, sys, tempfile, time, tracemalloc
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from db import DB
+from fsm_storage import SQLiteStorage
+import migrations
+
+async def wizard(st, uid, steps):
+    await st.set_state(chat=uid, user=uid, state="Add:flav_loop")
+    await st.update_data(chat=uid, user=uid, data={"total": steps, "step": 0, "fl": []})
+    for i in range(steps):
+        d = await st.get_data(chat=uid, user=uid)
+        d["fl"].append({"name": f"f{i}", "price": 100, "qty": 5}); d["step"] += 1
+        await st.update_data(chat=uid, user=uid, data=d)
+
+async def run(name, st, users, steps):
+    tracemalloc.start(); t = time.perf_counter()
+    await asyncio.gather(*(wizard(st, u, steps) for u in range(users)))
+    if isinstance(st, SQLiteStorage): await st.flush()
+    dt = time.perf_counter()-t
+    mem = tracemalloc.get_traced_memory()[0]; tracemalloc.stop()
+    print(f"{name:22} {users*steps/dt:9.0f} шагов/с   память {mem/2**20:6.1f} МиБ")
+
+async def main(users, steps):
+    await run("MemoryStorage", MemoryStorage(), users, steps)
+
+    db = DB(os.path.join(tempfile.mkdtemp(), "fsm.db")); await db.raw(migrations.migrate)
+    commits = 0; tx = db.tx
+    async def counted(fn):
+        nonlocal commits; commits += 1; return await tx(fn)
+    db.tx = counted
+    st = SQLiteStorage(db, cache_size=1000)
+    await run("SQLiteStorage (LRU 1k)", st, users, steps)
+    rows, = await db.fetchone("SELECT COUNT(*) FROM fsm")
+    print(f"  коммитов {commits} на {users*steps} шагов, в базе {rows} состояний, в памяти {len(st.lru)}")
+
+    st2 = SQLiteStorage(db)                       # «рестарт»: состояние читается из базы
+    assert await st2.get_state(chat=0, user=0) == "Add:flav_loop"
+    assert len((await st2.get_data(chat=0, user=0))["fl"]) == steps
+    st3 = SQLiteStorage(db, ttl=0)                # TTL: всё протухло
+    assert await st3.get_state(chat=0, user=0) is None
+    db.close()
+
+if __name__ == "__main__":
+    a = [int(x) for x in sys.argv[1:]]
+    asyncio.run(main(*(a + [2000, 12][len(a):])))
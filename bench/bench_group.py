@@ -0,0 +1,41 @@
+"""
+Group commit: N пользователей одновременно тапают «в корзину» (upsert).
+Каждая запись своей транзакцией (db.execute) против db.group — сколько
+тапов в секунду проходит и сколько коммитов на это уходит. Для честности
+прогон идёт и с synchronous=FULL (fsync на каждый коммит).
+
+    python bench/bench_group.py [пользователей] [тапов на пользователя]
+"""
+import asyncio, os, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import DB
+import migrations
+
+UPSERT = """INSERT INTO carts(user_id,flavour_id,qty) VALUES(?,?,1)
+            ON CONFLICT(user_id,flavour_id) DO UPDATE SET qty=qty+excluded.qty"""
+
+async def run(mode, users, taps, sync):
+    db = DB(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    await db.raw(migrations.migrate)
+    await db.raw(lambda con: con.execute(f"PRAGMA synchronous={sync}"))
+    await db.executemany("INSERT INTO flavours(id,name,price,stock) VALUES(?,?,100,100)", [(i, f"f{i}") for i in range(1, 11)])
+    write = db.execute if mode == "execute" else db.group
+    async def user(uid):
+        for i in range(taps): await write(UPSERT, (uid, 1+i%10))
+    tx0 = db.stats["tx"]; t = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(users)))
+    dt = time.perf_counter()-t; tx = db.stats["tx"]-tx0
+    n, = await db.fetchone("SELECT SUM(qty) FROM carts")
+    assert n == users*taps, (n, users*taps)
+    print(f"{sync:<6} {mode:<8} {users*taps/dt:>9.0f} тапов/с {tx/dt:>8.0f} коммитов/с "
+          f"({users*taps/tx:5.1f} тапов на коммит)")
+    db.close()
+
+async def main(users, taps):
+    print(f"{users} пользователей × {taps} тапов")
+    for sync in ("NORMAL", "FULL"):
+        for mode in ("execute", "group"): await run(mode, users, taps, sync)
+
+if __name__ == "__main__":
+    a = [int(x) for x in sys.argv[1:]]
+    asyncio.run(main(*(a + [500, 20][len(a):])))
@@ -0,0 +1,87 @@
+"""
+Импорт каталога на 100k строк (20k товаров × 5 вкусов) через bulk.py:
+
+• первая загрузка в пустую базу и повторная с изменениями (30 % цен,
+  30 % «+N» прихода) — разбор, превью (diff), применение одной транзакцией;
+• для сравнения — те же изменения остатков по одному UPDATE-коммиту,
+  как в «✏️ Остаток» (на выборке, с пересчётом на весь файл);
+• пока идёт применение, читатель листает карточки — WAL его не держит;
+• выгрузка CSV/JSON и обратная загрузка — diff пустой.
+
+    python bench/bench_import.py [строк]
+"""
+import asyncio, io, os, random, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import DB
+import bulk, migrations
+
+CATS = ["Одноразовые системы", "Многоразовые системы", "Жидкости", "Разное"]
+FLAVOURS = 5
+
+
+def make_csv(n, change=False):
+    out = io.StringIO(); out.write(",".join(bulk.FIELDS)+"\n")
+    rnd = random.Random(1)
+    for i in range(n):
+        p, f = divmod(i, FLAVOURS)
+        price, stock = 100+p%40*10, str(i%25)
+        if change:
+            r = rnd.random()
+            if r < .3: price += 10
+            elif r < .6: stock = f"+{1+i%5}"
+        out.write(f"{CATS[p%4]},Товар {p},\"Описание, {p}\",вкус {f},{price},{stock}\n")
+    return out.getvalue().encode()
+
+
+def read(data):
+    return bulk.read(io.BufferedReader(io.BytesIO(data)), CATS)
+
+
+async def load(db, data, label):
+    t = time.perf_counter(); prods, flavs, err = await asyncio.to_thread(read, data); t_read = time.perf_counter()-t
+    assert not err, err[:3]
+    t = time.perf_counter(); plan = await db.read(lambda con: bulk.diff(con, prods, flavs)); t_diff = time.perf_counter()-t
+    # параллельно с применением — читатель открывает карточки
+    lat, stop = [], asyncio.Event()
+    async def reader():
+        while not stop.is_set():
+            t1 = time.perf_counter()
+            await db.fetchall("SELECT id,name,price,stock FROM flavours WHERE product_id=?", (random.randint(1, 20000),))
+            lat.append((time.perf_counter()-t1)*1000); await asyncio.sleep(0)
+    rt = asyncio.create_task(reader())
+    lock0 = db.stats["lock_max"]
+    t = time.perf_counter(); plan = await db.tx(lambda con: bulk.apply(con, prods, flavs)); t_apply = time.perf_counter()-t
+    stop.set(); await rt; lat.sort()
+    print(f"{label}: {len(data)/1e6:.1f} МБ, {len(flavs)} вкусов — разбор {t_read:.2f}с, превью {t_diff:.2f}с, "
+          f"применение {t_apply:.2f}с (1 коммит)\n   {plan.summary().replace(chr(10), '; ')}\n"
+          f"   читатель во время применения: {len(lat)} запросов, p99={lat[int(len(lat)*.99)] if lat else 0:.1f}мс")
+    return plan
+
+
+async def main(n):
+    db = DB(os.path.join(tempfile.mkdtemp(), "bench.db")); await db.raw(migrations.migrate)
+    await load(db, make_csv(n), "первая загрузка")
+    plan = await load(db, make_csv(n, change=True), "поставка")
+
+    # то же по одному коммиту на строку, как «✏️ Остаток»
+    sample = plan.upd_flavours[:2000]
+    t = time.perf_counter()
+    for price, stock, fid in sample: await db.execute("UPDATE flavours SET price=?, stock=? WHERE id=?", (price, stock, fid))
+    per = (time.perf_counter()-t)/len(sample)
+    print(f"по одному коммиту: {per*1000:.2f}мс на строку → {per*len(plan.upd_flavours):.1f}с на "
+          f"{len(plan.upd_flavours)} изменений (без учёта переписки с админом)")
+
+    for fmt in ("csv", "json"):
+        path = os.path.join(tempfile.mkdtemp(), "catalog."+fmt)
+        t = time.perf_counter()
+        with open(path, "w", encoding="utf-8", newline="") as out: rows = await db.read(lambda con: bulk.export(con, out, fmt))
+        t_exp = time.perf_counter()-t
+        with open(path, "rb") as f: prods, flavs, err = bulk.read(f, CATS)
+        again = await db.read(lambda con: bulk.diff(con, prods, flavs))
+        print(f"выгрузка {fmt}: {rows} строк за {t_exp:.2f}с ({os.path.getsize(path)/1e6:.1f} МБ); "
+              f"загрузка обратно — изменений: {'есть!' if again else 'нет'}")
+        assert not err and not again
+    db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
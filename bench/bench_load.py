@@ -0,0 +1,158 @@
+"""
+Нагрузочный прогон bot.py целиком: настоящий Dispatcher, long polling,
+фейковый Bot API (сети нет). Сценарии — синтетические потоки апдейтов:
+
+• browse   — каталог → категория → товар → вкус, пользователи параллельно;
+• add_cart — всплеск «в корзину» от всех сразу;
+• checkout — одновременное оформление корзин: мастер order_flow.json
+  (да → картой → самовывоз → подтвердить);
+• ord_set  — админ гоняет статусы заказов.
+
+Для каждого сценария: p50/p95/p99 по хендлерам (включая роуты callback'ов),
+апдейтов в секунду и ожидания писателя SQLite (DB.stats). Результат —
+JSON (по умолчанию bench/results/<commit>.json); с --compare старый
+файл печатается рядом, чтобы регресс между коммитами было видно сразу.
+
+    python bench/bench_load.py [пользователей] [--out f.json] [--compare old.json]
+"""
+import argparse, asyncio, json, logging, os, platform, random, subprocess, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from fake_tg import FakeTelegram
+
+ADMIN = 1
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def pct(xs, p): xs = sorted(xs); return round(xs[min(len(xs)-1, int(len(xs)*p))]*1000, 3)
+
+def commit():
+    try: return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, text=True).strip()
+    except Exception: return "nogit"
+
+
+class Probe:
+    """Время хендлеров и завершение апдейтов; хендлеры подменяются на обёртки
+    (spec у HandlerObj остаётся прежним — aiogram отдаёт им те же аргументы)."""
+    def __init__(self, bot):
+        self.t, self.done = {}, {}
+        dp = bot.dp
+        for handler in (dp.message_handlers, dp.callback_query_handlers):
+            for obj in handler.handlers:
+                if obj.handler is not bot.on_callback: obj.handler = self.timed(obj.handler)
+        for prefix, (cb, fn, admin) in bot.route.routes.items():
+            bot.route.routes[prefix] = (cb, self.timed(fn), admin)
+        upd = dp.updates_handler.handlers[0]
+        upd.handler = self.finished(upd.handler)
+
+    def timed(self, fn):
+        name, lat = fn.__name__, self.t
+        async def wrap(*a, **kw):
+            t = time.perf_counter()
+            try: return await fn(*a, **kw)
+            finally: lat.setdefault(name, []).append(time.perf_counter()-t)
+        wrap.__name__ = name
+        return wrap
+
+    def finished(self, fn):
+        async def wrap(update, **kw):
+            try: return await fn(update, **kw)
+            finally:
+                if f := self.done.pop(update.update_id, None): f.set_result(None)
+        return wrap
+
+    async def send(self, fake, update):
+        f = self.done[update["update_id"]] = asyncio.get_running_loop().create_future()
+        await fake.push(update); await f
+
+
+async def seed(db, cats, products, flavours):
+    await db.executemany("INSERT INTO products(id,name,description,category) VALUES(?,?,?,?)",
+        [(p, f"prod{p}", "…", cats[p % len(cats)]) for p in range(1, products+1)])
+    await db.executemany("INSERT INTO flavours(product_id,name,price,stock) VALUES(?,?,?,?)",
+        [(p, f"f{p}-{i}", 100+i*50, 10**6) for p in range(1, products+1) for i in range(flavours)])
+
+
+async def run(name, bot, probe, fake, flows):
+    """flows — по списку апдейтов на пользователя: внутри — по очереди, между — параллельно."""
+    probe.t.clear()
+    s0 = dict(bot.db.stats)
+    n = sum(map(len, flows))
+    async def user(ups):
+        for u in ups: await probe.send(fake, u)
+    t = time.perf_counter()
+    await asyncio.gather(*map(user, flows))
+    dt = time.perf_counter()-t
+    s = bot.db.stats; tx = s["tx"]-s0["tx"]
+    res = {"updates": n, "seconds": round(dt, 3), "ups": round(n/dt, 1),
+           "db": {"tx": tx, "wait_ms": round((s["wait"]-s0["wait"])*1000, 1),
+                  "lock_ms": round((s["lock"]-s0["lock"])*1000, 1),
+                  "wait_avg_ms": round((s["wait"]-s0["wait"])/tx*1000, 3) if tx else 0},
+           "handlers": {h: {"n": len(v), "p50": pct(v, .5), "p95": pct(v, .95), "p99": pct(v, .99)}
+                        for h, v in sorted(probe.t.items())}}
+    print(f"\n{name}: {n} апдейтов за {dt:.2f}с — {res['ups']:.0f}/с; "
+          f"писатель: {tx} tx, ожидание {res['db']['wait_ms']:.0f}мс (lock {res['db']['lock_ms']:.0f}мс)")
+    for h, v in res["handlers"].items():
+        print(f"  {h:<16} n={v['n']:<6} p50={v['p50']:7.2f} p95={v['p95']:7.2f} p99={v['p99']:7.2f} мс")
+    return res
+
+
+async def main(a):
+    fake = FakeTelegram(); base = await fake.start()
+    os.environ.update(BOT_TOKEN="123456:BENCH", BOT_API_URL=base, ADMINS=str(ADMIN),
+                      DB_PATH=os.path.join(tempfile.mkdtemp(), "load.db"), RESERVE_MIN="60")
+    import bot
+    logging.getLogger().setLevel(logging.WARNING)
+    await bot.migrate()
+    await seed(bot.db, bot.CATS, a.products, 5)
+    fids = [f for f, in await bot.db.fetchall("SELECT id FROM flavours")]
+    probe, rnd = Probe(bot), random.Random(1)
+    poll = asyncio.create_task(bot.dp.start_polling(timeout=20, relax=0))
+    users = range(1000, 1000+a.users)
+
+    def browse(u):
+        p = rnd.randint(1, a.products)
+        return [fake.message(u, "/start"), fake.message(u, "🛍 Каталог"),
+                fake.callback(u, bot.CAT(bot.CATS[p % len(bot.CATS)])), fake.callback(u, bot.PRD(p)),
+                fake.callback(u, bot.FLV(rnd.choice(fids)))]
+    out = {"commit": commit(), "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+           "python": platform.python_version(), "users": a.users, "scenarios": {}}
+    sc = out["scenarios"]
+    sc["browse"]   = await run("browse", bot, probe, fake, [browse(u) for u in users])
+    sc["add_cart"] = await run("add_cart", bot, probe, fake,
+        [[fake.callback(u, bot.QTY(f, rnd.randint(1, 3)))] for u in users for f in rnd.sample(fids, 3)])
+    order = [("go", True), ("pay", "card"), ("delivery", "pickup"), ("ok", True)]
+    sc["checkout"] = await run("checkout", bot, probe, fake,
+        [[fake.callback(u, bot.CART("buy"))]+[fake.callback(u, bot.wizard.button("order", k, v)) for k, v in order]
+         for u in users])
+    oids = [o for o, in await bot.db.fetchall("SELECT id FROM orders")]
+    sc["ord_set"]  = await run("ord_set", bot, probe, fake,
+        [[fake.callback(ADMIN, bot.ORD(o)), fake.callback(ADMIN, bot.SET(o, st))]
+         for o, st in zip(oids, rnd.choices(("paid", "done", "cancel"), k=len(oids)))])
+
+    bot.dp.stop_polling(); await bot.dp.wait_closed(); poll.cancel()
+    await bot.on_shutdown(bot.dp); await fake.stop(); await (await bot.bot.get_session()).close()
+
+    path = a.out or os.path.join(HERE, "results", f"{out['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f: json.dump(out, f, ensure_ascii=False, indent=1)
+    print(f"\n→ {path}")
+    if a.compare: compare(json.load(open(a.compare)), out)
+
+
+def compare(old, new):
+    print(f"\nсравнение {old['commit']} → {new['commit']} (p95, мс; ups):")
+    for name, s in new["scenarios"].items():
+        o = old["scenarios"].get(name)
+        if not o: continue
+        print(f"  {name:<10} ups {o['ups']:>8.0f} → {s['ups']:<8.0f} ({(s['ups']/o['ups']-1)*100:+.0f}%)")
+        for h, v in s["handlers"].items():
+            if (w := o["handlers"].get(h)) and w["p95"]:
+                print(f"    {h:<16} {w['p95']:7.2f} → {v['p95']:<7.2f} ({(v['p95']/w['p95']-1)*100:+.0f}%)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("users", nargs="?", type=int, default=300)
+    ap.add_argument("--products", type=int, default=200)
+    ap.add_argument("--out"); ap.add_argument("--compare")
+    asyncio.run(main(ap.parse_args()))
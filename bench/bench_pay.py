@@ -0,0 +1,54 @@
+"""
+Задержка выставления TON-счёта: новая ClientSession на каждый заказ
+(как было) против долгоживущего payments.TonPay, на фейковом провайдере.
+Второй прогон — с 20 % ответов 503 и 5 % обрывов: считает, сколько
+счетов создано на самом деле (дублей быть не должно).
+
+    python bench/bench_pay.py [заказов] [параллельно]
+"""
+import asyncio, json, logging, os, sys, time
+import aiohttp
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from payments import TonPay, PayError
+from fake_wallet import FakeWallet
+
+logging.getLogger("payments").setLevel(logging.ERROR)
+
+def pct(xs, p): xs = sorted(xs); return xs[min(len(xs)-1, int(len(xs)*p))]*1000
+
+async def timed(fn, n, par):
+    sem, lat = asyncio.Semaphore(par), []
+    async def one(i):
+        async with sem:
+            t = time.perf_counter(); await fn(i); lat.append(time.perf_counter()-t)
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return f"p50={pct(lat,.5):6.2f}мс p99={pct(lat,.99):6.2f}мс"
+
+async def main(n, par):
+    fw = FakeWallet(delay=0.002); url = await fw.start()
+
+    async def fresh(i):                                  # старый send_invoice_ton
+        async with aiohttp.ClientSession() as cs:
+            async with cs.post(url, data=json.dumps({"amount": "1.00"}),
+                               headers={"Content-Type": "application/json"}) as r:
+                (await r.json())["invoice_url"]
+    print("сессия на заказ ", await timed(fresh, n, par))
+
+    pay = TonPay("t", url=url)
+    print("TonPay (пул)    ", await timed(lambda i: pay.create_invoice(i, 1.0, "cb"), n, par))
+    await pay.close(); await fw.stop()
+
+    fw = FakeWallet(fail=0.2, drop=0.05); pay = TonPay("t", url=await fw.start(), backoff=0.01, retries=5)
+    failed = 0
+    async def flaky(i):
+        nonlocal failed
+        try: await pay.create_invoice(10_000+i, 1.0, "cb")
+        except PayError: failed += 1
+    print("с отказами      ", await timed(flaky, n, par),
+          f"| запросов {fw.requests}, счетов {len(fw.invoices)} на {n} заказов, неудач {failed}")
+    assert len(fw.invoices) <= n
+    await pay.close(); await fw.stop()
+
+if __name__ == "__main__":
+    a = [int(x) for x in sys.argv[1:]]
+    asyncio.run(main(*(a + [500, 20][len(a):])))
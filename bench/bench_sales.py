@@ -0,0 +1,95 @@
+"""
+«📊 Статистика» на истории в N заказов (по умолчанию 1M, ~2 года, 2 позиции
+в заказе, 2000 вкусов): фоновый досчёт агрегатов, время отчёта по
+агрегатам против того же отчёта прямым JOIN по orders/order_items, и
+сверка: агрегаты, которые вели checkout/ord_set/оплата, совпадают с
+пересчётом с нуля.
+
+    python bench/bench_sales.py [заказов]
+"""
+import asyncio, os, random, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import DB
+import migrations, sales, shop
+from callbacks import PERIODS as sales_periods
+
+FLAVOURS, DAYS = 2000, 730
+
+NAIVE = ["""SELECT status,COUNT(*),SUM(total-discount) FROM orders WHERE created>=? GROUP BY status""",
+         """SELECT pay_method,COUNT(*),SUM(total),SUM(discount) FROM orders
+            WHERE created>=? AND status<>'cancel' GROUP BY pay_method""",
+         """SELECT oi.flavour_id,SUM(oi.qty) u FROM orders o JOIN order_items oi ON oi.order_id=o.id
+            WHERE o.created>=? AND o.status<>'cancel' GROUP BY oi.flavour_id ORDER BY u DESC LIMIT 10"""]
+
+
+def history(con, n):
+    con.execute("BEGIN")
+    con.execute("INSERT INTO products(id,name,description,category) VALUES(1,'Pod','…','Жидкости')")
+    con.executemany("INSERT INTO flavours(id,product_id,name,price,stock) VALUES(?,1,?,?,1000000)",
+                    [(i, f"f{i}", 100+i%50*10) for i in range(1, FLAVOURS+1)])
+    con.execute(f"""WITH RECURSIVE s(i) AS (SELECT 1 UNION ALL SELECT i+1 FROM s WHERE i<{n})
+                    INSERT INTO orders(id,user_id,created,total,pay_method,discount,status)
+                    SELECT i, i%50000, datetime('now', '-'||(i*{DAYS}/{n})||' days', '-'||(i%86400)||' seconds'),
+                           0, CASE WHEN i%3 THEN 'card' ELSE 'ton' END, 0,
+                           CASE i%10 WHEN 0 THEN 'cancel' WHEN 1 THEN 'pending' WHEN 2 THEN 'paid' ELSE 'done' END
+                    FROM s""")
+    con.execute(f"""INSERT INTO order_items(order_id,flavour_id,qty,price)
+                    SELECT o.id, 1+(o.id*7+k)%{FLAVOURS}, 1+(o.id+k)%3, f.price FROM orders o
+                    JOIN (SELECT 0 k UNION ALL SELECT 1) JOIN flavours f ON f.id=1+(o.id*7+k)%{FLAVOURS}""")
+    con.execute("""UPDATE orders SET total=(SELECT SUM(qty*price) FROM order_items WHERE order_id=orders.id),
+                   discount=CASE pay_method WHEN 'ton' THEN 10 ELSE 0 END""")
+    con.execute("COMMIT")
+
+
+async def timed(fn, reps=20):
+    t = time.perf_counter()
+    for _ in range(reps): await fn()
+    return (time.perf_counter()-t)/reps*1000
+
+
+def snapshot(con):
+    return (con.execute("SELECT * FROM sales_day WHERE orders<>0 ORDER BY 1,2,3").fetchall(),
+            con.execute("SELECT * FROM sales_flavour WHERE units<>0 ORDER BY 1,2").fetchall())
+
+
+async def main(n):
+    db = DB(os.path.join(tempfile.mkdtemp(), "bench.db"))
+    def v6(con):                                        # база «до» агрегатов
+        for v, step in enumerate(migrations.MIGRATIONS[:6], 1):
+            step(con); con.execute(f"PRAGMA user_version={v}")
+    await db.raw(v6)
+    t = time.perf_counter(); await db.raw(lambda con: history(con, n))
+    print(f"история: {n} заказов за {time.perf_counter()-t:.1f}с")
+
+    # миграция v7 на живой базе + фоновый досчёт; тем временем идут новые заказы
+    await db.raw(migrations.migrate)
+    t = time.perf_counter(); bf = asyncio.create_task(sales.backfill(db))
+    lat = []
+    while not bf.done():
+        uid = 10**6+len(lat); t1 = time.perf_counter()
+        await db.execute("INSERT INTO carts(user_id,flavour_id,qty) VALUES(?,?,2)", (uid, 1+uid%FLAVOURS))
+        oid, *_ = await db.tx(lambda con: shop.place_order(con, uid, "card"))
+        await db.tx(lambda con: shop.set_status(con, oid, random.choice(("paid", "done", "cancel"))))
+        lat.append((time.perf_counter()-t1)*1000)
+    await bf
+    rows, = await db.fetchone("SELECT COUNT(*) FROM sales_day")
+    frows, = await db.fetchone("SELECT COUNT(*) FROM sales_flavour")
+    lat.sort()
+    print(f"досчёт: {time.perf_counter()-t:.1f}с, {rows} строк sales_day, {frows} строк sales_flavour; "
+          f"параллельно {len(lat)} заказов, корзина→заказ→статус p50={lat[len(lat)//2]:.1f}мс max={lat[-1]:.1f}мс")
+
+    for days in map(int, sales_periods):
+        since = (sales.today()-sales.dt.timedelta(days=days-1)).isoformat()
+        fast = await timed(lambda: sales.report(db, days))
+        slow = await timed(lambda: asyncio.gather(*(db.fetchall(q, (since,)) for q in NAIVE)), reps=3)
+        print(f"отчёт за {days:>3} дн.: агрегаты {fast:7.2f}мс, JOIN по истории {slow:8.1f}мс")
+
+    # инкрементальные агрегаты (с параллельными заказами) == пересчёт с нуля
+    kept = await db.raw(snapshot)
+    await db.tx(sales.rebuild)
+    assert kept == await db.raw(snapshot), "агрегаты разошлись с историей"
+    print("сверка с пересчётом: совпадает")
+    db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
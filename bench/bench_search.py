@@ -0,0 +1,99 @@
+"""
+Поиск (search.py, FTS5) по каталогу из 100k вкусов (20k товаров × 5):
+запросы разной ширины — точный товар, бренд, вкус, бренд+вкус, слово из
+описания (совпадает всё), двухбуквенный префикс, промах. Для каждого —
+p50/p99 search.find и для сравнения LIKE '%…%' по JOIN. Плюс цена
+триггеров: вставка вкусов и смена остатка с индексом и без, и пакетная
+вставка через search.deferred, как в импорте.
+
+    python bench/bench_search.py [вкусов]
+"""
+import asyncio, os, random, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import DB
+import migrations, search
+from bench_load import pct
+
+BRANDS = ["Elf Bar", "HQD", "Husky", "Brusko", "Geek Bar", "Lost Mary", "Vaporesso", "Smok", "Voopoo", "Pod Salt",
+          "Catswill", "Maxwells", "Jam Monster", "Rell", "Chaser", "Duall", "Ripe Vapes", "Zombie", "Boshki", "Bang"]
+WORDS = ["мята", "лёд", "клубника", "банан", "арбуз", "дыня", "манго", "персик", "вишня", "кола", "энергетик",
+         "черника", "малина", "виноград", "яблоко", "лимон", "лайм", "ананас", "киви", "кокос", "ваниль", "табак",
+         "карамель", "кофе", "грейпфрут", "смородина", "маракуйя", "гуава", "личи", "тархун"]
+QUERIES = {"товар":        "husky ultra 777",
+           "бренд":        "elf bar",
+           "вкус":         "маракуйя",
+           "бренд+вкус":   "geek мята лёд",
+           "описание":     "затяжек",
+           "префикс":      "кл",
+           "промах":       "пломбир"}
+LIKE = """SELECT f.id,p.name,f.name,f.price,f.stock FROM flavours f JOIN products p ON p.id=f.product_id
+          WHERE p.name||' '||f.name||' '||p.description LIKE ? LIMIT 20"""
+
+
+def seed(con, n):
+    rnd = random.Random(1)
+    con.execute("BEGIN")
+    con.executemany("INSERT INTO products(id,name,description,category) VALUES(?,?,?,'Жидкости')",
+                    [(p, f"{rnd.choice(BRANDS)} {rnd.choice(['Pro', 'Max', 'Mini', 'Ultra', ''])} {p}",
+                      f"Одноразовая система на {rnd.choice([600, 1500, 5000])} затяжек") for p in range(1, n//5+1)])
+    con.executemany("INSERT INTO flavours(product_id,name,price,stock) VALUES(?,?,?,?)",
+                    [(1+i//5, " ".join(rnd.sample(WORDS, 2)), 300+i%20*50, rnd.randint(0, 20)) for i in range(n)])
+    con.execute("COMMIT")
+
+
+def timed(fn, reps):
+    """→ (времена, с; последний результат)"""
+    out = []
+    for _ in range(reps):
+        t = time.perf_counter(); r = fn(); out.append(time.perf_counter()-t)
+    return out, r
+
+
+async def main(n):
+    db = DB(os.path.join(tempfile.mkdtemp(), "bench.db")); await db.raw(migrations.migrate)
+    t = time.perf_counter(); await db.raw(lambda con: seed(con, n))
+    print(f"{n} вкусов с индексом за {time.perf_counter()-t:.1f}с")
+    QUERIES["товар"] = (await db.fetchone("SELECT name FROM products WHERE id=?", (n//10,)))[0]
+
+    print(f"{'запрос':<12}{'':24}{'найдено':>8}{'p50':>9}{'p99':>9}   LIKE p50")
+    for label, q in QUERIES.items():
+        lat, rows = await db.read(lambda con: timed(lambda: search.find(con, q, 20), 500))
+        hits = await db.read(lambda con: con.execute(search.COUNT, (search.match(q), 10**9)).fetchone()[0])
+        like, _ = await db.read(lambda con: timed(lambda: con.execute(LIKE, (f"%{q}%",)).fetchall(), 3))
+        print(f"{label:<12}{q[:22]:24}{hits:>8}{pct(lat, .5):>7.2f}мс{pct(lat, .99):>7.2f}мс   {pct(like, .5):.1f}мс")
+        assert pct(lat, .99) < 10, (label, pct(lat, .99))
+
+    # через db.read, как в хендлере (с переходом в поток читателя), 8 параллельно
+    qs = list(QUERIES.values())
+    async def one(i):
+        t = time.perf_counter(); await db.read(lambda con: search.find(con, qs[i % len(qs)], 20))
+        return time.perf_counter()-t
+    lat = []
+    for _ in range(50): lat += await asyncio.gather(*(one(i) for i in range(8)))
+    print(f"db.read, 8 параллельно: p50={pct(lat, .5):.2f}мс p99={pct(lat, .99):.2f}мс")
+
+    # цена триггеров
+    for label, sql, args in (("смена остатка", "UPDATE flavours SET stock=stock+1 WHERE id=?", lambda i: (i,)),
+                             ("новый вкус", "INSERT INTO flavours(product_id,name,price,stock) VALUES(?,?,100,1)",
+                              lambda i: (1+i % (n//5), f"новинка {i}"))):
+        for fts in (True, False):
+            def run(con):
+                con.execute("BEGIN")
+                if not fts:
+                    for t in ("search_flv_ins", "search_flv_upd"): con.execute(f"DROP TRIGGER {t}")
+                t = time.perf_counter()
+                for i in range(1, 5001): con.execute(sql, args(i))
+                dt = time.perf_counter()-t; con.execute("ROLLBACK"); return dt
+            dt = await db.raw(run)
+            print(f"{label:<14} {'с индексом' if fts else 'без индекса':<12} {dt/5000*1e6:6.1f}мкс на строку")
+    def bulk_ins(con):                                  # как импорт в bulk.apply
+        con.execute("BEGIN"); t = time.perf_counter()
+        with search.deferred(con):
+            con.executemany("INSERT INTO flavours(product_id,name,price,stock) VALUES(?,?,100,1)",
+                            [(1+i % (n//5), f"новинка {i}") for i in range(1, 5001)])
+        dt = time.perf_counter()-t; con.execute("ROLLBACK"); return dt
+    print(f"{'новый вкус':<14} {'deferred':<12} {await db.raw(bulk_ins)/5000*1e6:6.1f}мкс на строку")
+    db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000))
@@ -0,0 +1,69 @@
+"""
+Злоупотребляющие клиенты против throttle.Throttle, на настоящем bot.py и
+фейковом Bot API:
+
+• долбёжка «qty» — 300 тапов разом от одного пользователя;
+• флуд сообщениями от одного, пока 100 обычных пользователей листают каталог;
+• 20k разовых пользователей — после sweep бакеты не копятся.
+
+Печатает, сколько дошло до хендлеров, и задержку обычных пользователей.
+Поведение (схлопывание двойного тапа, лимит на пользователя, админы без
+лимита) — tests/test_throttle.py.
+
+    python bench/bench_throttle.py
+"""
+import asyncio, logging, os, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from fake_tg import FakeTelegram
+from bench_load import Probe, seed, pct
+from throttle import Throttle
+
+ABUSER = 666
+
+
+async def main():
+    fake = FakeTelegram(); base = await fake.start()
+    os.environ.update(BOT_TOKEN="123456:BENCH", BOT_API_URL=base, ADMINS="1",
+                      DB_PATH=os.path.join(tempfile.mkdtemp(), "abuse.db"), RESERVE_MIN="0")
+    import bot
+    logging.getLogger().setLevel(logging.WARNING)
+    await bot.migrate(); await seed(bot.db, bot.CATS, 50, 3)
+    th = next(m for m in bot.dp.middleware.applications if isinstance(m, Throttle))
+    probe = Probe(bot)
+    poll = asyncio.create_task(bot.dp.start_polling(timeout=20, relax=0))
+    burst = lambda a: th._limit(a)[1]
+
+    # 1. долбёжка qty — все 300 тапов разом, часть одинаковых
+    t = time.perf_counter()
+    await asyncio.gather(*(probe.send(fake, fake.callback(ABUSER, bot.QTY(1+i%3, 1))) for i in range(300)))
+    qty, = await bot.db.fetchone("SELECT COALESCE(SUM(qty),0) FROM carts WHERE user_id=?", (ABUSER,))
+    ran = len(probe.t.get("add_cart", []))
+    print(f"qty ×300 за {(time.perf_counter()-t)*1000:.0f}мс: до add_cart дошло {ran}, в корзине {qty} шт; "
+          f"схлопнуто {th.stats['collapsed']}, отбито {th.stats['throttled']}")
+    assert ran <= burst("qty")+2, ran
+
+    # 2. флуд сообщениями на фоне обычных пользователей
+    probe.t.clear()
+    async def browse(uid):
+        for text in ("🛍 Каталог", "☎️ Поддержка", "🧺 Корзина"):
+            await probe.send(fake, fake.message(uid, text)); await asyncio.sleep(0.2)
+    t = time.perf_counter()
+    flood = asyncio.gather(*(probe.send(fake, fake.message(ABUSER, "☎️ Поддержка")) for _ in range(2000)))
+    await asyncio.gather(flood, *(browse(u) for u in range(2000, 2100)))
+    dt = time.perf_counter()-t
+    lat = probe.t["catalog"]+probe.t["cart_show"]
+    print(f"флуд 2000 сообщений за {dt:.1f}с: support выполнен {len(probe.t['support'])-100} раз для флудера; "
+          f"обычные пользователи p50={pct(lat,.5):.1f}мс p95={pct(lat,.95):.1f}мс")
+
+    # 3. вытеснение
+    small = Throttle({"*": (1000, 2)}, sweep=1)
+    for u in range(20_000): small.allow(u, "qty")
+    n = len(small.buckets); await asyncio.sleep(1.01); small.allow(0, "qty")
+    print(f"20k пользователей: бакетов {n} → {len(small.buckets)} после sweep")
+    assert len(small.buckets) <= 1
+
+    bot.dp.stop_polling(); await bot.dp.wait_closed(); poll.cancel()
+    await bot.on_shutdown(bot.dp); await fake.stop(); await (await bot.bot.get_session()).close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
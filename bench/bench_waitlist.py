@@ -0,0 +1,85 @@
+"""
+Рассылка листа ожидания на фейковом Bot API: 50k ждущих одного вкуса
+(+ часть из них ждёт и второй — срабатывает лимит на чат), 1 % заблокировал
+бота, посреди рассылки приходит 429 retry_after. На половине рассылку
+останавливаем (как при деплое) и запускаем заново; плюс «падение» —
+пачка, взятая в работу и не подтверждённая. Проверяется, что никому не
+пришло дважды, что каждый ждущий либо получил сообщение, либо учтён, и что
+ни в одном секундном окне (включая рестарт) сообщений не больше лимита.
+
+    python bench/bench_waitlist.py [ждущих] [сообщений/с]
+
+В проде лимит ~25/с (WAITLIST_RATE); здесь он поднят, чтобы мерить
+пропускную способность самой рассылки, а не ожидание лимита.
+"""
+import asyncio, bisect, collections, logging, os, sys, tempfile, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from aiogram import Bot
+from aiogram.bot.api import TelegramAPIServer
+from fake_tg import FakeTelegram
+from db import DB
+from waitlist import Notifier
+import migrations
+
+
+async def main(n, rate):
+    logging.basicConfig(level=logging.WARNING, format="%(message)s")
+    fake = FakeTelegram(); base = await fake.start()
+    bot = Bot("123456:BENCH", server=TelegramAPIServer.from_base(base))
+    db = DB(os.path.join(tempfile.mkdtemp(), "bench.db")); await db.raw(migrations.migrate)
+    await db.execute("INSERT INTO products(id,name,description,category) VALUES(1,'Pod','…','Жидкости')")
+    await db.executemany("INSERT INTO flavours(id,product_id,name,price,stock) VALUES(?,1,?,100,0)", [(1, "mint"), (2, "cola")])
+    uids = range(10**6, 10**6+n)
+    await db.executemany("INSERT INTO waitlist(user_id,flavour_id) VALUES(?,?)",
+                         [(u, 1) for u in uids] + [(u, 2) for u in uids[:n//10]])
+    total = n + n//10
+
+    got, sent_429 = collections.Counter(), [False]
+    def fail(method, d):
+        uid = int(d.get("chat_id") or 0)
+        if uid % 100 == 0: return 403, "Forbidden: bot was blocked by the user", None
+        if not sent_429[0] and len(got) > n//5:
+            sent_429[0] = True; return 429, "Too Many Requests: retry after 1", {"retry_after": 1}
+    def on_call(t, method, d):
+        if method == "sendmessage": got[(int(d["chat_id"]), d["reply_markup"])] += 1
+    fake.fail = fail; fake.listeners.append(on_call)
+    # моменты отправки со стороны бота — для лимита в любом секундном окне
+    at, send = [], bot.send_message
+    async def timed(*a, **kw):
+        at.append(time.monotonic()); return await send(*a, **kw)
+    bot.send_message = timed
+
+    # «падение»: пачка взята, но не подтверждена — после рестарта её не шлём
+    await db.execute("UPDATE waitlist SET notified=1 WHERE flavour_id=1 AND user_id<?", (10**6+50,))
+    await db.executemany("UPDATE flavours SET stock=10 WHERE id=?", [(1,), (2,)])
+
+    t0 = time.perf_counter()
+    first = Notifier(db, bot, rate=rate); task = asyncio.create_task(first.run())
+    while sum(got.values()) < total//2: await asyncio.sleep(0.05)
+    task.cancel(); await asyncio.gather(task, return_exceptions=True)
+    mid = sum(got.values())
+    print(f"1-й процесс: {first.stats} — остановлен на {mid} сообщениях")
+
+    second = Notifier(db, bot, rate=rate); task = asyncio.create_task(second.run())
+    while await db.fetchone("SELECT 1 FROM waitlist LIMIT 1"): await asyncio.sleep(0.05)
+    dt = time.perf_counter()-t0
+    task.cancel(); await asyncio.gather(task, return_exceptions=True)
+    print(f"2-й процесс: {second.stats}")
+
+    sent = first.stats["sent"]+second.stats["sent"]
+    blocked = first.stats["blocked"]+second.stats["blocked"]
+    dropped = first.stats["dropped"]+second.stats["dropped"]
+    dup = sum(c-1 for c in got.values() if c > 1)
+    print(f"{total} ждущих: доставлено {sent}, заблокировали {blocked}, сброшено после падения {dropped}; "
+          f"повторов {dup}; {dt:.1f}с — {sent/dt:.0f} сообщений/с при лимите {rate:.0f}/с")
+    peak = max(bisect.bisect_left(at, t+1)-i for i, t in enumerate(at))
+    print(f"пик: {peak} сообщений за секунду (лимит {rate:.0f})")
+    assert dup == 0, "двойная отправка"
+    assert peak <= rate, f"лимит превышен: {peak} за секунду"
+    assert sent+blocked+dropped == total, (sent, blocked, dropped, total)
+
+    await fake.stop(); await (await bot.get_session()).close(); db.close()
+
+if __name__ == "__main__":
+    a = sys.argv[1:]
+    asyncio.run(main(int(a[0]) if a else 50_000, float(a[1]) if len(a) > 1 else 2000))
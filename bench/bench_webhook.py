@@ -0,0 +1,60 @@
+"""
+Задержка «апдейт → ответ бота»: long polling (relax=0.1, как в executor)
+против webhook-режима, на фейковом Bot API. Заодно проверяет /ton_paid:
+POST с верным секретом переводит заказ в paid, с неверным — 403, GET — 405.
+
+    python bench/bench_webhook.py [апдейтов]
+"""
+import asyncio, os, sys, tempfile, time, logging
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from aiohttp import web
+from aiogram.dispatcher.webhook import WebhookRequestHandler, BOT_DISPATCHER_KEY
+from fake_tg import FakeTelegram
+
+def pct(xs, p): xs = sorted(xs); return xs[min(len(xs)-1, int(len(xs)*p))]*1000
+
+async def measure(fake, n, uid0):
+    lat, waiters = [], {}
+    def on_call(t, method, d):
+        if method == "sendmessage" and (f := waiters.pop(int(d["chat_id"]), None)): f.set_result(t)
+    fake.listeners.append(on_call)
+    for i in range(n):
+        uid = uid0+i; f = waiters[uid] = asyncio.get_running_loop().create_future()
+        t = time.perf_counter(); await fake.push(fake.message(uid, "☎️ Поддержка"))
+        lat.append(await f - t)
+    fake.listeners.remove(on_call)
+    return f"p50={pct(lat,.5):7.2f}мс p99={pct(lat,.99):7.2f}мс"
+
+async def main(n):
+    fake = FakeTelegram(); base = await fake.start()
+    os.environ.update(BOT_TOKEN="123456:BENCH", BOT_API_URL=base, ADMINS="",
+                      DB_PATH=os.path.join(tempfile.mkdtemp(), "bench.db"), RESERVE_MIN="0", TON_SECRET="bench")
+    import bot
+    logging.getLogger().setLevel(logging.WARNING)
+    await bot.migrate()
+
+    poll = asyncio.create_task(bot.dp.start_polling(timeout=20, relax=0.1))
+    print("polling ", await measure(fake, n, 1000))
+    bot.dp.stop_polling(); await bot.dp.wait_closed(); poll.cancel()
+
+    app = bot.web_app()
+    app.router.add_route("*", bot.WEBHOOK_PATH, WebhookRequestHandler)
+    app[BOT_DISPATCHER_KEY] = bot.dp
+    runner = web.AppRunner(app, access_log=None); await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0); await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+    await bot.bot.set_webhook(url+bot.WEBHOOK_PATH, secret_token=bot.WEBHOOK_SECRET)
+    print("webhook ", await measure(fake, n, 5000))
+
+    oid = (await bot.db.execute("INSERT INTO orders(user_id,total,pay_method,status) VALUES(7,100,'ton','pending')")).lastrowid
+    async with fake._cs.post(f"{url}/ton_paid?secret=wrong&order={oid}") as r: assert r.status == 403
+    async with fake._cs.get(f"{url}/ton_paid?secret={bot.CALLBACK_SECRET}&order={oid}") as r: assert r.status == 405
+    async with fake._cs.post(f"{url}/ton_paid?secret={bot.CALLBACK_SECRET}&order={oid}") as r: assert r.status == 200
+    assert (await bot.db.fetchone("SELECT status FROM orders WHERE id=?", (oid,)))[0] == "paid"
+    print("/ton_paid: ok")
+
+    await runner.cleanup(); await fake.stop()
+    await (await bot.bot.get_session()).close(); bot.db.close()
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
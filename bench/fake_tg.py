@@ -0,0 +1,123 @@
+"""
+Фейковый Telegram Bot API для бенчей — без сети.
+
+Бот подключается через BOT_API_URL=<url>. Сервер отвечает на любые
+методы (`{"ok": true}`), для нужных — правдоподобным `result`;
+getUpdates — честный long polling по очереди апдейтов, а после
+setWebhook апдейты вместо очереди POST'ятся на webhook.
+Каждый вызов сохраняется в .calls и рассылается слушателям (.listeners).
+.fail(method, data) → None или (код, описание, parameters) — ответить
+ошибкой Bot API (429 с retry_after, 403 «bot was blocked» и т.п.).
+"""
+
+import asyncio, itertools, json, time
+import aiohttp
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Plumbus", "username": "PlumbusShopBot"}
+
+
+class FakeTelegram:
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.calls, self.listeners = [], []
+        self.webhook = self.secret = self.fail = None
+        self._uid, self._mid = itertools.count(1), itertools.count(1)
+        self.app = web.Application(client_max_size=50 << 20)     # как у Bot API: sendDocument до 50 МБ
+        self.app.router.add_post("/bot{token}/{method}", self.handle)
+        self.app.router.add_get("/file/bot{token}/{path:.*}", self.file)
+        self.files, self.runner, self._cs = {}, None, None
+
+    # ── апдейты ──
+    @staticmethod
+    def user(uid): return {"id": uid, "is_bot": False, "first_name": f"u{uid}"}
+
+    def message(self, uid, text, **extra):
+        return {"update_id": next(self._uid), "message": {
+            "message_id": next(self._mid), "date": int(time.time()), "text": text,
+            "from": self.user(uid), "chat": {"id": uid, "type": "private"}, **extra}}
+
+    def callback(self, uid, data):
+        return {"update_id": next(self._uid), "callback_query": {
+            "id": str(next(self._uid)), "data": data, "chat_instance": "1", "from": self.user(uid),
+            "message": {"message_id": next(self._mid), "date": int(time.time()), "text": "…",
+                        "from": BOT_USER, "chat": {"id": uid, "type": "private"}}}}
+
+    def document(self, uid, name, data:bytes):
+        """Пользователь прислал файл; бот скачает его через getFile."""
+        fid = f"file{next(self._uid)}"; self.files[fid] = data
+        return self.message(uid, None, document={"file_id": fid, "file_unique_id": fid,
+                                                 "file_name": name, "file_size": len(data)})
+
+    def inline(self, uid, query):
+        return {"update_id": next(self._uid), "inline_query": {
+            "id": str(next(self._uid)), "from": self.user(uid), "query": query, "offset": ""}}
+
+    async def push(self, update):
+        if self.webhook:
+            headers = {"X-Telegram-Bot-Api-Secret-Token": self.secret} if self.secret else {}
+            async with self._cs.post(self.webhook, json=update, headers=headers) as r: await r.read()
+        else:
+            await self.queue.put(update)
+
+    # ── Bot API ──
+    async def handle(self, req):
+        method = req.match_info["method"].lower()
+        data = dict(await req.post()) if req.content_type != "application/json" else await req.json()
+        t = time.perf_counter()
+        if self.fail and (err := self.fail(method, data)):
+            code, desc, params = err
+            return web.json_response({"ok": False, "error_code": code, "description": desc,
+                                      **({"parameters": params} if params else {})}, status=code)
+        fn = getattr(self, "m_"+method, None)
+        result = await fn(data) if fn else True
+        self.calls.append((t, method, data))
+        for cb in self.listeners: cb(t, method, data)
+        return web.json_response({"ok": True, "result": result})
+
+    async def m_getme(self, d): return BOT_USER
+
+    async def m_getupdates(self, d):
+        out = []
+        try:
+            out.append(await asyncio.wait_for(self.queue.get(), float(d.get("timeout") or 0) or 0.01))
+        except asyncio.TimeoutError:
+            return []
+        while not self.queue.empty() and len(out) < int(d.get("limit") or 100):
+            out.append(self.queue.get_nowait())
+        return out
+
+    async def m_setwebhook(self, d):
+        self.webhook, self.secret = d.get("url"), d.get("secret_token"); return True
+
+    async def m_deletewebhook(self, d):
+        self.webhook = None; return True
+
+    async def m_getwebhookinfo(self, d):
+        return {"url": self.webhook or "", "has_custom_certificate": False, "pending_update_count": 0}
+
+    def _msg(self, d, **extra):
+        chat = int(d.get("chat_id") or 0)
+        return {"message_id": next(self._mid), "date": int(time.time()), "from": BOT_USER,
+                "chat": {"id": chat, "type": "private"}, "text": d.get("text", ""), **extra}
+
+    async def m_sendmessage(self, d):     return self._msg(d)
+    async def m_editmessagetext(self, d): return self._msg(d)
+    async def m_senddocument(self, d):
+        return self._msg(d, document={"file_id": "doc", "file_unique_id": "doc"})
+
+    async def m_getfile(self, d):
+        return {"file_id": d["file_id"], "file_unique_id": d["file_id"], "file_path": d["file_id"]}
+
+    async def file(self, req):
+        return web.Response(body=self.files.get(req.match_info["path"], b""))
+
+    # ── запуск ──
+    async def start(self, port=0):
+        self.runner = web.AppRunner(self.app, access_log=None); await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port); await site.start()
+        self._cs = aiohttp.ClientSession(json_serialize=json.dumps)
+        return f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    async def stop(self):
+        await self._cs.close(); await self.runner.cleanup()
@@ -0,0 +1,48 @@
+"""
+Локальный фейковый провайдер @wallet: POST /wpay/api/v1/createInvoice.
+
+Умеет задержку и случайные 503 / обрывы соединения; по Idempotency-Key
+отдаёт тот же счёт повторно, а .invoices / .requests позволяют проверить,
+что повторы не создали дублей.
+
+    python bench/fake_wallet.py [порт]      # отдельный сервер для ручной проверки
+"""
+import asyncio, random, sys
+from aiohttp import web
+
+
+class FakeWallet:
+    def __init__(self, delay=0.0, fail=0.0, drop=0.0, seed=1):
+        self.delay, self.fail, self.drop = delay, fail, drop
+        self.rnd = random.Random(seed)
+        self.invoices, self.requests = {}, 0
+        self.app = web.Application()
+        self.app.router.add_post("/wpay/api/v1/createInvoice", self.create)
+        self.runner = None
+
+    async def create(self, req):
+        self.requests += 1
+        if self.delay: await asyncio.sleep(self.delay)
+        if self.rnd.random() < self.drop:           # обрыв до ответа
+            req.transport.close(); return web.Response(status=500)
+        if self.rnd.random() < self.fail:
+            return web.json_response({"error": "busy"}, status=503)
+        body = await req.json()
+        key = req.headers.get("Idempotency-Key") or body.get("externalId") or str(self.requests)
+        inv = self.invoices.setdefault(key, f"https://t.me/wallet?startattach=inv_{len(self.invoices)+1}")
+        return web.json_response({"invoice_url": inv, "amount": body["amount"]})
+
+    async def start(self, port=0):
+        self.runner = web.AppRunner(self.app); await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port); await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}/wpay/api/v1/createInvoice"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+if __name__ == "__main__":
+    async def main(port):
+        print(await FakeWallet().start(port)); await asyncio.Event().wait()
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8099))
@@ -9,7 +9,7 @@ Plumbus-Shop bot • v0.9.1  (июль 2025)
 • Автомиграция SQLite, логирование в Deploy Logs
 """
 
-import os, logging, sqlite3, random, string, json, aiohttp
+import os, logging, random, string, asyncio, hashlib, hmac, tempfile, signal
 from datetime import datetime
 from pathlib import Path
 
@@ -20,77 +20,86 @@ from aiogram.types import (
     ReplyKeyboardMarkup   as RM,
     KeyboardButton        as KB,
 )
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
+from aiogram.bot.api import TelegramAPIServer
 from aiogram.dispatcher import FSMContext
-from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.utils import executor
+from aiogram.utils.markdown import quote_html
+from aiohttp import web
+
+from db import DB
+from catalog import Catalog, EMPTY, BY_NAME, WAREHOUSE
+import shop, migrations, ledger, sales, bulk, search, archive, cluster, flows
+from payments import TonPay, PayError
+from fsm_storage import SQLiteStorage
+from waitlist import Notifier
+from bus import Bus
+from throttle import Throttle
+import metrics
+from callbacks import Router, CAT, PRD, FLV, QTY, CART, ORD, SET, WAIT, MO, WH, LO, STATUSES, STAT, PERIODS, IO, FW
 
 
 # ─────────────── CONFIG & LOGS ────────────────────────────────
 BOT_TOKEN   = os.getenv("BOT_TOKEN")
 ADMIN_IDS   = {int(i) for i in os.getenv("ADMINS", "").replace(" ", "").split(",") if i}
 WALLET_API  = os.getenv("WALLET_API_TOKEN")           # @wallet merchant token
-CALLBACK_SECRET = os.getenv("TON_SECRET", "ton_secret")
+CALLBACK_SECRET = os.getenv("TON_SECRET")           # без него /ton_paid не поднимается
 BOT_USERNAME    = os.getenv("BOT_USERNAME", "PlumbusShopBot")
 
 DB_PATH   = os.getenv("DB_PATH", "/data/vape_shop.db")
+BOT_API_URL = os.getenv("BOT_API_URL")                # свой Bot API сервер (локальный / фейк для бенчей)
+RESERVE_MIN = int(os.getenv("RESERVE_MIN", "60"))     # резерв неоплаченного заказа, мин (0 — бессрочно)
+FSM_TTL_H   = int(os.getenv("FSM_TTL_H", "72"))       # брошенный мастер сбрасывается через N часов
+GROUP_COMMIT_MS = float(os.getenv("GROUP_COMMIT_MS", "5"))  # окно group commit для корзины/регистрации
+WAITLIST_RATE = float(os.getenv("WAITLIST_RATE", "25"))  # рассылка «снова в наличии», сообщений/с
+ARCHIVE_DAYS  = int(os.getenv("ARCHIVE_DAYS", "180"))    # done/cancel старше N дней — в архив (0 — не архивировать)
+ARCHIVE_DIR   = os.getenv("ARCHIVE_DIR") or os.path.join(os.path.dirname(DB_PATH), "archive")
+
+# WORKERS>1 — front + N процессов-воркеров (cluster.py); WORKER=i front ставит воркерам сам
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER  = int(os.environ["WORKER"]) if os.getenv("WORKER") else None
+
+# webhook-режим включается, если задан публичный адрес; иначе long polling
+PUBLIC_URL   = os.getenv("PUBLIC_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/tg")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(f"{BOT_TOKEN}".encode()).hexdigest()[:32]
+WEB_HOST, WEB_PORT = os.getenv("WEB_HOST", "0.0.0.0"), int(os.getenv("PORT", "8080"))
+
+# /metrics (Prometheus) на отдельном локальном порту; медленные SQL — в лог
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+SLOW_SQL_MS  = float(os.getenv("SLOW_SQL_MS", "0"))
 
 logging.basicConfig(
     level=logging.DEBUG if os.getenv("DEBUG") else logging.INFO,
-    format="%(asctime)s | %(levelname)-8s | %(message)s",
+    format="%(asctime)s | %(levelname)-8s | "+("" if WORKERS<2 else "front | " if WORKER is None else f"w{WORKER} | ")+"%(message)s",
 )
 
-bot = Bot(BOT_TOKEN, parse_mode="HTML")
-dp  = Dispatcher(bot, storage=MemoryStorage())
-
 
-# ─────────────── DATABASE (SQLite + миграция) ─────────────────
+# ─────────────── DATABASE (SQLite + миграции) ────────────────
 Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cur  = conn.cursor()
-
-def migrate():
-    cur.executescript("""
-    PRAGMA foreign_keys = ON;
-    CREATE TABLE IF NOT EXISTS users(
-        id INTEGER PRIMARY KEY,
-        cashback REAL DEFAULT 0,
-        total_spent REAL DEFAULT 0
-    );
-    CREATE TABLE IF NOT EXISTS products(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT, description TEXT, category TEXT,
-        created TEXT DEFAULT (datetime('now'))
-    );
-    CREATE TABLE IF NOT EXISTS flavours(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
-        name TEXT, price REAL DEFAULT 0, stock INTEGER DEFAULT 0
-    );
-    CREATE TABLE IF NOT EXISTS carts(
-        user_id INTEGER,
-        flavour_id INTEGER REFERENCES flavours(id) ON DELETE CASCADE,
-        qty INTEGER,
-        PRIMARY KEY(user_id, flavour_id)
-    );
-    CREATE TABLE IF NOT EXISTS orders(
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER, created TEXT DEFAULT (datetime('now')),
-        total REAL, pay_method TEXT, discount REAL DEFAULT 0,
-        status TEXT
-    );
-    CREATE TABLE IF NOT EXISTS order_items(
-        order_id INTEGER REFERENCES orders(id) ON DELETE CASCADE,
-        flavour_id INTEGER, qty INTEGER, price REAL
-    );
-    CREATE TABLE IF NOT EXISTS refs(
-        code TEXT PRIMARY KEY,
-        owner_id INTEGER,
-        used_by_id INTEGER
-    );
-    """)
-    conn.commit()
-migrate()
+db = DB(DB_PATH, group_ms=GROUP_COMMIT_MS)
+# между процессами: инвалидации кеша и «склад пополнен»; подрезает таблицу front
+bus = Bus(db, os.getpid(), prune=WORKER is None) if WORKERS>1 else None
+cache = Catalog(db, bus)
+
+bot = Bot(BOT_TOKEN, parse_mode="HTML",
+          **({"server": TelegramAPIServer.from_base(BOT_API_URL)} if BOT_API_URL else {}))
+dp  = Dispatcher(bot, storage=SQLiteStorage(db, ttl=FSM_TTL_H*3600))
+route = Router(ADMIN_IDS)
+metrics.instrument(dp, db, route, slow_ms=SLOW_SQL_MS)
+# (в секунду, подряд) на пользователя, админов не ограничиваем;
+# двойной тап по кнопке мастера (подтверждение заказа)/статусу/количеству схлопывается у всех
+dp.middleware.setup(Throttle({"*": (3, 10), "msg": (2, 8), "qty": (2, 6)},
+                             collapse=("qty", "cart", "fw", "set"), exempt=ADMIN_IDS))
+
+async def migrate():
+    v=await db.raw(migrations.migrate)
+    logging.info("DB %s: schema v%s", DB_PATH, v)
+    # до первого заказа: иначе покупатель с заказами только в архиве снова «новый» для реф-скидки
+    try:
+        if n:=await archive.first_orders(db, ARCHIVE_DIR): logging.info("first_order from archive: %s users", n)
+    except Exception:
+        logging.exception("first_order from archive")    # архив не переносится, пока не пройдёт
 
 
 # ─────────────── KEYBOARDS ───────────────────────────────────
@@ -100,7 +109,7 @@ def kb_main(uid:int):
     kb = RM(resize_keyboard=True)
     kb.row("🛍 Каталог", "🧺 Корзина")
     kb.row("📦 Мой кешбэк", "📄 Мои заказы")
-    kb.add("☎️ Поддержка")
+    kb.row("🔍 Поиск", "☎️ Поддержка")
     if uid in ADMIN_IDS: kb.add("🛠 Админ-панель")
     return kb
 
@@ -108,56 +117,91 @@ def kb_admin():
     kb = RM(resize_keyboard=True)
     kb.row("➕ Добавить", "✏️ Остаток")
     kb.row("📦 Склад", "❌ Удалить")
-    kb.row("📃 Заказы", "↩️ Назад")
+    kb.row("📃 Заказы", "📊 Статистика")
+    kb.row("📥 Импорт", "📤 Экспорт")
+    kb.add("↩️ Назад")
     return kb
 
 def kb_cats():
     kb = IM()
-    for c in CATS: kb.add(IB(c, callback_data=f"cat:{c}"))
+    for c in CATS: kb.add(IB(c, callback_data=CAT(c)))
+    kb.add(IB("🔍 Поиск", switch_inline_query_current_chat=""))
     return kb
 
-def cart_total(uid:int):
-    cur.execute("""SELECT SUM(c.qty*f.price)
-                   FROM carts c JOIN flavours f ON f.id=c.flavour_id
-                   WHERE c.user_id=?""",(uid,))
-    return cur.fetchone()[0] or 0
+async def cart_total(uid:int):
+    row=await db.fetchone("""SELECT SUM(c.qty*f.price)
+                             FROM carts c JOIN flavours f ON f.id=c.flavour_id
+                             WHERE c.user_id=?""",(uid,))
+    return row[0] or 0
 
-def cashback_rate(spent):
-    if spent < 10000:   return 0.005
-    if spent < 15000:   return 0.01
-    if spent < 25000:   return 0.02
-    if spent < 35000:   return 0.04
-    return 0.07
+def kb_pager(cb, rows, key, fwd_more, back_more, *extra, kb=None):
+    """◀ ▶ под списком; key(row) — ключ keyset для callback_data."""
+    kb=kb or IM(); nav=[]
+    if back_more: nav.append(IB("◀", callback_data=cb(*extra, "p", *key(rows[0]))))
+    if fwd_more:  nav.append(IB("▶", callback_data=cb(*extra, "n", *key(rows[-1]))))
+    if nav: kb.row(*nav)
+    return kb if kb.inline_keyboard else None
 
 def rand_code(n=6):
     return ''.join(random.choices(string.ascii_uppercase+string.digits, k=n))
 
 
+# ─────────────── WAITLIST («сообщить о поступлении») ───────────
+notifier = Notifier(db, bot, rate=WAITLIST_RATE)
+
+def restocked(fids):
+    """Остаток вкусов вырос: сбросить кеш и разбудить рассылку ожидающим
+    (рассылка — во front, воркеры будят её через bus)."""
+    cache.invalidate_flavours(fids); notifier.kick()
+    if bus: bus.publish("restock", fids)
+
+if bus and WORKER is None: bus.on("restock", lambda _: notifier.kick())
+
+
 # ─────────────── TON-invoice helper ──────────────────────────
+ton_pay = TonPay(WALLET_API, url=os.getenv("WALLET_API_URL", TonPay.URL))
+
 async def send_invoice_ton(uid:int, order_id:int, rub_amount:float):
     ton_amount = (rub_amount/100)*0.93         # 1 TON~100₽, −7 %
-    params = {
-        "amount": f"{ton_amount:.2f}",
-        "currency_code": "TON",
-        "description": f"Order #{order_id}",
-        "callback_url": f"https://<YOUR_URL>/ton_paid?secret={CALLBACK_SECRET}&order={order_id}"
-    }
-    headers = {"Content-Type":"application/json","Authorization":f"Bearer {WALLET_API}"}
-    async with aiohttp.ClientSession() as cs:
-        async with cs.post("https://pay.wallet.tg/wpay/api/v1/createInvoice",
-                           headers=headers, data=json.dumps(params)) as r:
-            js=await r.json()
-    url=js["invoice_url"]
+    try:
+        url=await ton_pay.create_invoice(order_id, ton_amount,
+            f"{PUBLIC_URL or 'https://<YOUR_URL>'}/ton_paid?secret={CALLBACK_SECRET}&order={order_id}")
+    except PayError:
+        logging.exception("TON invoice")
+        return await bot.send_message(uid, f"Не удалось выставить счёт TON. Заказ #{order_id} сохранён, менеджер свяжется.")
     kb=IM().add(IB("Оплатить TON 🔗", url=url))
     await bot.send_message(uid, "Ссылка на оплату TON (−7 %)", reply_markup=kb)
 
 
-# ─────────────── FSM для добавления товара ───────────────────
-class Add(StatesGroup):
-    cat=State(); name=State(); desc=State(); flav_cnt=State(); flav_loop=State()
-
+# ─────────────── МАСТЕРА (*_flow.json → flows.py) ───────────
 def to_int(text): return text.isdigit() and int(text)
 
+async def flow_exists(key, name, d):
+    """check_existing: товар с таким названием в выбранной категории → id."""
+    row=await db.fetchone(BY_NAME, (d["cat"],name))
+    return row and row[0]
+
+async def flow_products(text, d):
+    """search_product: ID товара или поиск по каталогу → [(название, id)]."""
+    def find(con):
+        if to_int(text): return con.execute("SELECT id,name FROM products WHERE id=?", (int(text),)).fetchall()
+        fids=[r[0] for r in search.find(con, text, 50)]
+        return con.execute(f"""SELECT DISTINCT p.id,p.name FROM flavours f JOIN products p ON p.id=f.product_id
+                               WHERE f.id IN ({','.join('?'*len(fids))}) LIMIT 10""", fids).fetchall()
+    return [(n,pid) for pid,n in await db.read(find)]
+
+async def flow_variants(d):
+    """select_variant: вкусы выбранного товара → [(подпись, id)]."""
+    rows=await db.fetchall("SELECT id,name,stock FROM flavours WHERE product_id=?", (d["product"],))
+    return [(f"{n} — {s} шт",fid) for fid,n,s in rows]
+
+# JSON мастеров читается и проверяется один раз: ошибка в файле — бот не стартует
+FLOWS  = flows.load_all(os.path.dirname(os.path.abspath(__file__)))
+wizard = flows.Engine(FLOWS, FW, {"check_existing": flow_exists, "search_product": flow_products,
+                                  "select_variant": flow_variants})
+
+async def admin_cancel(m, uid, d): await m.answer("Отменено.", reply_markup=kb_admin())
+
 
 # ─────────────── Универсальный выход (/cancel, ↩️) ───────────
 @dp.message_handler(commands="cancel", state="*")
@@ -175,135 +219,130 @@ async def cmd_start(m: types.Message):
     if m.get_args():
         code=m.get_args()
         if len(code)==6:
-            cur.execute("SELECT owner_id FROM refs WHERE code=?",(code,))
-            row=cur.fetchone()
+            row=await db.fetchone("SELECT owner_id FROM refs WHERE code=?",(code,))
             if row and row[0]!=m.from_user.id:
-                cur.execute("""INSERT OR IGNORE INTO refs(code,owner_id,used_by_id)
-                               VALUES(?,?,?)""",(code,row[0],m.from_user.id))
-                conn.commit()
+                await db.execute("""INSERT OR IGNORE INTO refs(code,owner_id,used_by_id)
+                                    VALUES(?,?,?)""",(code,row[0],m.from_user.id))
                 await m.answer("Реф-код активирован! Скидка 300 ₽ на первый заказ.")
-    cur.execute("INSERT OR IGNORE INTO users(id) VALUES(?)",(m.from_user.id,)); conn.commit()
+    await db.group("INSERT OR IGNORE INTO users(id) VALUES(?)",(m.from_user.id,))
     await m.answer("Добро пожаловать!", reply_markup=kb_main(m.from_user.id))
+    # ссылка из inline-поиска: t.me/<бот>?start=f_<вкус>
+    if (arg:=m.get_args() or "").startswith("f_") and to_int(arg[2:]):
+        fl=await cache.flavour(int(arg[2:]))
+        if fl is EMPTY: return await m.answer("Этого вкуса сейчас нет в наличии.")
+        txt,kb=fl; await m.answer(txt, reply_markup=kb)
 
 @dp.message_handler(text="🛍 Каталог", state="*")
 async def catalog(m): await m.answer("Категории:", reply_markup=kb_cats())
 
-@dp.callback_query_handler(lambda c:c.data.startswith("cat:"), state="*")
-async def cat_open(c):
-    cat=c.data[4:]
-    cur.execute("SELECT id,name FROM products WHERE category=?",(cat,))
-    rows=cur.fetchall()
-    if not rows: return await c.answer("Категория пуста")
-    kb=IM()
-    for pid,name in rows: kb.add(IB(name,callback_data=f"prd:{pid}"))
+@route(CAT)
+async def cat_open(c,d):
+    cat=d.name
+    kb=await cache.category(cat)
+    if kb is EMPTY: return await c.answer("Категория пуста")
     await c.message.answer(cat+":", reply_markup=kb); await c.answer()
 
-@dp.callback_query_handler(lambda c:c.data.startswith("prd:"), state="*")
-async def product_card(c):
-    pid=int(c.data[4:])
-    cur.execute("SELECT name,description FROM products WHERE id=?", (pid,))
-    name,desc=cur.fetchone()
-    cur.execute("SELECT id,name,price,stock FROM flavours WHERE product_id=? AND stock>0",(pid,))
-    rows=cur.fetchall()
-    if not rows: return await c.answer("Нет в наличии")
-    kb=IM()
-    for fid,fname,price,stock in rows:
-        kb.add(IB(f"{fname} — {price}₽ ({stock})",callback_data=f"flv:{fid}"))
-    await c.message.answer(f"<b>{name}</b>\n{desc}", reply_markup=kb); await c.answer()
-
-@dp.callback_query_handler(lambda c:c.data.startswith("flv:"), state="*")
-async def choose_qty(c):
-    fid=int(c.data[4:])
-    cur.execute("SELECT name,stock FROM flavours WHERE id=?", (fid,))
-    fname,stock=cur.fetchone()
-    kb=IM(row_width=5)
-    for i in range(1, min(stock,10)+1):
-        kb.insert(IB(str(i),callback_data=f"qty:{fid}:{i}"))
-    await c.message.answer(f"Сколько «{fname}»?", reply_markup=kb); await c.answer()
-
-@dp.callback_query_handler(lambda c:c.data.startswith("qty:"), state="*")
-async def add_cart(c):
-    _, fid, qty = c.data.split(":")
-    fid, qty = int(fid), int(qty)
-    cur.execute("""INSERT INTO carts(user_id,flavour_id,qty)
-                   VALUES(?,?,?)
-                   ON CONFLICT(user_id,flavour_id) DO UPDATE SET qty=qty+excluded.qty""",
-                (c.from_user.id, fid, qty)); conn.commit()
+@route(PRD)
+async def product_card(c,d):
+    card=await cache.card(d.pid)
+    if card is EMPTY: return await c.answer("Нет в наличии")
+    txt,kb=card
+    await c.message.answer(txt, reply_markup=kb); await c.answer()
+
+@route(FLV)
+async def choose_qty(c,d):
+    fl=await cache.flavour(d.fid)
+    if fl is EMPTY: return await c.answer("Нет в наличии")
+    txt,kb=fl
+    await c.message.answer(txt, reply_markup=kb); await c.answer()
+
+@route(WAIT)
+async def wait_flavour(c,d):
+    row=await db.fetchone("SELECT stock FROM flavours WHERE id=?", (d.fid,))
+    if not row: return await c.answer("Вкус снят с продажи")
+    if row[0]>0: return await c.answer("Уже в наличии — откройте товар заново")
+    await db.execute("INSERT OR IGNORE INTO waitlist(user_id,flavour_id) VALUES(?,?)", (c.from_user.id,d.fid))
+    await c.answer("🔔 Сообщим, когда появится")
+
+@route(QTY)
+async def add_cart(c,d):
+    fid, qty = d.fid, d.n
+    await db.group("""INSERT INTO carts(user_id,flavour_id,qty)
+                      VALUES(?,?,?)
+                      ON CONFLICT(user_id,flavour_id) DO UPDATE SET qty=qty+excluded.qty""",
+                   (c.from_user.id, fid, qty))
     await c.answer("Добавлено ✅", show_alert=True)
 
 @dp.message_handler(text="🧺 Корзина", state="*")
 async def cart_show(m):
-    cur.execute("""SELECT f.name,c.qty,f.price
-                   FROM carts c JOIN flavours f ON f.id=c.flavour_id
-                   WHERE c.user_id=?""",(m.from_user.id,))
-    rows=cur.fetchall()
+    rows=await db.fetchall(shop.CART,(m.from_user.id,))
     if not rows: return await m.answer("Корзина пуста.")
     total=sum(q*p for _,q,p in rows)
     txt="\n".join(f"{n} ×{q} = {q*p:.0f}₽" for n,q,p in rows)
     kb=IM(row_width=2)
-    kb.add(IB("Ton −7 %", callback_data="pay:ton"),
-           IB("Картой",    callback_data="pay:card"))
-    kb.add(IB("Очистить", callback_data="cart:clr"))
+    kb.add(IB("📦 Оформить", callback_data=CART("buy")),
+           IB("Очистить",   callback_data=CART("clr")))
     await m.answer(f"{txt}\n<b>Итого: {total}₽</b>", parse_mode='HTML', reply_markup=kb)
 
-@dp.callback_query_handler(lambda c:c.data=="cart:clr", state="*")
-async def cart_clr(c):
-    cur.execute("DELETE FROM carts WHERE user_id=?", (c.from_user.id,)); conn.commit()
+@route(CART)
+async def cart_op(c,d):
+    if d.op=="buy":                                  # оплата и доставка — мастер order_flow.json
+        await c.answer()
+        return await wizard.start("order", c.message, dp.current_state(chat=c.message.chat.id, user=c.from_user.id))
+    await db.group("DELETE FROM carts WHERE user_id=?", (c.from_user.id,))
     await c.answer("Корзина очищена"); await c.message.delete()
 
-@dp.callback_query_handler(lambda c:c.data.startswith("pay:"), state="*")
-async def checkout(c):
-    method=c.data[4:]; uid=c.from_user.id
-    cur.execute("""SELECT f.id,f.price,c.qty
-                   FROM carts c JOIN flavours f ON f.id=c.flavour_id
-                   WHERE c.user_id=?""",(uid,))
-    items=cur.fetchall()
-    if not items: return await c.answer("Корзина пуста")
-    total=sum(q*p for _,p,q in items); discount=0
-    # TON скидка
-    if method=="ton": discount+=round(total*0.07,2)
-    # реф-скидка
-    cur.execute("SELECT COUNT(*) FROM orders WHERE user_id=?", (uid,))
-    if cur.fetchone()[0]==0:
-        cur.execute("SELECT owner_id FROM refs WHERE used_by_id=?", (uid,))
-        if row:=cur.fetchone():
-            discount+=300
-            cur.execute("UPDATE users SET cashback=cashback+300 WHERE id=?", (row[0],))
-    # кешбэк списание
-    cur.execute("SELECT cashback FROM users WHERE id=?", (uid,)); cb=cur.fetchone()[0]
-    if cb:
-        use=min(cb,total-discount)
-        discount+=use; cur.execute("UPDATE users SET cashback=cashback-? WHERE id=?", (use,uid))
-    total_pay=max(0,total-discount)
-    cur.execute("INSERT INTO orders(user_id,total,pay_method,discount,status) VALUES(?,?,?,?,?)",
-                (uid,total,method,discount,"pending")); oid=cur.lastrowid
-    cur.executemany("INSERT INTO order_items(order_id,flavour_id,qty,price) VALUES(?,?,?,?)",
-                    [(oid,f,q,p) for f,p,q in items])
-    for f,p,q in items: cur.execute("UPDATE flavours SET stock=stock-? WHERE id=?", (q,f))
-    cur.execute("DELETE FROM carts WHERE user_id=?", (uid,))
-    conn.commit()
+async def checkout(m, uid, d):
+    """Мастер оформления пройден: заказ из корзины со способом оплаты и доставкой."""
+    f=FLOWS["order"]; method=d["pay"]
+    delivery=", ".join(x for x in (f.label("delivery", d["delivery"]),
+                                   d.get("zone") and f.label("zone", d["zone"]), d.get("district")) if x)
+    where=quote_html(delivery)                       # район — текст покупателя, бот шлёт в HTML
+    try:
+        res=await db.tx(lambda con: shop.place_order(con, uid, method, RESERVE_MIN, delivery))
+    except shop.OutOfStock as e:
+        txt="\n".join(f"{n}: нужно {q}, есть {s}" for n,q,s in e.short)
+        return await m.answer(f"Не хватает на складе:\n{txt}")
+    if not res: return await m.answer("Корзина пуста.")
+    oid,total_pay,fids=res
+    cache.invalidate_flavours(fids)
     if method=="ton":
+        await m.answer(f"Заказ #{oid} создан! Доставка: {where}")
         await send_invoice_ton(uid, oid, total_pay)
     else:
-        await bot.send_message(uid,"Менеджер свяжется для оплаты картой.")
-    await c.answer("Заказ создан!")
+        await m.answer(f"Заказ #{oid} создан! Доставка: {where}\nМенеджер свяжется для оплаты картой.")
+
+async def order_cancel(m, uid, d): await m.answer("Оформление отменено, корзина на месте.")
+
+wizard.bind("order", checkout, order_cancel)
 
 @dp.message_handler(regexp="^📦 Мой кешбэк$", state="*")
 async def my_cb(m):
-    cur.execute("SELECT cashback FROM users WHERE id=?", (m.from_user.id,))
-    cb=cur.fetchone()[0]
-    await m.answer(f"Ваш кешбэк: {cb:.0f} ₽")
+    cb,spent=await db.fetchone(ledger.BALANCE, (m.from_user.id,)) or (0,0)
+    txt=f"Ваш кешбэк: {cb:.0f} ₽\nУровень: {ledger.cashback_rate(spent)*100:g} % (покупок на {spent:.0f} ₽)"
+    if nxt:=ledger.next_tier(spent): txt+=f"\nДо {nxt[1]*100:g} % — ещё {nxt[0]-spent:.0f} ₽"
+    await m.answer(txt)
 
-@dp.message_handler(text="📄 Мои заказы", state="*")
-async def my_orders(m):
-    cur.execute("""SELECT id,created,status,total,discount
-                   FROM orders WHERE user_id=? ORDER BY id DESC""",(m.from_user.id,))
-    rows=cur.fetchall()
-    if not rows: return await m.answer("У вас ещё нет заказов.")
+async def my_orders_page(uid, d=None):
+    rows,fwd,back=await db.keyset(shop.MY_ORDERS, (uid,), ("id",),
+                                  d and d.oid and (d.oid,), not d or d.dir=="n", desc=True)
+    if not rows: return None, None
     txt=[]
     for oid,dt,st,tot,disc in rows:
         txt.append(f"#{oid} • {dt[:16]} • {st}\nСумма: {tot-disc:.0f}₽ (скидка {disc:.0f})")
-    await m.answer("\n\n".join(txt))
+    return "\n\n".join(txt), kb_pager(MO, rows, lambda r:r[:1], fwd, back)
+
+@dp.message_handler(text="📄 Мои заказы", state="*")
+async def my_orders(m):
+    txt,kb=await my_orders_page(m.from_user.id)
+    if not txt: return await m.answer("У вас ещё нет заказов.")
+    await m.answer(txt, reply_markup=kb)
+
+@route(MO)
+async def my_orders_nav(c,d):
+    txt,kb=await my_orders_page(c.from_user.id, d)
+    if not txt: return await c.answer("Дальше пусто")
+    await c.message.edit_text(txt, reply_markup=kb); await c.answer()
 
 @dp.message_handler(text="☎️ Поддержка", state="*")
 async def support(m): await m.answer("Контакт: @PlumbusSupport")
@@ -313,32 +352,41 @@ async def support(m): await m.answer("Контакт: @PlumbusSupport")
 @dp.message_handler(text="🛠 Админ-панель", user_id=ADMIN_IDS, state="*")
 async def admin_menu(m): await m.answer("Админ-панель:", reply_markup=kb_admin())
 
+async def warehouse_page(d=None):
+    rows,fwd,back=await db.keyset(WAREHOUSE, (), ("f.product_id","f.id"),
+                                  d and d.pid and (d.pid,d.fid), not d or d.dir=="n", limit=30)
+    if not rows: return None, None
+    txt="\n".join(f"{fid}. {pn} – {fn}: {stk} шт • {pr}₽" for _,fid,pn,fn,stk,pr in rows)
+    return txt, kb_pager(WH, rows, lambda r:r[:2], fwd, back)
+
 @dp.message_handler(text="📦 Склад", user_id=ADMIN_IDS, state="*")
 async def warehouse(m):
-    cur.execute("""SELECT f.id,p.name,f.name,f.stock,f.price
-                   FROM flavours f JOIN products p ON p.id=f.product_id
-                   ORDER BY p.name""")
-    rows=cur.fetchall()
-    if not rows: return await m.answer("Склад пуст.")
-    txt="\n".join(f"{fid}. {pn} – {fn}: {stk} шт • {pr}₽" for fid,pn,fn,stk,pr in rows)
-    await m.answer(txt)
+    txt,kb=await warehouse_page()
+    if not txt: return await m.answer("Склад пуст.")
+    await m.answer(txt, reply_markup=kb)
+
+@route(WH, admin=True)
+async def warehouse_nav(c,d):
+    txt,kb=await warehouse_page(d)
+    if not txt: return await c.answer("Дальше пусто")
+    await c.message.edit_text(txt, reply_markup=kb); await c.answer()
 
 @dp.message_handler(text="✏️ Остаток", user_id=ADMIN_IDS, state="*")
-async def ask_edit(m,state:FSMContext):
-    kb=RM(resize_keyboard=True).add("✖️ Отмена")
-    await m.answer("ID_вкуса новое_кол-во",reply_markup=kb)
-    await state.set_state("edit_stock")
+async def ask_edit(m,state:FSMContext): await wizard.start("update_stock", m, state)
 
-@dp.message_handler(text="✖️ Отмена", state="edit_stock", user_id=ADMIN_IDS)
+async def do_edit(m, uid, d):
+    fid,new=d["flavour"],d["stock"]
+    await db.execute("UPDATE flavours SET stock=? WHERE id=?", (new,fid))
+    if new>0: restocked([fid])
+    else: cache.invalidate_flavours([fid])
+    await m.answer("Обновлено.", reply_markup=kb_admin())
+
+wizard.bind("update_stock", do_edit, admin_cancel)
+
+@dp.message_handler(text="✖️ Отмена", state="import_doc", user_id=ADMIN_IDS)
 async def edit_cancel(m,state:FSMContext):
     await state.finish(); await m.answer("Отменено.", reply_markup=kb_admin())
 
-@dp.message_handler(state="edit_stock", user_id=ADMIN_IDS)
-async def do_edit(m,state:FSMContext):
-    try: fid,new = map(int,m.text.split()); cur.execute("UPDATE flavours SET stock=? WHERE id=?", (new,fid)); conn.commit()
-    except: return await m.answer("Формат: 12 50")
-    await m.answer("Обновлено.", reply_markup=kb_admin()); await state.finish()
-
 @dp.message_handler(text="❌ Удалить", user_id=ADMIN_IDS, state="*")
 async def ask_del(m,state:FSMContext):
     await m.answer("ID продукта для удаления:"); await state.set_state("del_prod")
@@ -346,114 +394,364 @@ async def ask_del(m,state:FSMContext):
 @dp.message_handler(state="del_prod", user_id=ADMIN_IDS)
 async def do_del(m,state:FSMContext):
     if not to_int(m.text): return await m.answer("Число!")
-    cur.execute("DELETE FROM products WHERE id=?", (int(m.text),)); conn.commit()
+    await db.execute("DELETE FROM products WHERE id=?", (int(m.text),))
+    cache.invalidate_products([int(m.text)])
     await m.answer("Удалено.", reply_markup=kb_admin()); await state.finish()
 
+async def orders_page(status="all", d=None):
+    rows,fwd,back=await db.keyset(*shop.orders_query(status), ("id",),
+                                  d and d.oid and (d.oid,), not d or d.dir=="n", desc=True)
+    kb=IM(row_width=5)
+    kb.row(*(IB(("• " if s==status else "")+s, callback_data=LO(s,"n",0)) for s in STATUSES))
+    for oid,uid,st,tot,disc in rows:
+        kb.add(IB(f"#{oid} • {uid} • {st} • {tot-disc:.0f}₽", callback_data=ORD(oid)))
+    if rows: kb_pager(LO, rows, lambda r:r[:1], fwd, back, status, kb=kb)
+    return ("Заказы:" if rows else "Заказов нет."), kb
+
 @dp.message_handler(text="📃 Заказы", user_id=ADMIN_IDS, state="*")
 async def list_orders(m):
-    cur.execute("""SELECT id,user_id,status,total,discount
-                   FROM orders ORDER BY id DESC LIMIT 20""")
-    rows=cur.fetchall()
-    if not rows: return await m.answer("Заказов нет.")
-    kb=IM()
-    for oid,uid,st,tot,disc in rows:
-        kb.add(IB(f"#{oid} • {uid} • {st} • {tot-disc:.0f}₽", callback_data=f"ord:{oid}"))
-    await m.answer("Заказы:", reply_markup=kb)
-
-@dp.callback_query_handler(lambda c:c.data.startswith("ord:"), user_id=ADMIN_IDS, state="*")
-async def ord_view(c):
-    oid=int(c.data[4:])
-    cur.execute("""SELECT o.user_id,o.created,o.status,o.total,o.discount,
-                   f.name,oi.qty,oi.price
-                   FROM orders o
-                   JOIN order_items oi ON oi.order_id=o.id
-                   JOIN flavours f ON f.id=oi.flavour_id
-                   WHERE o.id=?""",(oid,))
-    rows=cur.fetchall()
-    if not rows: return await c.answer("Не найдено")
-    uid,dt,st,tot,disc, *_ = rows[0]
-    items="\n".join(f"{n} ×{q} = {q*p:.0f}₽" for *_,n,q,p in rows)
-    txt=(f"<b>Заказ #{oid}</b> • {dt[:16]}\nПокупатель {uid}\n{items}\n"
+    txt,kb=await orders_page()
+    await m.answer(txt, reply_markup=kb)
+
+@route(LO, admin=True)
+async def list_orders_nav(c,d):
+    txt,kb=await orders_page(d.status, d)
+    await c.message.edit_text(txt, reply_markup=kb); await c.answer()
+
+async def order_card(oid):
+    """→ (текст, клавиатура) или (None, None); закрытый старый заказ ищется в архиве."""
+    rows=await db.fetchall(shop.CARD,(oid,))
+    if rows:
+        (uid,dt,st,tot,disc,dlv,*_),where=rows[0],""
+    elif o:=await archive.find(db, ARCHIVE_DIR, oid):
+        uid,dt,st,tot,disc,dlv,rows,where=(o["user_id"],o["created"],o["status"],o["total"],o["discount"],
+                                           o.get("delivery"),o["items"]," • 🗄 архив")
+    else: return None, None
+    items="\n".join(f"{n or f'вкус #{fid}'} ×{q} = {q*p:.0f}₽" for *_,fid,n,q,p in rows)
+    txt=(f"<b>Заказ #{oid}</b> • {dt[:16]}{where}\nПокупатель {uid}\n"+(f"Доставка: {quote_html(dlv)}\n" if dlv else "")+f"{items}\n"
          f"<b>Итого: {tot-disc:.0f}₽</b> (скидка {disc:.0f})\nСтатус: {st}")
     kb=IM(row_width=3)
-    if st=="pending": kb.add(IB("Paid",   callback_data=f"set:{oid}:paid"))
-    if st!="done":    kb.add(IB("Done",   callback_data=f"set:{oid}:done"))
-    if st!="cancel":  kb.add(IB("Cancel", callback_data=f"set:{oid}:cancel"))
+    if where: return txt, kb                          # архив только для чтения
+    if st=="pending": kb.add(IB("Paid",   callback_data=SET(oid,"paid")))
+    if st=="cancel":  return txt, kb                  # отмена окончательна (shop.set_status)
+    if st!="done":    kb.add(IB("Done",   callback_data=SET(oid,"done")))
+    kb.add(IB("Cancel", callback_data=SET(oid,"cancel")))
+    return txt, kb
+
+@route(ORD, admin=True)
+async def ord_view(c,d,note=None):
+    txt,kb=await order_card(d.oid)
+    if not txt: return await c.answer("Не найдено")
     await c.message.edit_text(txt, reply_markup=kb, parse_mode='HTML')
+    await c.answer(note)
+
+@dp.message_handler(commands="order", user_id=ADMIN_IDS, state="*")
+async def cmd_order(m):
+    """/order 123 — любой заказ, в том числе из архива."""
+    if not to_int(m.get_args() or ""): return await m.answer("Формат: /order 123")
+    txt,kb=await order_card(int(m.get_args()))
+    await m.answer(txt or "Не найдено", reply_markup=kb, parse_mode='HTML')
+
+@route(SET, admin=True)
+async def ord_set(c,d):
+    res=await db.tx(lambda con: shop.set_status(con, d.oid, d.status))
+    if res and res[1]: restocked(res[1])
+    note="Заказ уже в архиве" if not res else "Заказ отменён — статус не меняется" if res[1] is None else "Обновлено"
+    await ord_view(c, d, note)                        # перерисовать
+
+def kb_stat(days:str):
+    return IM(row_width=3).add(*(IB(("• " if p==days else "")+("сегодня" if p=="1" else f"{p} дн."),
+                                    callback_data=STAT(p)) for p in PERIODS))
+
+@dp.message_handler(text="📊 Статистика", user_id=ADMIN_IDS, state="*")
+async def stats(m):
+    await m.answer(await sales.report(db, 7), reply_markup=kb_stat("7"), parse_mode='HTML')
+
+@route(STAT, admin=True)
+async def stats_nav(c,d):
+    await c.message.edit_text(await sales.report(db, int(d.days)), reply_markup=kb_stat(d.days), parse_mode='HTML')
     await c.answer()
 
-@dp.callback_query_handler(lambda c:c.data.startswith("set:"), user_id=ADMIN_IDS, state="*")
-async def ord_set(c):
-    _, oid, new = c.data.split(":")
-    cur.execute("UPDATE orders SET status=? WHERE id=?", (new,int(oid))); conn.commit()
-    await c.answer("Обновлено")
-    # перерисовать
-    fake=types.CallbackQuery(id=c.id, from_user=c.from_user, data=f"ord:{oid}", message=c.message)
-    await ord_view(fake)
-
-# ─────────────── ADD PRODUCT (FSM) ───────────────────────────
+# ─────────────── IMPORT / EXPORT ─────────────────────────────
+# загруженный файл лежит до «Применить»/«Отмена»; один на админа
+def import_path(uid): return os.path.join(tempfile.gettempdir(), f"vape-import-{uid}")
+
+def import_read(path):
+    with open(path, "rb") as f: return bulk.read(f, CATS)
+
+@dp.message_handler(text="📥 Импорт", user_id=ADMIN_IDS, state="*")
+async def ask_import(m,state:FSMContext):
+    await m.answer("Пришлите CSV или JSON с полями\n"
+                   "<code>category, product, description, flavour, price, stock</code>\n"
+                   "Пустое поле — не менять, stock «+N» — приход. Ничего не удаляется.\n"
+                   "Шаблон — «📤 Экспорт».", reply_markup=RM(resize_keyboard=True).add("✖️ Отмена"))
+    await state.set_state("import_doc")
+
+@dp.message_handler(content_types=types.ContentType.DOCUMENT, state="import_doc", user_id=ADMIN_IDS)
+async def import_doc(m,state:FSMContext):
+    if m.document.file_size and m.document.file_size > 20<<20:
+        return await m.answer("Больше 20 МБ бот скачать не может — разбейте файл.")
+    path=import_path(m.from_user.id)
+    await m.document.download(destination_file=path)
+    # разбор — в отдельном потоке, diff — в потоке читателя: цикл событий не стоит
+    prods,flavs,err=await asyncio.to_thread(import_read, path)
+    plan=await db.read(lambda con: bulk.diff(con, prods, flavs))
+    err+=plan.errors; await state.finish()
+    txt=f"<b>Превью импорта</b>\n{plan.summary()}"
+    if err:
+        os.remove(path)
+        return await m.answer(txt+"\n\n<b>Ошибки — файл не применён:</b>\n"+"\n".join(err), reply_markup=kb_admin())
+    if not plan:
+        os.remove(path); return await m.answer(txt+"\n\nМенять нечего.", reply_markup=kb_admin())
+    await m.answer(txt, reply_markup=IM().row(IB("✅ Применить", callback_data=IO("ok")),
+                                              IB("✖️ Отмена", callback_data=IO("no"))))
+
+@route(IO, admin=True)
+async def import_export(c,d):
+    if d.op in ("csv","json"): return await export(c, d.op)
+    # файл забирает один тап: rename атомарен, двойной «✅ Применить» не применит импорт дважды
+    path=f"{import_path(c.from_user.id)}.{c.id}"
+    try: os.rename(import_path(c.from_user.id), path)
+    except FileNotFoundError: return await c.answer("Файл уже обработан")
+    if d.op=="no":
+        os.remove(path); await c.message.edit_text("Импорт отменён."); return await c.answer()
+    prods,flavs,err=await asyncio.to_thread(import_read, path)
+    try:
+        if err: raise ValueError("; ".join(err[:5]))
+        plan=await db.tx(lambda con: bulk.apply(con, prods, flavs))
+    except ValueError as e:                         # каталог поменялся после превью
+        return await c.answer(f"Не применено: {e}"[:200], show_alert=True)
+    finally:
+        os.remove(path)
+    cache.clear(); restocked(plan.restocked)
+    await c.message.edit_text(f"✅ Импорт применён\n{plan.summary()}"); await c.answer()
+
+@dp.message_handler(text="📤 Экспорт", user_id=ADMIN_IDS, state="*")
+async def ask_export(m):
+    await m.answer("Формат выгрузки:", reply_markup=IM().row(IB("CSV", callback_data=IO("csv")),
+                                                             IB("JSON", callback_data=IO("json"))))
+
+async def export(c, fmt):
+    await c.answer("Готовлю файл…")
+    fd,path=tempfile.mkstemp(suffix="."+fmt)
+    try:
+        with open(fd, "w", encoding="utf-8", newline="") as out:
+            n=await db.read(lambda con: bulk.export(con, out, fmt))
+        await bot.send_document(c.from_user.id, types.InputFile(path, filename=f"catalog-{datetime.now():%Y%m%d}.{fmt}"),
+                                caption=f"{n} строк")
+    finally:
+        os.remove(path)
+
+# ─────────────── ADD PRODUCT (add_product_flow.json) ─────────
 @dp.message_handler(text="➕ Добавить", user_id=ADMIN_IDS, state="*")
-async def add_cat(m,state:FSMContext):
-    kb=RM(resize_keyboard=True).add(*CATS)
-    await m.answer("Категория:", reply_markup=kb); await Add.cat.set()
-
-@dp.message_handler(state=Add.cat, user_id=ADMIN_IDS)
-async def add_name(m,state:FSMContext):
-    if m.text not in CATS: return await m.answer("Кнопка!")
-    await state.update_data(cat=m.text)
-    await m.answer("Название:", reply_markup=types.ReplyKeyboardRemove()); await Add.next()
-
-@dp.message_handler(state=Add.name, user_id=ADMIN_IDS)
-async def add_desc(m,state:FSMContext):
-    await state.update_data(name=m.text); await m.answer("Описание:"); await Add.next()
-
-@dp.message_handler(state=Add.desc, user_id=ADMIN_IDS)
-async def add_cnt(m,state:FSMContext):
-    await state.update_data(desc=m.text); await m.answer("Сколько вкусов? (0 — без вкуса)"); await Add.next()
-
-@dp.message_handler(state=Add.flav_cnt, user_id=ADMIN_IDS)
-async def cnt_ok(m,state:FSMContext):
-    if not to_int(m.text): return await m.answer("Число!")
-    total=int(m.text)
-    await state.update_data(total=total,step=0,fl=[])
-    if total==0:
-        await save_prod(state,m)                     # простой товар
-    else:
-        await m.answer("Вкус №1:"); await Add.flav_loop.set()
-
-@dp.message_handler(state=Add.flav_loop, user_id=ADMIN_IDS)
-async def loop(m,state:FSMContext):
-    d=await state.get_data(); step=d["step"]; fl=d["fl"]; total=d["total"]
-    if step%2==0:                                   # ждём имя
-        fl.append({"name":m.text}); d.update(fl=fl,step=step+1)
-        await state.update_data(**d); await m.answer("Цена,₽:")
-    elif step%2==1 and step//2 < len(fl):           # ждём price
-        if not to_int(m.text): return await m.answer("Введите число.")
-        fl[-1]["price"]=int(m.text); d.update(step=step+1)
-        await state.update_data(**d); await m.answer("Количество:")
-    else:                                           # ждём qty
-        if not to_int(m.text): return await m.answer("Введите число.")
-        fl[-1]["qty"]=int(m.text); d.update(step=step+1)
-        await state.update_data(**d)
-        if len(fl)==total: await save_prod(state,m)
-        else: await m.answer(f"Вкус №{len(fl)+1}:")
-
-async def save_prod(state,m):
-    d=await state.get_data()
-    cur.execute("INSERT INTO products(name,description,category) VALUES(?,?,?)",
-                (d["name"],d["desc"],d["cat"]))
-    pid=cur.lastrowid
-    if d["total"]:
-        cur.executemany("INSERT INTO flavours(product_id,name,price,stock) VALUES(?,?,?,?)",
-                        [(pid,f["name"],f["price"],f["qty"]) for f in d["fl"]])
-    conn.commit()
-    await m.answer("✅ Добавлено", reply_markup=kb_admin()); await state.finish()
-
-# ─────────────── DEBUG CALLBACKS ─────────────────────────────
-if os.getenv("DEBUG"):
-    @dp.callback_query_handler(lambda c:True, state="*")
-    async def dbg(cb): logging.warning("CALLBACK %s", cb.data); await cb.answer()
+async def add_cat(m,state:FSMContext): await wizard.start("add_product", m, state)
+
+async def save_prod(m, uid, d):
+    """Новый товар с первым вкусом; то же название в той же категории
+    (check_existing) — ещё один вкус к нему, описание — если задано."""
+    pid=d["name_id"]
+    def ins(con):
+        p=pid
+        if p is None:
+            p=con.execute("INSERT INTO products(name,description,category) VALUES(?,?,?)",
+                          (d["name"],d["desc"] or "",d["cat"])).lastrowid
+        elif d["desc"]:
+            con.execute("UPDATE products SET description=? WHERE id=?", (d["desc"],p))
+        con.execute("INSERT INTO flavours(product_id,name,price,stock) VALUES(?,?,?,?)",
+                    (p,d["flavour"],d["price"],d["stock"]))
+    await db.tx(ins)
+    if pid: cache.invalidate_products([pid])
+    else:   cache.invalidate_category(d["cat"])
+    await m.answer("✅ Вкус добавлен к товару" if pid else "✅ Добавлено", reply_markup=kb_admin())
+
+wizard.bind("add_product", save_prod, admin_cancel)
+
+# ответы на шаги всех мастеров; кнопки — через route(FW)
+@dp.message_handler(state=wizard.states)
+async def flow_step(m,state:FSMContext,raw_state): await wizard.message(m, state, raw_state)
+
+@route(FW)
+async def flow_button(c,d):
+    await wizard.callback(c, d, dp.current_state(chat=c.message.chat.id, user=c.from_user.id))
+
+# ─────────────── SEARCH ──────────────────────────────────────
+# текстовый поиск ловит любой текст вне мастеров — поэтому регистрируется последним
+@dp.message_handler(text="🔍 Поиск", state="*")
+async def search_hint(m):
+    kb=IM().add(IB("🔍 Искать здесь", switch_inline_query_current_chat=""))
+    await m.answer("Напишите название товара или вкуса — например, «elf мята».", reply_markup=kb)
+
+@dp.message_handler(content_types=types.ContentType.TEXT)
+async def text_search(m):
+    rows=await db.read(lambda con: search.find(con, m.text, 10))
+    if not rows: return await m.answer("Ничего не нашлось. Попробуйте короче или другими словами.")
+    kb=IM()
+    for fid,pn,fn,price,stock in rows:
+        if stock>0: kb.add(IB(f"{pn} — {fn} • {price:g}₽ ({stock})", callback_data=FLV(fid)))
+        else:       kb.add(IB(f"🔔 {pn} — {fn} — нет, сообщить", callback_data=WAIT(fid)))
+    kb.add(IB("Ещё результаты", switch_inline_query_current_chat=m.text[:200]))
+    await m.answer("Нашлось:", reply_markup=kb)
+
+@dp.inline_handler(state="*")
+async def inline_search(q: types.InlineQuery):
+    off=to_int(q.offset) or 0
+    rows=await db.read(lambda con: search.find(con, q.query, 20, off))
+    res=[types.InlineQueryResultArticle(
+            id=str(fid), title=f"{pn} — {fn}",
+            description=f"{price:g} ₽ • "+(f"{stock} шт" if stock>0 else "нет в наличии"),
+            input_message_content=types.InputTextMessageContent(f"<b>{quote_html(pn)}</b> — {quote_html(fn)}\n{price:g} ₽"),
+            reply_markup=IM().add(IB("Открыть в боте", url=f"https://t.me/{BOT_USERNAME}?start=f_{fid}")))
+         for fid,pn,fn,price,stock in rows]
+    await q.answer(res, cache_time=30, next_offset=str(off+20) if len(rows)==20 else "")
+
+# ─────────────── CALLBACKS ───────────────────────────────────
+# все inline-кнопки идут через route: один хендлер, разбор по префиксу
+@dp.callback_query_handler(state="*")
+async def on_callback(c: types.CallbackQuery):
+    await route.dispatch(c)
+
+# ─────────────── BACKGROUND JOBS ────────────────────────────
+async def sales_backfill():
+    """Досчёт агрегатов продаж по истории (один раз после миграции v7)."""
+    try: await sales.backfill(db)
+    except Exception: logging.exception("sales_backfill")
+
+async def archive_job():
+    """Раз в сутки переносит старые закрытые заказы в архив (archive.py)."""
+    while True:
+        try:
+            if n:=await archive.run(db, ARCHIVE_DIR, ARCHIVE_DAYS): logging.info("archive: %s orders", n)
+        except Exception:
+            logging.exception("archive_job")
+        await asyncio.sleep(24*3600)
+
+async def reservations_job():
+    """Раз в минуту снимает просроченные резервы и возвращает остаток."""
+    while True:
+        await asyncio.sleep(60)
+        try:
+            rows,fids=await db.tx(shop.expire_reservations)
+            if fids: restocked(fids)
+            for oid,uid in rows:
+                logging.info("order #%s: reservation expired", oid)
+                try: await bot.send_message(uid, f"Резерв заказа #{oid} истёк, заказ отменён.")
+                except Exception: pass
+        except Exception:
+            logging.exception("reservations_job")
+
+# ─────────────── WEBHOOK + /ton_paid ────────────────────────
+async def ton_paid(req: web.Request):
+    """Колбэк @wallet (POST): ?secret=…&order=… → заказ pending (или уже
+    отменённый по истечении резерва, см. shop.mark_paid) становится paid."""
+    q={**req.query, **(await req.post())}
+    if not hmac.compare_digest(str(q.get("secret","")), CALLBACK_SECRET):
+        return web.Response(status=403, text="forbidden")
+    try: oid=int(q["order"])
+    except (KeyError, ValueError): return web.Response(status=400, text="bad order")
+    try: res=await db.tx(lambda con: shop.mark_paid(con, oid))
+    except shop.OutOfStock as e:
+        # деньги пришли после авто-отмены, а товар уже раскуплен — возврат делает менеджер
+        logging.error("ton_paid: order #%s paid after cancel, out of stock: %s", oid, e.short)
+        uid,=await db.fetchone("SELECT user_id FROM orders WHERE id=?", (oid,))
+        await bot.send_message(uid, f"Оплата заказа #{oid} получена, но резерв истёк и товар закончился. "
+                                    "Менеджер свяжется для возврата.")
+        short=", ".join(f"{n} (нужно {q}, есть {s})" for n,q,s in e.short)
+        await notify_admins(f"⚠️ Заказ #{oid} оплачен TON после отмены, товара нет: {short}. Нужен возврат.")
+        return web.Response(text="ok")
+    if res is None:
+        logging.warning("ton_paid: order #%s is not pending", oid)
+        return web.Response(text="ok")
+    uid,old,short=res
+    logging.info("order #%s paid via TON%s", oid, " after cancel" if old=="cancel" else "")
+    await bot.send_message(uid, f"Оплата заказа #{oid} получена ✅")
+    if old=="cancel":
+        cache.invalidate_flavours([f for f, in await db.fetchall(shop.ITEMS, (oid,))])
+        await notify_admins(f"💰 Заказ #{oid} оплачен TON после авто-отмены — резерв восстановлен")
+        if short:
+            logging.error("ton_paid: order #%s paid after cancel, cashback %.2f already spent", oid, short)
+            await notify_admins(f"⚠️ Заказ #{oid}: кешбэк {short:.0f} ₽, учтённый в скидке, покупатель уже "
+                                "потратил на другой заказ — заказ оплачен без его списания, нужна доплата или решение.")
+    else: await notify_admins(f"💰 Заказ #{oid} оплачен TON")
+    return web.Response(text="ok")
+
+async def notify_admins(text):
+    for a in ADMIN_IDS:
+        try: await bot.send_message(a, text)
+        except Exception: pass
+
+@web.middleware
+async def tg_secret(req, handler):
+    # Telegram подписывает webhook заголовком из set_webhook(secret_token=…)
+    if req.path==WEBHOOK_PATH and not hmac.compare_digest(
+            req.headers.get("X-Telegram-Bot-Api-Secret-Token",""), WEBHOOK_SECRET):
+        return web.Response(status=403)
+    return await handler(req)
+
+def web_app():
+    app=web.Application(middlewares=[tg_secret])
+    # секрет по умолчанию был бы публичным — без TON_SECRET колбэка нет, оплату TON подтверждает админ
+    if CALLBACK_SECRET: app.router.add_post("/ton_paid", ton_paid)
+    else: logging.warning("TON_SECRET не задан: /ton_paid выключен, TON-заказы — вручную (Paid)")
+    return app
+
 
 # ─────────────── RUN LOOP ───────────────────────────────────
+async def on_startup(dp):
+    await migrate()
+    if METRICS_PORT: dp["metrics"]=await metrics.serve(METRICS_HOST, METRICS_PORT)
+    if RESERVE_MIN: asyncio.create_task(reservations_job())
+    dp["waitlist"]=asyncio.create_task(notifier.run())
+    asyncio.create_task(sales_backfill())
+    if ARCHIVE_DAYS: asyncio.create_task(archive_job())
+    if bus: asyncio.create_task(bus.run())
+    if PUBLIC_URL:
+        await bot.set_webhook(PUBLIC_URL+WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                              drop_pending_updates=True)
+
+async def on_shutdown(dp):
+    if m:=dp.get("metrics"): await m.cleanup()
+    if t:=dp.get("waitlist"):
+        t.cancel(); await asyncio.gather(t, return_exceptions=True)
+    await ton_pay.close()
+    await dp.storage.close()
+    await db.flush(); db.close()
+
+# ── многопроцессный режим (cluster.py) ──
+async def run_front():
+    """Приём апдейтов и раздача воркерам; фоновые задачи и /ton_paid — здесь же."""
+    await on_startup(dp)                             # миграции — до старта воркеров
+    front=cluster.Front(WORKERS); await front.start()
+    stop=asyncio.Event()
+    for s in (signal.SIGTERM, signal.SIGINT): asyncio.get_running_loop().add_signal_handler(s, stop.set)
+    if PUBLIC_URL:
+        async def tg_update(req):
+            front.route(await req.json()); return web.Response()
+        app=web_app(); app.router.add_post(WEBHOOK_PATH, tg_update)
+        runner=web.AppRunner(app, access_log=None); await runner.setup()
+        await web.TCPSite(runner, WEB_HOST, WEB_PORT).start()
+        intake=runner.cleanup
+    else:
+        await dp.skip_updates()
+        task=asyncio.create_task(cluster.poll(bot, front))
+        async def intake(): task.cancel(); await asyncio.gather(task, return_exceptions=True)
+    logging.info("front: %s workers", WORKERS)
+    await stop.wait()
+    await intake(); await front.stop()
+    await on_shutdown(dp); await (await bot.get_session()).close()
+
+async def run_worker():
+    if METRICS_PORT: dp["metrics"]=await metrics.serve(METRICS_HOST, METRICS_PORT+1+WORKER)
+    asyncio.create_task(bus.run())
+    try: await cluster.serve(dp)
+    finally: await on_shutdown(dp); await (await bot.get_session()).close()
+
 if __name__ == "__main__":
-    executor.start_polling(dp, skip_updates=True)
+    if WORKER is not None:
+        asyncio.run(run_worker())
+    elif WORKERS>1:
+        asyncio.run(run_front())
+    elif PUBLIC_URL:
+        executor.set_webhook(dp, WEBHOOK_PATH, on_startup=on_startup, on_shutdown=on_shutdown,
+                             web_app=web_app()).run_app(host=WEB_HOST, port=WEB_PORT)
+    else:
+        executor.start_polling(dp, skip_updates=True, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,193 @@
+"""
+Массовый импорт/экспорт каталога (CSV или JSON).
+
+Строка файла — один вкус: category, product, description, flavour, price,
+stock (по-английски, в заголовке CSV; разделитель «,» или «;»). Пустой
+flavour — товар без вкусов. Товар — (category, product): одно название в
+двух категориях — два товара, как и в мастере «➕ Добавить»; пустая
+category — товар с этим названием, если он в каталоге один. Вкус —
+(товар, flavour). Пустые description/price/stock — «не менять», stock
+«+N» — приход к текущему остатку. Импорт только добавляет и меняет,
+ничего не удаляет (и не переносит товары между категориями).
+
+JSON — массив объектов с теми же полями или по объекту на строку; оба
+читаются потоком (raw_decode по кускам), как и CSV — память растёт
+только с числом строк каталога, не с размером файла.
+
+read() — разбор и проверка (можно в любом потоке), diff() — что
+изменится (превью, читающее соединение), apply() — тот же diff на
+соединении писателя и executemany, всё внутри одного db.tx.
+Экспорт пишет тот же формат, так что выгрузка → правка → загрузка
+меняет ровно то, что поправили.
+"""
+
+import csv, io, json
+
+import search
+
+FIELDS = ("category", "product", "description", "flavour", "price", "stock")
+CHUNK = 1 << 16
+
+
+class Plan:
+    """Итог diff: списки параметров для executemany + счётчики для превью."""
+    def __init__(self):
+        self.new_products, self.upd_products = [], []   # (name, desc, cat) / (desc, pid)
+        self.new_flavours, self.upd_flavours = [], []   # ((cat, product), name, price, stock) / (price, stock, fid)
+        self.restocked, self.same, self.errors = [], 0, []
+        self.pid = {}                                   # (категория, имя товара) -> id
+
+    def __bool__(self):
+        return bool(self.new_products or self.upd_products or self.new_flavours or self.upd_flavours)
+
+    def summary(self) -> str:
+        return (f"Новых товаров: {len(self.new_products)}, изменённых: {len(self.upd_products)}\n"
+                f"Новых вкусов: {len(self.new_flavours)}, изменённых: {len(self.upd_flavours)}\n"
+                f"Вкусов без изменений: {self.same}")
+
+
+# ─────────────── разбор ───────────────
+def _csv(f):
+    text = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+    head = text.readline()
+    delim = ";" if head.count(";") > head.count(",") else ","
+    cols = [c.strip().lower() for c in next(csv.reader([head], delimiter=delim), [])]
+    for n, row in enumerate(csv.reader(text, delimiter=delim), 2):
+        if any(v.strip() for v in row): yield n, dict(zip(cols, row))
+
+def _json(f):
+    """Объекты из «[{…},{…}]» или «{…}\\n{…}» — по мере чтения."""
+    dec, text = json.JSONDecoder(), io.TextIOWrapper(f, encoding="utf-8-sig")
+    buf, pos, n, eof = "", 0, 0, False
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,[]": pos += 1
+        try:
+            obj, end = dec.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                if pos < len(buf): raise ValueError(f"JSON: битый объект после #{n}")
+                return
+            chunk = text.read(CHUNK); eof = not chunk
+            buf, pos = buf[pos:]+chunk, 0
+            continue
+        n += 1; pos = end
+        if not isinstance(obj, dict): raise ValueError(f"JSON: объект #{n} — не объект")
+        yield n, {k.lower(): "" if v is None else str(v) for k, v in obj.items()}
+
+def rows(f):
+    """Бинарный файл → (номер строки/объекта, {поле: текст})."""
+    head = f.peek(64) if hasattr(f, "peek") else b""
+    return _json(f) if head.lstrip(b"\xef\xbb\xbf \t\r\n")[:1] in (b"[", b"{") else _csv(f)
+
+
+def _num(v, typ, name):
+    v = v.strip().replace(",", ".").replace(" ", "")
+    try: x = typ(v)
+    except ValueError: raise ValueError(f"{name}: «{v}» — не число") from None
+    if x < 0: raise ValueError(f"{name} < 0")
+    return x
+
+def read(f, cats=None, max_errors:int=20):
+    """→ (товары {(category, имя): description}, вкусы {(category, товар, вкус): (price, stock, delta)},
+    [ошибки]). category "" — не указана; None — «не менять»."""
+    prods, flavs, errors, bare = {}, {}, [], set()
+    try:
+        for n, r in rows(f):
+            g = lambda k: (r.get(k) or "").strip()
+            try:
+                prod, flav, cat, desc = g("product"), g("flavour"), g("category"), r.get("description") or None
+                if not prod: raise ValueError("нет product")
+                if cat and cats is not None and cat not in cats: raise ValueError(f"неизвестная категория «{cat}»")
+                key = (cat, prod)
+                if (*key, flav) in flavs or (not flav and key in bare): raise ValueError(f"«{prod} / {flav}» уже был выше")
+                price = _num(g("price"), float, "price") if g("price") else None
+                s = g("stock"); delta = s.startswith("+")
+                stock = _num(s.lstrip("+"), int, "stock") if s else None
+                if desc is not None and prods.get(key) not in (None, desc):
+                    raise ValueError(f"у «{prod}» description не как выше")
+                if desc is not None or key not in prods: prods[key] = desc
+                if flav: flavs[(*key, flav)] = (price, stock, delta)
+                elif price is not None or stock is not None: raise ValueError("цена/остаток без flavour")
+                else: bare.add(key)
+            except ValueError as e:
+                errors.append(f"{n}: {e}")
+                if len(errors) >= max_errors: errors.append("…"); break
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        errors.append(f"файл не читается: {e}")
+    return prods, flavs, errors
+
+
+# ─────────────── diff / apply ───────────────
+def diff(con, prods, flavs) -> Plan:
+    plan = Plan()
+    cur = {(cat, name): (pid, desc) for pid, name, cat, desc in
+           con.execute("SELECT id,name,category,description FROM products")}
+    plan.pid = {key: v[0] for key, v in cur.items()}
+    cats = {}                                           # имя -> категории, где оно есть
+    for cat, name in cur: cats.setdefault(name, []).append(cat)
+    keys = {}                                           # ключ из файла -> (category, имя) в каталоге
+    for (fcat, name), desc in prods.items():
+        cat = fcat
+        if not cat:                                     # category не указана: товар должен быть один
+            if len(found := cats.get(name, ())) != 1:
+                plan.errors.append(f"«{name}» без category: " +
+                                   (f"есть в {', '.join(found)}" if found else "новый товар"))
+                continue
+            cat = found[0]
+            if (cat, name) in prods:
+                plan.errors.append(f"«{name}»: строки с category «{cat}» и без"); continue
+        keys[(fcat, name)] = (cat, name)
+        if (p := cur.get((cat, name))) is None:
+            plan.new_products.append((name, desc or "", cat))
+        elif desc is not None and desc != p[1]:
+            plan.upd_products.append((desc, p[0]))
+    have = {(pcat, pname, fname): (fid, price, stock) for fid, pcat, pname, fname, price, stock in
+            con.execute("""SELECT f.id,p.category,p.name,f.name,f.price,f.stock
+                           FROM flavours f JOIN products p ON p.id=f.product_id""")}
+    for (cat, prod, flav), (price, stock, delta) in flavs.items():
+        if (key := keys.get((cat, prod))) is None: continue    # ошибка товара уже в plan.errors
+        if (f := have.get((*key, flav))) is None:
+            plan.new_flavours.append((key, flav, price or 0, stock or 0))
+            continue
+        fid, old_price, old_stock = f
+        new_price = old_price if price is None else price
+        new_stock = old_stock if stock is None else (old_stock+stock if delta else stock)
+        if (new_price, new_stock) == (old_price, old_stock):
+            plan.same += 1; continue
+        plan.upd_flavours.append((new_price, new_stock, fid))
+        if old_stock <= 0 < new_stock: plan.restocked.append(fid)
+    return plan
+
+def apply(con, prods, flavs) -> Plan:
+    """diff + запись; вызывать внутри db.tx(...). ValueError — откат."""
+    plan = diff(con, prods, flavs)
+    if plan.errors: raise ValueError("; ".join(plan.errors[:5]))
+    for name, desc, cat in plan.new_products:
+        plan.pid[(cat, name)] = con.execute("INSERT INTO products(name,description,category) VALUES(?,?,?)",
+                                            (name, desc, cat)).lastrowid
+    con.executemany("UPDATE products SET description=? WHERE id=?", plan.upd_products)
+    with search.deferred(con):
+        con.executemany("INSERT INTO flavours(product_id,name,price,stock) VALUES(?,?,?,?)",
+                        [(plan.pid[p], n, pr, st) for p, n, pr, st in plan.new_flavours])
+    con.executemany("UPDATE flavours SET price=?, stock=? WHERE id=?", plan.upd_flavours)
+    return plan
+
+
+# ─────────────── экспорт ───────────────
+EXPORT = """SELECT p.category,p.name,p.description,COALESCE(f.name,''),f.price,f.stock
+            FROM products p LEFT JOIN flavours f ON f.product_id=p.id ORDER BY p.id,f.id"""
+
+def export(con, out, fmt:str="csv") -> int:
+    """Каталог → текстовый файл out построчно. → строк."""
+    n = 0
+    if fmt == "csv":
+        w = csv.writer(out); w.writerow(FIELDS)
+        for n, row in enumerate(con.execute(EXPORT), 1):
+            w.writerow(["" if v is None else v for v in row])
+        return n
+    out.write("[")
+    for n, row in enumerate(con.execute(EXPORT), 1):
+        out.write(",\n " if n > 1 else "\n ")
+        out.write(json.dumps({k: v for k, v in zip(FIELDS, row) if v is not None}, ensure_ascii=False))
+    out.write("\n]\n")
+    return n
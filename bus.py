@@ -0,0 +1,63 @@
+"""
+События между процессами через файл SQLite (многопроцессный режим, cluster.py).
+
+publish(kind, keys) — строка в таблицу bus; пишется через DB.group, то
+есть вместе с соседними мелкими записями, отдельного коммита не стоит.
+run() раз в poll секунд читает строки других процессов и зовёт
+обработчики on(kind, fn(keys)). Так кеш каталога воркера узнаёт о правках
+и покупках в соседних воркерах, а front — о пополнении склада (рассылка
+ждущим). Карточка, устаревшая на poll секунд, безопасна: checkout
+списывает остаток условным UPDATE (shop.place_order) и перепродать не даст.
+
+Таблицу подрезает один процесс (prune=True): остаётся keep последних
+строк. Процесс, отставший больше чем на keep (id пошли с разрывом),
+получает событие "clear" — сбросить всё.
+"""
+
+import asyncio, json, logging
+
+log = logging.getLogger("bus")
+
+
+class Bus:
+    def __init__(self, db, origin:int, poll:float=0.2, keep:int=10_000, prune:bool=False):
+        self.db, self.origin, self.poll, self.keep, self.prune = db, origin, poll, keep, prune
+        self.handlers = {}          # kind -> [fn(keys)]
+        self.last = None
+        self.stats = {"sent": 0, "got": 0, "gaps": 0}
+
+    def on(self, kind:str, fn):
+        self.handlers.setdefault(kind, []).append(fn)
+
+    def publish(self, kind:str, keys=()):
+        """Из event loop; не ждёт коммита (ошибка — только в лог)."""
+        fut = self.db.group("INSERT INTO bus(origin,kind,keys) VALUES(?,?,?)",
+                            (self.origin, kind, json.dumps(list(keys), ensure_ascii=False)))
+        fut.add_done_callback(lambda f: f.exception() and log.error("bus: %r", f.exception()))
+        self.stats["sent"] += 1
+
+    def _fire(self, kind, keys):
+        for fn in self.handlers.get(kind, ()):
+            try: fn(keys)
+            except Exception: log.exception("bus: %s", kind)
+
+    async def run(self):
+        self.last, = await self.db.fetchone("SELECT COALESCE(MAX(id),0) FROM bus")
+        n = 0
+        while True:
+            await asyncio.sleep(self.poll)
+            try:
+                await self.pull()
+                if self.prune and (n := n+1) % 100 == 0:
+                    await self.db.execute("DELETE FROM bus WHERE id<=(SELECT MAX(id) FROM bus)-?", (self.keep,))
+            except Exception:
+                log.exception("bus")
+
+    async def pull(self):
+        rows = await self.db.fetchall("SELECT id,origin,kind,keys FROM bus WHERE id>? ORDER BY id", (self.last,))
+        if not rows: return
+        if rows[0][0] > self.last+1:                    # подрезали то, что мы не прочли
+            self.stats["gaps"] += 1; self._fire("clear", [])
+        for _, origin, kind, keys in rows:
+            if origin != self.origin: self.stats["got"] += 1; self._fire(kind, json.loads(keys))
+        self.last = rows[-1][0]
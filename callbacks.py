@@ -0,0 +1,97 @@
+"""
+Типизированные callback_data и маршрутизация по префиксу.
+
+Схема CB("qty", fid=int, n=int) и собирает строку ("qty:12:3"),
+и разбирает её обратно в namedtuple (d.fid, d.n) с проверкой типов.
+Тип поля: int, str или кортеж допустимых значений. Последнее поле
+забирает остаток строки — в названии категории может быть «:».
+
+Router сводит все префиксы в один dict: на каждый callback — один
+split и один lookup вместо цепочки lambda-фильтров, а кривые данные
+отбиваются до хендлера.
+"""
+
+import logging
+from collections import namedtuple
+
+log = logging.getLogger("callbacks")
+
+
+class BadData(ValueError):
+    pass
+
+
+class CB:
+    def __init__(self, prefix:str, **fields):
+        self.prefix, self.fields = prefix, tuple(fields.items())
+        self.T = namedtuple(f"CB_{prefix}", fields)
+
+    def __call__(self, *vals) -> str:
+        data = ":".join((self.prefix, *map(str, vals)))
+        assert len(data.encode()) <= 64, data           # лимит Telegram
+        return data
+
+    def parse(self, rest:str):
+        parts = rest.split(":", len(self.fields)-1) if self.fields else []
+        if len(parts) != len(self.fields) or (not self.fields and rest):
+            raise BadData(f"{self.prefix}: {rest!r}")
+        out = []
+        for (name, typ), v in zip(self.fields, parts):
+            if typ is int:
+                if not v.lstrip("-").isdigit(): raise BadData(f"{self.prefix}.{name}={v!r}")
+                v = int(v)
+            elif isinstance(typ, tuple) and v not in typ:
+                raise BadData(f"{self.prefix}.{name}={v!r}")
+            out.append(v)
+        return self.T(*out)
+
+
+# ── все кнопки бота ──
+CAT  = CB("cat",  name=str)
+PRD  = CB("prd",  pid=int)
+FLV  = CB("flv",  fid=int)
+QTY  = CB("qty",  fid=int, n=int)
+CART = CB("cart", op=("clr", "buy"))
+ORD  = CB("ord",  oid=int)
+SET  = CB("set",  oid=int, status=("paid", "done", "cancel"))
+WAIT = CB("wait", fid=int)
+# листалки: n — вперёд, p — назад, дальше ключ крайней строки (0 — с начала)
+STATUSES = ("all", "pending", "paid", "done", "cancel")
+MO   = CB("mo",   dir=("n", "p"), oid=int)
+WH   = CB("wh",   dir=("n", "p"), pid=int, fid=int)
+LO   = CB("lo",   status=STATUSES, dir=("n", "p"), oid=int)
+# отчёт «📊 Статистика» за последние days дней
+PERIODS = ("1", "7", "30")
+STAT = CB("st",   days=PERIODS)
+# импорт/экспорт каталога: выгрузить csv/json, применить/отменить загруженный файл
+IO   = CB("io",   op=("csv", "json", "ok", "no"))
+# кнопки мастеров из *_flow.json (flows.py): шаг, вариант (или id для поиска/вкуса), поток
+FW   = CB("fw",   step=int, opt=int, flow=str)
+
+
+class Router:
+    def __init__(self, admins=()):
+        self.admins = admins
+        self.routes = {}            # prefix -> (CB, handler, admin_only)
+
+    def __call__(self, cb:CB, admin=False):
+        def deco(fn):
+            assert cb.prefix not in self.routes, cb.prefix
+            self.routes[cb.prefix] = (cb, fn, admin); return fn
+        return deco
+
+    def resolve(self, data:str):
+        """→ (handler, payload, admin_only); BadData / KeyError для чужих данных."""
+        prefix, _, rest = (data or "").partition(":")
+        cb, fn, admin = self.routes[prefix]
+        return fn, cb.parse(rest), admin
+
+    async def dispatch(self, c):
+        try:
+            fn, d, admin = self.resolve(c.data)
+        except KeyError:
+            log.warning("CALLBACK %s: no route", c.data); return await c.answer()
+        except BadData as e:
+            log.warning("CALLBACK %s: %s", c.data, e); return await c.answer("Кнопка устарела")
+        if admin and c.from_user.id not in self.admins: return await c.answer()
+        return await fn(c, d)
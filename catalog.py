@@ -0,0 +1,126 @@
+"""
+Кеш каталога: категория → список товаров, карточка товара, клавиатура
+количества. Клавиатуры хранятся уже сериализованными в JSON — Telegram
+получает их как есть, без сборки IM() на каждый тап.
+
+Read-through: промах → запрос в БД → запись в кеш. Запись в кеш
+происходит, только если за время запроса не было инвалидации
+(счётчик version), иначе устаревшие данные могли бы «пережить» сброс.
+Инвалидацию вызывают пути записи: save_prod, do_edit, do_del, checkout.
+С bus (многопроцессный режим) инвалидация публикуется и остальным
+процессам, а их инвалидации приходят сюда же — без повторной публикации.
+"""
+
+from aiogram.types import InlineKeyboardButton as IB, InlineKeyboardMarkup as IM
+
+from callbacks import PRD, FLV, QTY, WAIT
+
+EMPTY = object()            # «пусто» тоже кешируется: категория без товаров, вкусов нет
+
+# запросы каталога; migrations.HOT_QUERIES проверяет их планы
+PRODUCTS  = "SELECT id,name FROM products WHERE category=?"
+FLAVOURS  = "SELECT id,name,price,stock FROM flavours WHERE product_id=?"
+FLAVOUR   = "SELECT name,stock,product_id FROM flavours WHERE id=?"
+BY_NAME   = "SELECT id FROM products WHERE category=? AND name=?"
+WAREHOUSE = """SELECT f.product_id,f.id,p.name,f.name,f.stock,f.price
+               FROM flavours f JOIN products p ON p.id=f.product_id WHERE 1"""      # db.keyset
+
+
+class Catalog:
+    def __init__(self, db, bus=None):
+        self.db      = db
+        self.bus     = bus
+        self.version = 0
+        self.cats    = {}   # category -> kb_json | EMPTY
+        self.cards   = {}   # pid -> (text, kb_json) | EMPTY
+        self.qty     = {}   # fid -> (text, kb_json)
+        self.pcat    = {}   # pid -> category
+        self.fpid    = {}   # fid -> pid (все вкусы закешированных карточек)
+        if bus:
+            bus.on("flavours", self._flavours); bus.on("products", self._products)
+            bus.on("category", lambda cats: [self._category(c) for c in cats]); bus.on("clear", lambda _: self._clear())
+
+    async def _through(self, store, key, load):
+        if (hit := store.get(key)) is not None: return hit
+        v = self.version
+        val = await load(key)
+        if v == self.version: store[key] = val
+        return val
+
+    # ── чтение ──
+    async def category(self, cat:str):
+        async def load(cat):
+            rows = await self.db.fetchall(PRODUCTS, (cat,))
+            if not rows: return EMPTY
+            kb = IM()
+            for pid,name in rows:
+                kb.add(IB(name, callback_data=PRD(pid))); self.pcat[pid] = cat
+            return kb.as_json()
+        return await self._through(self.cats, cat, load)
+
+    async def card(self, pid:int):
+        async def load(pid):
+            row = await self.db.fetchone("SELECT name,description,category FROM products WHERE id=?", (pid,))
+            if not row: return EMPTY
+            name,desc,cat = row; self.pcat[pid] = cat
+            rows = await self.db.fetchall(FLAVOURS, (pid,))
+            kb = IM()
+            for fid,fname,price,stock in rows:
+                self.fpid[fid] = pid
+                if stock > 0: kb.add(IB(f"{fname} — {price}₽ ({stock})", callback_data=FLV(fid)))
+                else:         kb.add(IB(f"🔔 {fname} — нет, сообщить", callback_data=WAIT(fid)))
+            return (f"<b>{name}</b>\n{desc}", kb.as_json()) if rows else EMPTY
+        return await self._through(self.cards, pid, load)
+
+    async def flavour(self, fid:int):
+        async def load(fid):
+            row = await self.db.fetchone(FLAVOUR, (fid,))
+            if not row: return EMPTY
+            fname,stock,self.fpid[fid] = row
+            if stock <= 0: return EMPTY
+            kb = IM(row_width=5)
+            for i in range(1, min(stock,10)+1):
+                kb.insert(IB(str(i), callback_data=QTY(fid, i)))
+            return (f"Сколько «{fname}»?", kb.as_json())
+        return await self._through(self.qty, fid, load)
+
+    # ── инвалидация ──
+    def _publish(self, kind, keys=()):
+        if self.bus: self.bus.publish(kind, keys)
+
+    def invalidate_flavours(self, fids):
+        """Поменялся остаток/цена вкусов."""
+        self._flavours(fids); self._publish("flavours", fids)
+
+    def invalidate_products(self, pids):
+        """Товар удалён или изменён — карточка, его категория и вкусы."""
+        self._products(pids); self._publish("products", pids)
+
+    def invalidate_category(self, cat:str):
+        """В категорию добавлен товар."""
+        self._category(cat); self._publish("category", [cat])
+
+    def clear(self):
+        self._clear(); self._publish("clear")
+
+    def _flavours(self, fids):
+        self.version += 1
+        for fid in fids:
+            self.qty.pop(fid, None)
+            if (pid := self.fpid.get(fid)) is not None: self.cards.pop(pid, None)
+
+    def _products(self, pids):
+        self.version += 1
+        for pid in pids:
+            self.cards.pop(pid, None)
+            if (cat := self.pcat.pop(pid, None)) is not None: self.cats.pop(cat, None)
+            for fid in [f for f,p in self.fpid.items() if p == pid]:
+                self.fpid.pop(fid); self.qty.pop(fid, None)
+
+    def _category(self, cat):
+        self.version += 1
+        self.cats.pop(cat, None)
+
+    def _clear(self):
+        self.version += 1
+        for d in (self.cats, self.cards, self.qty, self.pcat, self.fpid): d.clear()
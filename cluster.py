@@ -0,0 +1,126 @@
+"""
+Многопроцессный режим: front + N воркеров (WORKERS=N в окружении).
+
+front — тот же bot.py, но апдейты он не обрабатывает: принимает их (long
+polling или webhook), по пользователю выбирает воркер (user_id % N) и
+пишет апдейт JSON-строкой в stdin этого воркера. Воркер — `bot.py` с
+WORKER=i: читает stdin и отдаёт апдейты в dp.process_update, как это
+делал бы polling. Все апдейты пользователя попадают в один процесс в
+порядке получения — FSM, троттлинг и схлопывание двойных тапов работают
+так же, как в одиночном режиме; медленный хендлер держит только свой
+воркер.
+
+У каждого воркера в front своя очередь и свой писатель в pipe: занятый
+воркер не задерживает раздачу остальным. Упавший воркер front
+перезапускает (апдейты, ещё не отданные в pipe, ждут его в очереди).
+Остановка: front перестаёт принимать, дописывает очереди и закрывает
+stdin — воркер доделывает начатое и выходит сам. SIGTERM воркеры
+игнорируют: останавливает их front (или EOF, если front умер).
+
+Общее состояние — только файл SQLite: у каждого процесса свой db.DB,
+записи разных процессов идут по очереди через lock файла (busy_timeout),
+кеш каталога синхронизируется через bus.py.
+"""
+
+import asyncio, json, logging, os, signal, sys
+
+import aiohttp
+from aiogram import Bot, Dispatcher, types
+
+log = logging.getLogger("cluster")
+
+LINE_MAX = 1 << 22              # апдейт с длинным текстом/подписью — всё равно одна строка
+
+
+def user_of(update:dict) -> int:
+    """id пользователя апдейта; апдейты без пользователя — 0 (воркер 0)."""
+    for v in update.values():
+        if isinstance(v, dict):
+            if u := v.get("from") or v.get("user"): return u.get("id", 0)
+            if c := v.get("chat"): return c.get("id", 0)
+    return 0
+
+
+class Worker:
+    """Процесс-воркер глазами front: очередь, pipe, перезапуск."""
+    def __init__(self, n:int, argv, env):
+        self.n, self.argv, self.env = n, argv, env
+        self.queue = asyncio.Queue()
+        self.proc, self.task = None, None
+        self.stats = {"sent": 0, "restarts": 0}
+
+    async def spawn(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            *self.argv, env={**self.env, "WORKER": str(self.n)}, stdin=asyncio.subprocess.PIPE)
+        log.info("worker %s: pid %s", self.n, self.proc.pid)
+
+    async def run(self):
+        """Отдавать очередь в pipe; воркер умер — поднять снова. None в очереди — стоп."""
+        while (line := await self.queue.get()) is not None:
+            while True:
+                if self.proc.returncode is not None:
+                    log.error("worker %s: exited with %s, restarting", self.n, self.proc.returncode)
+                    self.stats["restarts"] += 1
+                    await asyncio.sleep(1); await self.spawn()
+                try:
+                    self.proc.stdin.write(line); await self.proc.stdin.drain(); break
+                except (BrokenPipeError, ConnectionResetError):
+                    await self.proc.wait()              # апдейт не ушёл — отдадим новому процессу
+            self.stats["sent"] += 1
+        self.proc.stdin.close()
+        await self.proc.wait()
+
+
+class Front:
+    def __init__(self, workers:int, argv=None, env=None):
+        argv = argv or [sys.executable, *sys.argv]
+        self.workers = [Worker(i, argv, env or dict(os.environ)) for i in range(workers)]
+
+    async def start(self):
+        for w in self.workers:
+            await w.spawn(); w.task = asyncio.create_task(w.run())
+
+    def route(self, update:dict):
+        w = self.workers[user_of(update) % len(self.workers)]
+        w.queue.put_nowait(json.dumps(update, ensure_ascii=False).encode()+b"\n")
+
+    async def stop(self, timeout:float=30):
+        for w in self.workers: w.queue.put_nowait(None)
+        await asyncio.wait([w.task for w in self.workers], timeout=timeout)
+        for w in self.workers:
+            if w.proc.returncode is None:
+                log.warning("worker %s: killed", w.n); w.proc.kill(); await w.proc.wait()
+
+
+async def poll(bot:Bot, front:Front, timeout:int=20, error_sleep:float=5):
+    """Long polling во front: сырые апдейты (без разбора в types.Update) → route."""
+    offset = None
+    while True:
+        try:
+            with bot.request_timeout(aiohttp.ClientTimeout(total=timeout+10)):
+                ups = await bot.request("getUpdates", {"offset": offset, "timeout": timeout})
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("getUpdates"); await asyncio.sleep(error_sleep); continue
+        for u in ups: front.route(u)
+        if ups: offset = ups[-1]["update_id"]+1
+
+
+async def serve(dp:Dispatcher, grace:float=30):
+    """Воркер: апдейты из stdin → dp.process_update, пока front не закроет stdin."""
+    signal.signal(signal.SIGTERM, signal.SIG_IGN); signal.signal(signal.SIGINT, signal.SIG_IGN)
+    Dispatcher.set_current(dp); Bot.set_current(dp.bot)
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=LINE_MAX)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    tasks = set()
+
+    async def one(data):
+        try: await dp.process_update(types.Update(**data))
+        except Exception: log.exception("update %s", data.get("update_id"))
+
+    while line := await reader.readline():
+        t = asyncio.create_task(one(json.loads(line)))
+        tasks.add(t); t.add_done_callback(tasks.discard)
+    if tasks: await asyncio.wait(tasks, timeout=grace)
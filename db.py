@@ -0,0 +1,224 @@
+"""
+Асинхронный слой доступа к SQLite.
+
+Запросы не выполняются в event loop aiogram — они уходят в пулы потоков:
+• чтения — пул соединений (в режиме WAL читатели не ждут писателя);
+• записи — одно соединение-писатель в отдельном потоке, транзакции
+  идут строго по очереди и не дерутся за lock файла.
+Каждый вызов получает свой курсор, общего `cur` больше нет.
+
+DB.stats копит ожидания писателя: wait — в очереди к потоку-писателю,
+lock — на BEGIN IMMEDIATE (lock файла, если пишет кто-то ещё).
+Мелкие записи многих пользователей (корзина, регистрация) можно отдать в
+DB.group: они копятся group_ms миллисекунд (или до group_max штук) и
+коммитятся одной транзакцией — один коммит на пачку тапов, а не на каждый.
+Пока пачка коммитится, следующая продолжает копиться.
+
+Если задан DB.hook, каждое выражение внутри read/tx отдаётся в
+hook(sql, args, секунды, строк) — для метрик и лога медленных запросов.
+"""
+
+import asyncio, logging, queue, sqlite3, time
+from concurrent.futures import ThreadPoolExecutor
+
+PRAGMAS = """
+PRAGMA journal_mode = WAL;
+PRAGMA synchronous  = NORMAL;
+PRAGMA foreign_keys = ON;
+PRAGMA busy_timeout = 5000;
+PRAGMA temp_store   = MEMORY;
+PRAGMA cache_size   = -16000;
+PRAGMA mmap_size    = 134217728;
+"""
+
+log = logging.getLogger("db")
+
+
+def connect(path:str, readonly=False):
+    # isolation_level=None — автокоммит, транзакции открываем сами (BEGIN IMMEDIATE)
+    con = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    con.executescript(PRAGMAS)
+    if readonly: con.execute("PRAGMA query_only = ON")
+    return con
+
+
+class _Cursor:
+    """Курсор SELECT: время и число строк известны, когда строки выбраны."""
+    __slots__ = ("cur", "sql", "args", "t", "hook")
+
+    def __init__(self, cur, sql, args, t, hook):
+        self.cur, self.sql, self.args, self.t, self.hook = cur, sql, args, t, hook
+
+    def _done(self, n):
+        if self.hook: self.hook(self.sql, self.args, time.perf_counter()-self.t, n); self.hook = None
+
+    def fetchone(self):
+        row = self.cur.fetchone(); self._done(int(row is not None)); return row
+
+    def fetchall(self):
+        rows = self.cur.fetchall(); self._done(len(rows)); return rows
+
+    def __iter__(self):
+        n = 0
+        for row in self.cur: n += 1; yield row
+        self._done(n)
+
+    def __getattr__(self, k): return getattr(self.cur, k)
+
+
+class _Traced:
+    """Соединение, которое сообщает о каждом выражении в hook."""
+    __slots__ = ("con", "hook")
+
+    def __init__(self, con, hook): self.con, self.hook = con, hook
+
+    def execute(self, sql, args=()):
+        t = time.perf_counter(); cur = self.con.execute(sql, args)
+        if cur.description is not None: return _Cursor(cur, sql, args, t, self.hook)
+        self.hook(sql, args, time.perf_counter()-t, cur.rowcount); return cur
+
+    def executemany(self, sql, seq):
+        t = time.perf_counter(); cur = self.con.executemany(sql, seq)
+        self.hook(sql, (), time.perf_counter()-t, cur.rowcount); return cur
+
+    def __getattr__(self, k): return getattr(self.con, k)
+
+
+def keyset_sql(sql, cols, fwd=True, desc=False):
+    """SQL страницы DB.keyset: параметры — args, ключ (по колонке cols), limit."""
+    op, order = ("<", "DESC") if fwd == desc else (">", "ASC")
+    return (f"{sql} AND ({','.join(cols)}){op}({','.join('?'*len(cols))}) "
+            f"ORDER BY {', '.join(f'{c} {order}' for c in cols)} LIMIT ?")
+
+
+class DB:
+    def __init__(self, path:str, readers:int=4, group_ms:float=5, group_max:int=256):
+        self.path = path
+        self._rx  = ThreadPoolExecutor(readers, thread_name_prefix="db-r")
+        self._wx  = ThreadPoolExecutor(1, thread_name_prefix="db-w")
+        self._w   = connect(path)                       # писатель создаёт файл и включает WAL
+        self._pool = queue.SimpleQueue()
+        for _ in range(readers): self._pool.put(connect(path, readonly=True))
+        self.stats = {"tx": 0, "wait": 0.0, "wait_max": 0.0, "lock": 0.0, "lock_max": 0.0, "grouped": 0}
+        self.hook = None                                # hook(sql, args, сек, строк)
+        self.group_s, self.group_max = group_ms/1000, group_max
+        self._batch, self._timer, self._committing = [], None, None
+
+    # ── синхронная часть (выполняется в потоках пула) ──
+    def _read(self, fn):
+        con = self._pool.get()
+        try: return fn(_Traced(con, self.hook) if self.hook else con)
+        finally: self._pool.put(con)
+
+    def _write(self, fn, t0):
+        con = self._w
+        t1 = time.perf_counter()
+        con.execute("BEGIN IMMEDIATE")
+        s, q, l = self.stats, t1-t0, time.perf_counter()-t1    # пишет только поток-писатель
+        s["tx"] += 1; s["wait"] += q; s["lock"] += l
+        if q > s["wait_max"]: s["wait_max"] = q
+        if l > s["lock_max"]: s["lock_max"] = l
+        try:
+            res = fn(_Traced(con, self.hook) if self.hook else con)
+            con.execute("COMMIT")
+        except BaseException:
+            # и упавший COMMIT (BUSY/IOERR): без ROLLBACK писатель остался бы в транзакции
+            # и каждый следующий BEGIN IMMEDIATE падал бы до рестарта
+            if con.in_transaction: con.execute("ROLLBACK")
+            raise
+        return res
+
+    async def _run(self, pool, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+    # ── API для хендлеров ──
+    async def read(self, fn):
+        """fn(con) в соединении-читателе."""
+        return await self._run(self._rx, self._read, fn)
+
+    async def tx(self, fn):
+        """fn(con) внутри одной транзакции писателя; исключение → ROLLBACK."""
+        return await self._run(self._wx, self._write, fn, time.perf_counter())
+
+    async def fetchone(self, sql, args=()):
+        return await self.read(lambda con: con.execute(sql, args).fetchone())
+
+    async def fetchall(self, sql, args=()):
+        return await self.read(lambda con: con.execute(sql, args).fetchall())
+
+    async def keyset(self, sql, args, cols, key=None, fwd=True, desc=False, limit=10):
+        """Страница keyset-пагинации — цена не зависит от того, как далеко листать.
+
+        sql — SELECT … WHERE <условие> (без ORDER/LIMIT), cols — колонки ключа
+        (они же порядок; desc — естественный порядок убывающий), key — ключ
+        крайней строки текущей страницы (пусто — первая), fwd — листаем вперёд.
+        → (rows в естественном порядке, есть_вперёд, есть_назад)."""
+        if not key: key = (2**62 if desc else -2**62,)*len(cols)
+        rows = await self.fetchall(keyset_sql(sql, cols, fwd, desc), (*args, *key, limit+1))
+        more = len(rows) > limit; rows = rows[:limit]
+        if not fwd: rows.reverse()
+        first = abs(key[0]) == 2**62
+        return (rows, more, not first) if fwd else (rows, True, more)
+
+    async def execute(self, sql, args=()):
+        """Одиночная запись. Возвращает курсор (lastrowid / rowcount)."""
+        return await self.tx(lambda con: con.execute(sql, args))
+
+    async def executemany(self, sql, seq):
+        return await self.tx(lambda con: con.executemany(sql, seq))
+
+    # ── group commit ──
+    def group(self, sql, args=()) -> asyncio.Future:
+        """Запись в общую транзакцию. Future → rowcount после COMMIT;
+        ошибка одного выражения достаётся только его future."""
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._batch.append((sql, args, fut))
+        if len(self._batch) >= self.group_max: self._flush()
+        elif self._timer is None: self._timer = loop.call_later(self.group_s, self._flush)
+        return fut
+
+    def _flush(self):
+        if self._timer: self._timer.cancel(); self._timer = None
+        if self._committing or not self._batch: return      # докоммитится — заберёт накопленное
+        batch, self._batch = self._batch, []
+        self._committing = asyncio.get_running_loop().create_task(self._commit(batch))
+
+    def _write_batch(self, con, batch):
+        self.stats["grouped"] += len(batch)
+        out = []
+        for sql, args, _ in batch:
+            try: out.append(con.execute(sql, args).rowcount)
+            except sqlite3.Error as e: out.append(e)       # откатилось только это выражение
+        return out
+
+    async def _commit(self, batch):
+        try:
+            res = await self.tx(lambda con: self._write_batch(con, batch))
+        except Exception as e:
+            res = [e]*len(batch)
+        finally:
+            self._committing = None
+            self._flush()
+        for (*_, fut), r in zip(batch, res):
+            if fut.done(): continue
+            if isinstance(r, Exception): fut.set_exception(r)
+            else: fut.set_result(r)
+
+    async def flush(self):
+        """Дождаться всех отложенных group-записей (перед close)."""
+        while self._batch or self._committing:
+            if self._committing: await asyncio.shield(self._committing)
+            else: self._flush()
+
+    async def raw(self, fn):
+        """fn(con) на писателе без обёртки в транзакцию (DDL, миграции)."""
+        return await self._run(self._wx, fn, self._w)
+
+    async def script(self, sql):
+        return await self.raw(lambda con: con.executescript(sql))
+
+    def close(self):
+        self._wx.shutdown(); self._rx.shutdown()
+        self._w.close()
+        while not self._pool.empty(): self._pool.get().close()
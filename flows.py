@@ -0,0 +1,244 @@
+"""
+Мастера из JSON: <имя>_flow.json рядом с ботом описывает шаги, здесь они
+один раз при старте загружаются, проверяются и компилируются.
+
+Шаг — "step_N": {question, type, key, …}, порядок — по N:
+• choice — options: строки или {label, value}; inline-кнопки;
+• confirm — buttons [дальше, отмена]: вторая кнопка прерывает мастер;
+• input_text / input_number — ответ сообщением; optional — кнопка «Пропустить»;
+• search_product / select_variant — кнопки во время шага строит источник
+  (Engine sources): товары по тексту / вкусы выбранного товара;
+• display_cart, system — только проверяются: исполнять их движок не умеет,
+  и поток с ними нельзя привязать (cart_flow.json).
+key — имя ответа в data (по умолчанию id шага); depends_on — шаг есть,
+только если ответ на выбор выше равен этому значению (зона доставки —
+для курьера); check_existing — ответ сверяется источником, найденный id
+ложится в data[key+"_id"]; "{key}" в question подставляет ответы.
+
+Ошибка в файле — FlowError при загрузке, а не посреди мастера у
+пользователя. Компиляция: кортеж Step с готовыми клавиатурами (JSON, как
+в catalog.py), ответ на кнопку — индекс в кортеже значений, подпись —
+dict. Состояние пользователя — имя потока в FSM и data {"@": индекс
+шага, key: ответ, …}: шаг — один get_data и один set_data, set_state —
+только на входе и выходе.
+"""
+
+import json, os, re
+
+from aiogram.types import InlineKeyboardButton as IB, InlineKeyboardMarkup as IM
+
+TYPES   = {"choice", "confirm", "input_text", "input_number", "search_product", "select_variant",
+           "display_cart", "system"}
+DYNAMIC = {"search_product", "select_variant"}          # значение кнопки — id, а не индекс варианта
+RUNNABLE = TYPES-{"display_cart", "system"}
+FIELDS  = {"question", "type", "key", "options", "buttons", "optional", "depends_on", "check_existing",
+           "action", "actions"}
+SKIP    = -1                                            # opt кнопки «Пропустить»
+_STEP   = re.compile(r"step_(\d+)$")
+_KEY    = re.compile(r"[a-z_][a-z0-9_]*$")
+
+
+class FlowError(ValueError):
+    pass
+
+
+class _Fmt(dict):
+    def __missing__(self, key): return ""
+
+
+class Step:
+    __slots__ = ("id", "n", "key", "type", "question", "fmt", "optional", "guard", "check",
+                 "labels", "values", "by_label", "after", "kb")
+
+    def __init__(self, sid, n, raw):
+        self.id, self.n, self.type = sid, n, raw["type"]
+        self.key, self.question = raw.get("key", sid), raw.get("question", "")
+        self.fmt = "{" in self.question
+        self.optional, self.check = bool(raw.get("optional")), bool(raw.get("check_existing"))
+        opts = raw.get("options") or raw.get("buttons") or []
+        self.labels = tuple(o["label"] if isinstance(o, dict) else o for o in opts)
+        self.values = (True, False) if self.type == "confirm" else \
+                      tuple(o["value"] if isinstance(o, dict) else o for o in opts)
+        self.by_label = {l: i for i, l in enumerate(self.labels)}
+        self.guard = self.after = self.kb = None
+
+
+class Flow:
+    def __init__(self, name, steps):
+        self.name, self.steps = name, steps
+        self.state = f"flow:{name}"
+        self.by_key = {s.key: s for s in steps}
+
+    def label(self, key, value):
+        """Подпись кнопки, которой ответили на шаг key (для сводок)."""
+        s = self.by_key[key]
+        return s.labels[s.values.index(value)] if value in s.values else value
+
+    def next(self, i, data):
+        """Индекс следующего шага с выполненным depends_on или None — конец."""
+        j = self.steps[i].after
+        while j is not None and (g := self.steps[j].guard) and data.get(g[0]) != g[1]:
+            j = self.steps[j].after
+        return j
+
+
+def parse(name:str, raw) -> Flow:
+    """dict из JSON → Flow; FlowError с указанием шага на первой ошибке."""
+    def bad(sid, msg): raise FlowError(f"{name}_flow.json {sid}: {msg}")
+    if not isinstance(raw, dict) or not raw: bad("-", "ожидается непустой объект шагов")
+    nums = {}
+    for sid in raw:
+        if not (m := _STEP.match(sid)): bad(sid, "id шага — step_<N>")
+        nums[int(m[1])] = sid
+    if sorted(nums) != list(range(1, len(nums)+1)): bad("-", f"шаги не подряд: {sorted(nums)}")
+    steps, keys, choices = [], set(), {}            # choices: значение варианта → key шага
+    for n in sorted(nums):
+        sid, s = nums[n], raw[nums[n]]
+        if not isinstance(s, dict): bad(sid, "шаг — объект")
+        if extra := set(s)-FIELDS: bad(sid, f"неизвестные поля {sorted(extra)}")
+        if s.get("type") not in TYPES: bad(sid, f"тип {s.get('type')!r} не из {sorted(TYPES)}")
+        t = s["type"]
+        if t == "system":
+            if not isinstance(s.get("action"), str): bad(sid, "system без action")
+        elif not isinstance(s.get("question"), str) or not s["question"]: bad(sid, "нет question")
+        if t == "choice":
+            opts = s.get("options")
+            if not isinstance(opts, list) or not opts: bad(sid, "choice без options")
+            for o in opts:
+                if not (isinstance(o, str) or isinstance(o, dict) and set(o) == {"label", "value"}
+                        and isinstance(o["label"], str) and isinstance(o["value"], (str, int))):
+                    bad(sid, f"вариант {o!r}: строка или {{label, value}}")
+        if t == "confirm" and not (isinstance(s.get("buttons"), list) and len(s["buttons"]) == 2
+                                   and all(isinstance(b, str) for b in s["buttons"])):
+            bad(sid, "confirm: buttons — две подписи [дальше, отмена]")
+        if "optional" in s and t not in ("input_text", "input_number"): bad(sid, "optional — только для input_*")
+        if "check_existing" in s and t != "input_text": bad(sid, "check_existing — только для input_text")
+        step = Step(sid, len(steps), s)
+        if not _KEY.match(step.key): bad(sid, f"key {step.key!r}: латиница, цифры, _")
+        if step.key in keys: bad(sid, f"key {step.key!r} повторяется")
+        if len(set(step.labels)) != len(step.labels) or len(set(step.values)) != len(step.values):
+            bad(sid, "подписи и значения вариантов не должны повторяться")
+        if (dep := s.get("depends_on")) is not None:
+            if dep not in choices: bad(sid, f"depends_on {dep!r}: нет такого варианта в шагах выше")
+            step.guard = (choices[dep], dep)
+        if t == "choice":
+            for v in step.values: choices.setdefault(v, step.key)
+        keys.add(step.key); steps.append(step)
+    for a, b in zip(steps, steps[1:]): a.after = b.n
+    return Flow(name, tuple(steps))
+
+
+def load(path:str) -> Flow:
+    name = os.path.basename(path).removesuffix(".json").removesuffix("_flow")
+    try:
+        with open(path, encoding="utf-8") as f: raw = json.load(f)
+    except json.JSONDecodeError as e:
+        raise FlowError(f"{os.path.basename(path)}: {e}") from None
+    return parse(name, raw)
+
+
+def load_all(folder:str) -> dict:
+    """Все <имя>_flow.json папки → {имя: Flow}."""
+    return {f.name: f for f in (load(os.path.join(folder, fn))
+                                for fn in sorted(os.listdir(folder)) if fn.endswith("_flow.json"))}
+
+
+class Engine:
+    """Исполняет привязанные потоки: bind(имя, done, cancel) → start(…),
+    дальше бот отдаёт сюда сообщения в состояниях states и кнопки cb.
+    sources — {"search_product": fn(text, data), "select_variant": fn(data)
+    → [(подпись, id)], "check_existing": fn(key, value, data) → id | None}."""
+    def __init__(self, flows:dict, cb, sources=None):
+        self.flows, self.cb, self.sources = flows, cb, sources or {}
+        self.by_state = {}                              # состояние FSM → Flow
+        self.hooks = {}                                 # имя → (done, cancel)
+
+    @property
+    def states(self): return list(self.by_state)
+
+    def bind(self, name:str, done, cancel=None):
+        """done(message, uid, data) — последний шаг пройден; cancel(message, uid, data)
+        — «отмена» на confirm. Клавиатуры потока собираются здесь."""
+        flow = self.flows[name]
+        for s in flow.steps:
+            if s.type not in RUNNABLE: raise FlowError(f"{name}: {s.id} ({s.type}) движок не исполняет")
+            need = s.type if s.type in DYNAMIC else "check_existing" if s.check else None
+            if need and need not in self.sources: raise FlowError(f"{name}: {s.id} — нет источника {need}")
+            s.kb = self._kb(flow, s, enumerate(s.labels))
+        self.by_state[flow.state] = flow; self.hooks[name] = (done, cancel)
+
+    def button(self, name:str, key:str, value) -> str:
+        """callback_data кнопки «ответить value на шаг key» (бенчи)."""
+        s = self.flows[name].by_key[key]
+        return self.cb(s.n, value if s.type in DYNAMIC else s.values.index(value), name)
+
+    def _kb(self, flow, s, opts):
+        """opts — [(значение в callback, подпись)]; JSON клавиатуры или None."""
+        kb = IM()
+        btns = [IB(label, callback_data=self.cb(s.n, v, flow.name)) for v, label in opts]
+        if s.type == "confirm": kb.row(*btns)
+        else:
+            for b in btns: kb.add(b)
+        if s.optional: kb.add(IB("⏭ Пропустить", callback_data=self.cb(s.n, SKIP, flow.name)))
+        return kb.as_json() if kb.inline_keyboard else None
+
+    async def _ask(self, flow, i, data, m):
+        s = flow.steps[i]
+        kb = s.kb
+        if s.type == "select_variant":
+            opts = await self.sources[s.type](data)
+            if not opts: return await m.answer("Вариантов нет.")
+            kb = self._kb(flow, s, ((v, label) for label, v in opts))
+        await m.answer(s.question.format_map(_Fmt(data)) if s.fmt else s.question, reply_markup=kb)
+
+    async def start(self, name:str, m, state, **ctx):
+        """Начать поток с первого шага; ctx — данные для подстановок и done."""
+        flow = self.flows[name]
+        data = {"@": 0, **ctx}
+        await state.set_state(flow.state); await state.set_data(data)
+        await self._ask(flow, 0, data, m)
+
+    async def _accept(self, flow, s, value, data, m, uid, state):
+        done, cancel = self.hooks[flow.name]
+        if s.type == "confirm" and not value:
+            await state.finish()
+            return await (cancel(m, uid, data) if cancel else m.answer("Отменено."))
+        data[s.key] = value
+        if s.check and value is not None: data[s.key+"_id"] = await self.sources["check_existing"](s.key, value, data)
+        if (i := flow.next(s.n, data)) is None:
+            await state.finish(); return await done(m, uid, data)
+        data["@"] = i; await state.set_data(data)
+        await self._ask(flow, i, data, m)
+
+    async def message(self, m, state, raw_state=None):
+        """Сообщение в состоянии потока: ответ на текущий шаг. raw_state —
+        состояние, уже прочитанное StateFilter aiogram (не читать второй раз)."""
+        flow = self.by_state[raw_state or await state.get_state()]
+        data = await state.get_data(); s = flow.steps[data["@"]]
+        text = m.text or ""
+        if s.type == "input_text": value = text
+        elif s.type == "input_number":
+            if not text.isdigit(): return await m.answer("Введите число.")
+            value = int(text)
+        elif s.type == "search_product":
+            opts = await self.sources[s.type](text, data)
+            if not opts: return await m.answer("Ничего не нашлось, попробуйте иначе.")
+            return await m.answer(s.question, reply_markup=self._kb(flow, s, ((v, label) for label, v in opts)))
+        elif (k := s.by_label.get(text)) is not None: value = s.values[k]     # подпись кнопки текстом
+        else: return await m.answer("Выберите кнопкой.", reply_markup=s.kb)
+        await self._accept(flow, s, value, data, m, m.from_user.id, state)
+
+    async def callback(self, c, d, state):
+        """Кнопка fw:<шаг>:<вариант>:<поток>; старые кнопки (другой шаг) не действуют."""
+        flow = self.flows.get(d.flow)
+        if not flow or flow.state not in self.by_state or await state.get_state() != flow.state:
+            return await c.answer("Кнопка устарела")
+        data = await state.get_data()
+        if data.get("@") != d.step: return await c.answer("Кнопка устарела")
+        s = flow.steps[d.step]
+        if d.opt == SKIP and s.optional: value = None
+        elif s.type in DYNAMIC and d.opt > 0: value = d.opt
+        elif s.type not in DYNAMIC and 0 <= d.opt < len(s.values): value = s.values[d.opt]
+        else: return await c.answer("Кнопка устарела")
+        await c.answer()
+        await self._accept(flow, s, value, data, c.message, c.from_user.id, state)
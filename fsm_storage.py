@@ -0,0 +1,129 @@
+"""
+FSM-хранилище aiogram поверх SQLite (таблица fsm).
+
+• спереди — LRU в памяти: чтения состояния не ходят в базу;
+• запись отложенная: изменения копятся и раз в flush_ms уходят в базу
+  одним executemany — шаги мастера не стоят коммита каждый;
+• состояние, которого не трогали дольше ttl, считается сброшенным
+  и периодически вычищается и из памяти, и из базы.
+После рестарта недописанный мастер «Добавить» продолжится с того же шага.
+"""
+
+import asyncio, copy, json, logging, time
+from collections import OrderedDict
+from itertools import islice
+
+from aiogram.dispatcher.storage import BaseStorage
+
+log = logging.getLogger("fsm")
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, db, ttl:float=7*24*3600, cache_size:int=10_000, flush_ms:int=50):
+        self.db, self.ttl, self.cache_size = db, ttl, cache_size
+        self.flush_s = flush_ms/1000
+        self.lru   = OrderedDict()      # (chat, user) -> [state, data, ts]
+        self.dirty = set()
+        self._flush_task = None
+        self._swept = time.time()
+
+    # ── кеш ──
+    async def _get(self, chat, user):
+        key = (chat, user)
+        if (e := self.lru.get(key)) is None:
+            row = await self.db.fetchone("SELECT state,data,ts FROM fsm WHERE chat=? AND user=?", key)
+            e = [row[0], json.loads(row[1] or "{}"), row[2]] if row else [None, {}, 0]
+            if (e2 := self.lru.get(key)) is not None: e = e2    # пока ждали базу, запись могла появиться
+            else: self._evict(); self.lru[key] = e
+        else:
+            self.lru.move_to_end(key)
+        if e[0] is None and not e[1]: return e
+        if time.time()-e[2] > self.ttl:                        # протухло
+            e[0], e[1] = None, {}; self._touch(key, e)
+        return e
+
+    def _touch(self, key, e):
+        e[2] = time.time()
+        self.lru[key] = e; self.dirty.add(key)
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+
+    def _evict(self):
+        # выселяем самые старые из тех, что уже лежат в базе; смотрим только голову LRU
+        n = len(self.lru)-self.cache_size+1
+        if n <= 0: return
+        for key in [k for k in islice(self.lru, n+64) if k not in self.dirty][:n]:
+            del self.lru[key]
+
+    # ── запись в базу ──
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_s)
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        keys, self.dirty = self.dirty, set()
+        up, rm = [], []
+        for key in keys:
+            if (e := self.lru.get(key)) is None: continue
+            if e[0] is None and not e[1]: rm.append(key)
+            else: up.append((*key, e[0], json.dumps(e[1], ensure_ascii=False), e[2]))
+        sweep = time.time()-self._swept > 60
+        if not (up or rm or sweep): return
+        def write(con):
+            if up: con.executemany("""INSERT INTO fsm(chat,user,state,data,ts) VALUES(?,?,?,?,?)
+                                      ON CONFLICT(chat,user) DO UPDATE
+                                      SET state=excluded.state, data=excluded.data, ts=excluded.ts""", up)
+            if rm: con.executemany("DELETE FROM fsm WHERE chat=? AND user=?", rm)
+            if sweep: return con.execute("DELETE FROM fsm WHERE ts<?", (time.time()-self.ttl,)).rowcount
+        try:
+            gone = await self.db.tx(write)
+        except Exception:
+            self.dirty |= keys; log.exception("fsm flush"); return
+        if sweep:
+            self._swept = time.time()
+            old = [k for k,e in self.lru.items() if k not in self.dirty and time.time()-e[2] > self.ttl]
+            for k in old: del self.lru[k]
+            if gone or old: log.info("fsm: expired %s stored, %s cached", gone, len(old))
+
+    # ── BaseStorage ──
+    async def get_state(self, *, chat=None, user=None, default=None):
+        chat, user = self.check_address(chat=chat, user=user)
+        return (await self._get(chat, user))[0] or self.resolve_state(default)
+
+    async def get_data(self, *, chat=None, user=None, default=None):
+        chat, user = self.check_address(chat=chat, user=user)
+        return copy.deepcopy((await self._get(chat, user))[1] or default or {})
+
+    async def set_state(self, *, chat=None, user=None, state=None):
+        chat, user = self.check_address(chat=chat, user=user)
+        e = await self._get(chat, user)
+        e[0] = self.resolve_state(state); self._touch((chat, user), e)
+
+    async def set_data(self, *, chat=None, user=None, data=None):
+        chat, user = self.check_address(chat=chat, user=user)
+        e = await self._get(chat, user)
+        e[1] = copy.deepcopy(data or {}); self._touch((chat, user), e)
+
+    async def update_data(self, *, chat=None, user=None, data=None, **kwargs):
+        chat, user = self.check_address(chat=chat, user=user)
+        e = await self._get(chat, user)
+        e[1].update(copy.deepcopy(data or {}), **copy.deepcopy(kwargs)); self._touch((chat, user), e)
+
+    async def reset_state(self, *, chat=None, user=None, with_data=True):
+        await self.set_state(chat=chat, user=user, state=None)
+        if with_data: await self.set_data(chat=chat, user=user, data={})
+
+    def counts(self):
+        """Состояния в памяти: {state: n} (для метрик)."""
+        out = {}
+        for s,_,_ in self.lru.values():
+            if s: out[s] = out.get(s, 0)+1
+        return out
+
+    async def close(self):
+        if self._flush_task: self._flush_task.cancel(); self._flush_task = None
+        if self.dirty: await self.flush()
+
+    async def wait_closed(self):
+        pass
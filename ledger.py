@@ -0,0 +1,121 @@
+"""
+Кешбэк и сумма покупок — через append-only журнал (таблица ledger).
+
+Каждое движение — строка (user, order, kind, spent, cashback); отмена —
+новая строка с обратными знаками и reverses=<id исходной>, старые строки
+не меняются (UPDATE/DELETE запрещены триггерами). users.cashback и
+users.total_spent — материализованный итог журнала, обновляется в той же
+транзакции, поэтому «Мой кешбэк» — одно чтение по первичному ключу.
+
+kind: earn — заказ выполнен (spent = оплачено, cashback по уровню);
+      spend — кешбэк списан при оформлении; ref — бонус пригласившему;
+      opening — остаток на момент появления журнала.
+Все функции получают соединение писателя и зовутся внутри db.tx(...).
+"""
+
+# запросы; migrations.HOT_QUERIES проверяет их планы
+BALANCE   = "SELECT cashback,total_spent FROM users WHERE id=?"
+OPEN      = """SELECT id,user_id,order_id,kind,spent,cashback FROM ledger l
+               WHERE order_id=? AND reverses IS NULL
+                 AND NOT EXISTS(SELECT 1 FROM ledger r WHERE r.reverses=l.id)"""
+OPEN_KIND = OPEN+" AND kind=?"
+
+# уровень по сумме выполненных заказов: (от, %)
+TIERS = ((0, 0.005), (10000, 0.01), (15000, 0.02), (25000, 0.04), (35000, 0.07))
+
+
+def cashback_rate(spent:float) -> float:
+    return next(r for s, r in reversed(TIERS) if spent >= s)
+
+def next_tier(spent:float):
+    """→ (сумма, %) следующего уровня или None, если уровень последний."""
+    return next(((s, r) for s, r in TIERS if s > spent), None)
+
+
+def post(con, uid:int, kind:str, oid=None, spent:float=0, cashback:float=0, reverses=None):
+    spent, cashback = round(spent, 2), round(cashback, 2)
+    con.execute("""INSERT INTO ledger(user_id,order_id,kind,spent,cashback,reverses)
+                   VALUES(?,?,?,?,?,?)""", (uid, oid, kind, spent, cashback, reverses))
+    con.execute("""INSERT INTO users(id,cashback,total_spent) VALUES(?,?,?)
+                   ON CONFLICT(id) DO UPDATE SET cashback=cashback+excluded.cashback,
+                                                 total_spent=total_spent+excluded.total_spent""",
+                (uid, cashback, spent))
+
+
+def _open(con, oid, kind=None):
+    """Не отменённые ещё строки заказа."""
+    return con.execute(OPEN_KIND if kind else OPEN, (oid, kind) if kind else (oid,)).fetchall()
+
+def _reverse(con, rows):
+    for lid, uid, oid, kind, spent, cb in rows:
+        post(con, uid, kind, oid, -spent, -cb, reverses=lid)
+
+
+def settle(con, oid:int, status:str):
+    """Привести журнал заказа к его статусу: done — начислено, cancel — всё
+    по заказу (покупка, списанный кешбэк, реф-бонус) сторнировано."""
+    if status == "cancel": return _reverse(con, _open(con, oid))
+    earned = _open(con, oid, "earn")
+    if status == "done" and not earned:
+        uid, paid = con.execute("SELECT user_id,MAX(0,total-discount) FROM orders WHERE id=?", (oid,)).fetchone()
+        spent = (con.execute("SELECT total_spent FROM users WHERE id=?", (uid,)).fetchone() or (0,))[0]
+        post(con, uid, "earn", oid, paid, paid*cashback_rate(spent))
+    elif status != "done" and earned:
+        _reverse(con, earned)
+
+
+def reopen(con, oid:int) -> float:
+    """Отменённый заказ снова в силе (оплата пришла после отмены): списанный
+    кешбэк и реф-бонус, которые сторнировала отмена, проводятся заново.
+    Кешбэк — только если он ещё на балансе (мог уйти на другой заказ).
+    → сколько кешбэка списать не удалось (0 — всё проведено)."""
+    live, short = {r[3] for r in _open(con, oid)}, 0
+    for lid, uid, _, kind, spent, cb in con.execute(
+            """SELECT id,user_id,order_id,kind,spent,cashback FROM ledger
+               WHERE order_id=? AND reverses IS NULL AND kind IN ('spend','ref') ORDER BY id""", (oid,)).fetchall():
+        if kind in live: continue
+        live.add(kind)
+        if kind == "spend" and (con.execute(BALANCE, (uid,)).fetchone() or (0,))[0] < -cb - 0.005:
+            short = -cb; continue
+        post(con, uid, kind, oid, spent, cb)
+    return short
+
+
+# ─────────────── аудит ───────────────
+def rebuild(con) -> int:
+    """Пересчитать users.cashback/total_spent из журнала. → сколько строк поправлено."""
+    n = con.total_changes                  # rowcount у WITH … UPDATE всегда -1
+    con.execute("""
+        WITH l AS (SELECT user_id, ROUND(SUM(cashback),2) cb, ROUND(SUM(spent),2) sp FROM ledger GROUP BY user_id)
+        UPDATE users SET cashback   = COALESCE((SELECT cb FROM l WHERE l.user_id=users.id), 0),
+                         total_spent= COALESCE((SELECT sp FROM l WHERE l.user_id=users.id), 0)
+        WHERE abs(cashback   - COALESCE((SELECT cb FROM l WHERE l.user_id=users.id), 0)) > 0.005
+           OR abs(total_spent- COALESCE((SELECT sp FROM l WHERE l.user_id=users.id), 0)) > 0.005""")
+    return con.total_changes-n
+
+
+def check(con) -> dict:
+    """Расхождения: {название: [строки]}; пусто — всё сходится."""
+    q = {
+        # материализованный итог ≠ сумма журнала
+        "balance": """SELECT u.id,u.cashback,COALESCE(l.cb,0),u.total_spent,COALESCE(l.sp,0)
+                      FROM users u LEFT JOIN (SELECT user_id,SUM(cashback) cb,SUM(spent) sp
+                                              FROM ledger GROUP BY user_id) l ON l.user_id=u.id
+                      WHERE abs(u.cashback-COALESCE(l.cb,0))>0.005 OR abs(u.total_spent-COALESCE(l.sp,0))>0.005""",
+        "no_user":  "SELECT DISTINCT user_id FROM ledger WHERE user_id NOT IN (SELECT id FROM users)",
+        # кешбэк потрачен дважды (журнал и итог сходятся, но в минусе)
+        "negative": "SELECT id,cashback FROM users WHERE cashback<-0.005",
+        # выполненный заказ без начисления / начисление по невыполненному
+        "done_not_earned": """SELECT id FROM orders o WHERE status='done'
+                              AND NOT EXISTS(SELECT 1 FROM ledger l WHERE order_id=o.id AND kind='earn'
+                                             AND reverses IS NULL
+                                             AND NOT EXISTS(SELECT 1 FROM ledger r WHERE r.reverses=l.id))""",
+        "earned_not_done": """SELECT order_id,SUM(spent) FROM ledger l JOIN orders o ON o.id=l.order_id
+                              WHERE l.kind='earn' AND o.status<>'done'
+                              GROUP BY order_id HAVING abs(SUM(spent))>0.005""",
+        # у отменённого заказа остался ненулевой след
+        "cancel_open": """SELECT order_id,SUM(spent),SUM(cashback) FROM ledger l JOIN orders o ON o.id=l.order_id
+                          WHERE o.status='cancel' GROUP BY order_id
+                          HAVING abs(SUM(spent))>0.005 OR abs(SUM(cashback))>0.005""",
+    }
+    return {k: rows for k, sql in q.items() if (rows := con.execute(sql).fetchall())}
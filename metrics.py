@@ -0,0 +1,193 @@
+"""
+Метрики бота в формате Prometheus (текстовый формат, без зависимостей).
+
+instrument(dp, db, route) подключает всё разом:
+• middleware — гистограммы времени по хендлерам и по префиксам callback'ов;
+• DB.hook — время и строки каждого SQL-выражения (+ лог медленных, если
+  задан порог slow_ms);
+• обёртка Bot.request — время и ошибки вызовов Bot API;
+• при снятии — состояния FSM (storage.counts()) и ожидания писателя (DB.stats).
+serve(host, port) поднимает отдельный локальный http с /metrics.
+"""
+
+import logging, threading, time
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiohttp import web
+
+log = logging.getLogger("metrics")
+slow_log = logging.getLogger("sql.slow")
+
+BUCKETS     = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+SQL_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, 1)
+
+
+def _esc(v): return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values, le=None):
+    pairs = [f'{n}="{_esc(v)}"' for n, v in zip(names, values)]
+    if le is not None: pairs.append(f'le="{le}"')
+    return "{"+",".join(pairs)+"}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values, self.lock = {}, threading.Lock()       # SQL-хук зовётся из потоков DB
+
+    def head(self): return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, n=1):
+        with self.lock: self.values[labels] = self.values.get(labels, 0)+n
+
+    def render(self):
+        return self.head()+[f"{self.name}{_labels(self.labels, k)} {v}" for k, v in self.values.items()]
+
+
+class Gauge(_Metric):
+    """Значения считаются при снятии: fn() → {labels: value}."""
+    kind = "gauge"
+
+    def __init__(self, name, help, labels=(), fn=None):
+        super().__init__(name, help, labels); self.fn = fn
+
+    def render(self):
+        vals = self.fn() if self.fn else self.values
+        return self.head()+[f"{self.name}{_labels(self.labels, k)} {v}" for k, v in vals.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels); self.buckets = buckets
+
+    def observe(self, v, *labels):
+        with self.lock:
+            if (h := self.values.get(labels)) is None:
+                h = self.values[labels] = [[0]*len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if v <= b: h[0][i] += 1; break
+            h[1] += v; h[2] += 1
+
+    def render(self):
+        out = self.head()
+        with self.lock: items = [(k, list(c), s, n) for k, (c, s, n) in self.values.items()]
+        for k, counts, s, n in items:
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c; out.append(f"{self.name}_bucket{_labels(self.labels, k, b)} {acc}")
+            out.append(f"{self.name}_bucket{_labels(self.labels, k, '+Inf')} {n}")
+            out.append(f"{self.name}_sum{_labels(self.labels, k)} {s}")
+            out.append(f"{self.name}_count{_labels(self.labels, k)} {n}")
+        return out
+
+
+class Registry:
+    def __init__(self): self.metrics = []
+
+    def add(self, m): self.metrics.append(m); return m
+
+    def render(self):
+        return "\n".join(line for m in self.metrics for line in m.render())+"\n"
+
+
+REG = Registry()
+HANDLER  = REG.add(Histogram("bot_handler_seconds", "Время хендлера", ("handler",)))
+CALLBACK = REG.add(Histogram("bot_callback_seconds", "Время callback'а по префиксу", ("prefix",)))
+ERRORS   = REG.add(Counter("bot_handler_errors_total", "Исключения в хендлерах", ("error",)))
+SQL      = REG.add(Histogram("db_query_seconds", "Время SQL-выражения", ("query",), SQL_BUCKETS))
+SQL_ROWS = REG.add(Counter("db_query_rows_total", "Строк выбрано/изменено", ("query",)))
+API      = REG.add(Histogram("tg_api_seconds", "Время вызова Bot API", ("method",)))
+API_ERR  = REG.add(Counter("tg_api_errors_total", "Ошибки Bot API", ("method", "error")))
+
+
+# ─────────────── хендлеры ───────────────
+class Middleware(BaseMiddleware):
+    """Время от входа в хендлер до конца обработки апдейта.
+    Callback'и идут через один хендлер Router'а — имя берём у роута."""
+
+    def __init__(self, route=None):
+        super().__init__(); self.route = route
+
+    @staticmethod
+    async def _start(obj, data):
+        data["_metrics"] = (getattr(current_handler.get(), "__name__", "?"), time.perf_counter())
+
+    @staticmethod
+    async def _stop(obj, results, data):
+        if m := data.get("_metrics"): HANDLER.observe(time.perf_counter()-m[1], m[0])
+
+    on_process_message = on_process_inline_query = _start
+    on_post_process_message = on_post_process_inline_query = _stop
+    on_process_callback_query = _start
+
+    async def on_post_process_callback_query(self, c, results, data):
+        if not (m := data.get("_metrics")): return
+        dt, prefix = time.perf_counter()-m[1], (c.data or "").partition(":")[0]
+        r = self.route and self.route.routes.get(prefix)
+        HANDLER.observe(dt, r[1].__name__ if r else m[0])
+        CALLBACK.observe(dt, prefix if r else "unknown")
+
+
+# ─────────────── SQL ───────────────
+def _query(sql): return " ".join(sql.split())[:100]
+
+def sql_hook(slow_ms=0):
+    slow = slow_ms/1000
+    def hook(sql, args, dt, rows):
+        q = _query(sql)
+        SQL.observe(dt, q)
+        if rows > 0: SQL_ROWS.inc(q, n=rows)
+        if slow and dt >= slow:
+            slow_log.warning("SLOW SQL %.1fms rows=%s: %s %.200r", dt*1000, rows, q, args)
+    return hook
+
+
+# ─────────────── Bot API ───────────────
+def _timed_request(request):
+    async def timed(method, data=None, files=None, **kw):
+        t = time.perf_counter()
+        try:
+            return await request(method, data, files, **kw)
+        except Exception as e:
+            API_ERR.inc(method, type(e).__name__); raise
+        finally:
+            API.observe(time.perf_counter()-t, method)
+    return timed
+
+
+def instrument(dp, db, route=None, slow_ms=0):
+    dp.middleware.setup(Middleware(route))
+    db.hook = sql_hook(slow_ms)
+    dp.bot.request = _timed_request(dp.bot.request)
+
+    @dp.errors_handler()
+    async def count_errors(update, e):
+        ERRORS.inc(type(e).__name__)        # ничего не возвращаем — aiogram залогирует как раньше
+
+    counts = getattr(dp.storage, "counts", None)
+    REG.add(Gauge("fsm_states", "Пользователей в состоянии FSM", ("state",),
+                  lambda: {(s,): n for s, n in counts().items()} if counts else {}))
+    REG.add(Gauge("db_writer", "Ожидания писателя SQLite (tx — штук, остальное — секунды)", ("stat",),
+                  lambda: {(k,): v for k, v in db.stats.items()}))
+
+
+# ─────────────── /metrics ───────────────
+async def metrics_view(req):
+    return web.Response(body=REG.render().encode(),
+                        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+async def serve(host="127.0.0.1", port=9100):
+    app = web.Application(); app.router.add_get("/metrics", metrics_view)
+    runner = web.AppRunner(app, access_log=None); await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("metrics: http://%s:%s/metrics", host, port)
+    return runner
@@ -1,78 +1,55 @@
 """
-Создаёт (или мигрирует) базу vape_shop.db к новой схеме:
-products, flavors, cart, waitlist, orders.
-Запускается ОДИН раз вручную, бот потом ничего не трогает.
+Ручной запуск миграций (бот делает то же самое при старте).
+
+    python migrate_once.py [путь к базе] [--check] [--ledger-check] [--ledger-rebuild] [--sales-rebuild] [--search-rebuild]
+
+--check — после миграции проверить EXPLAIN QUERY PLAN горячих запросов;
+код выхода 1, если какой-то из них ушёл в полный скан.
+--ledger-rebuild — пересчитать users.cashback/total_spent из журнала.
+--ledger-check — сверить журнал кешбэка с балансами и статусами заказов;
+код выхода 1 при расхождениях.
+--sales-rebuild — пересчитать дневные агрегаты продаж по всей истории
+(бот досчитывает их и сам, в фоне; это — для ручной сверки).
+--search-rebuild — переиндексировать поиск по каталогу (после правок базы
+в обход триггеров).
 """
-import sqlite3, pathlib, logging
+import sys, os, logging
+
+from db import connect
+import migrations, ledger, sales, search
 
-DB = "vape_shop.db"
 logging.basicConfig(level=logging.INFO)
-con = sqlite3.connect(DB)
-cur = con.cursor()
+args = [a for a in sys.argv[1:] if not a.startswith("--")]
+DB = args[0] if args else os.getenv("DB_PATH", "vape_shop.db")
+
+con = connect(DB)
+logging.info("Схема v%s (%s).", migrations.migrate(con), DB)
+
+if "--check" in sys.argv:
+    bad = migrations.check_plans(con)
+    for name, plan in bad.items(): logging.error("%s: %s", name, "; ".join(plan))
+    if bad: sys.exit(1)
+    logging.info("Все %s горячих запросов идут по индексам.", len(migrations.HOT_QUERIES))
+
+if "--ledger-rebuild" in sys.argv:
+    con.execute("BEGIN IMMEDIATE")
+    n = ledger.rebuild(con); con.execute("COMMIT")
+    logging.info("Балансы пересчитаны из журнала: поправлено %s.", n)
+
+if "--sales-rebuild" in sys.argv:
+    con.execute("BEGIN IMMEDIATE")
+    n = sales.rebuild(con); con.execute("DELETE FROM sales_backfill"); con.execute("COMMIT")
+    logging.info("Агрегаты продаж пересчитаны: %s строк.", n)
 
-# базовые таблицы (id -> вкус -> остаток)
-cur.executescript("""
-CREATE TABLE IF NOT EXISTS products (
-    id INTEGER PRIMARY KEY,
-    name TEXT,
-    description TEXT
-);
-CREATE TABLE IF NOT EXISTS flavors (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    product_id INTEGER,
-    flavor TEXT,
-    qty INTEGER
-);
-CREATE TABLE IF NOT EXISTS cart (
-    rowid INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    flavor_id INTEGER,
-    qty INTEGER
-);
-CREATE TABLE IF NOT EXISTS waitlist (
-    user_id INTEGER,
-    flavor_id INTEGER
-);
-CREATE TABLE IF NOT EXISTS orders (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id INTEGER,
-    items TEXT,
-    ts TEXT,
-    status TEXT
-);
-""")
-con.commit()
+if "--search-rebuild" in sys.argv:
+    con.execute("BEGIN IMMEDIATE")
+    search.rebuild(con); con.execute("COMMIT")
+    logging.info("Поиск переиндексирован: %s вкусов.", con.execute("SELECT COUNT(*) FROM search").fetchone()[0])
 
-# миграция из старой схемы (products.quantity, products.flavors TEXT)
-try:
-    cur.execute("PRAGMA table_info(products_old)");
-    # если products_old уже переименована, значит миграция была
-    logging.info("База уже в новой схеме — миграция не нужна.")
-except sqlite3.OperationalError:
-    try:
-        cur.execute("SELECT id,name,description,quantity,flavors FROM products")
-        rows = cur.fetchall()
-        if rows:
-            logging.info("Найдена старая схема — переносим данные…")
-            cur.executescript("DELETE FROM flavors;")
-            for pid,name,desc,qty,flv in rows:
-                if flv:
-                    parts = [p.strip() for p in flv.split(",")]
-                    per = qty // len(parts) if qty else 0
-                    for f in parts:
-                        cur.execute("INSERT INTO flavors(product_id,flavor,qty) VALUES(?,?,?)",
-                                    (pid,f,per))
-                else:
-                    cur.execute("INSERT INTO flavors(product_id,flavor,qty) VALUES(?,?,?)",
-                                (pid,"default",qty))
-            cur.execute("ALTER TABLE products RENAME TO products_old;")
-            cur.execute("CREATE TABLE products (id INTEGER PRIMARY KEY,name TEXT,description TEXT);")
-            cur.executemany("INSERT INTO products(id,name,description) VALUES(?,?,?)",
-                            [(pid,n,d) for pid,n,d,_,_ in rows])
-            con.commit()
-            logging.info("Миграция выполнена успешно.")
-    except sqlite3.OperationalError:
-        pass  # таблица products ещё не создана → ничего переносить
+if "--ledger-check" in sys.argv:
+    bad = ledger.check(con)
+    for name, rows in bad.items(): logging.error("%s: %s строк, напр. %s", name, len(rows), rows[:5])
+    if bad: sys.exit(1)
+    logging.info("Журнал кешбэка сходится.")
 
 con.close()
-logging.info("Готово. Файл %s сохранён.", DB)
@@ -0,0 +1,389 @@
+"""
+Миграции схемы по PRAGMA user_version.
+
+MIGRATIONS[n] переводит базу из версии n в n+1; каждый шаг — отдельная
+транзакция вместе с записью новой user_version, так что прерванная
+миграция просто повторится при следующем запуске.
+Шаг 1 — общий знаменатель бота и старого migrate_once.py: приводит любую
+из прежних схем (products.quantity/flavors TEXT, flavors/cart/waitlist)
+к живой схеме bot.py.
+
+HOT_QUERIES — запросы горячих хендлеров (константы модулей, которые их
+исполняют); check_plans() находит те, что читают таблицу полным сканом
+(tests/test_plans.py, `python migrate_once.py --check`).
+"""
+
+import logging, sqlite3
+
+from db import keyset_sql
+import archive, catalog, ledger, sales, search, shop, waitlist
+
+log = logging.getLogger("migrate")
+
+
+def run_script(con, sql:str):
+    """executescript без неявного COMMIT — можно внутри транзакции."""
+    buf = ""
+    for part in sql.split(";"):
+        buf += part + ";"
+        if sqlite3.complete_statement(buf):
+            if buf.strip(" \n;"): con.execute(buf)
+            buf = ""
+
+def _tables(con):
+    return {n for n, in con.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+
+def _cols(con, table):
+    return {r[1] for r in con.execute(f"PRAGMA table_info({table})")}
+
+
+# ─────────────── v1: базовая схема + перенос старых ───────────────
+BASE = """
+CREATE TABLE IF NOT EXISTS users(
+    id INTEGER PRIMARY KEY,
+    cashback REAL DEFAULT 0,
+    total_spent REAL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS products(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT, description TEXT, category TEXT,
+    created TEXT DEFAULT (datetime('now'))
+);
+CREATE TABLE IF NOT EXISTS flavours(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+    name TEXT, price REAL DEFAULT 0, stock INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS carts(
+    user_id INTEGER,
+    flavour_id INTEGER REFERENCES flavours(id) ON DELETE CASCADE,
+    qty INTEGER,
+    PRIMARY KEY(user_id, flavour_id)
+);
+CREATE TABLE IF NOT EXISTS orders(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER, created TEXT DEFAULT (datetime('now')),
+    total REAL, pay_method TEXT, discount REAL DEFAULT 0,
+    status TEXT, reserved_until TEXT
+);
+CREATE TABLE IF NOT EXISTS order_items(
+    order_id INTEGER REFERENCES orders(id) ON DELETE CASCADE,
+    flavour_id INTEGER, qty INTEGER, price REAL
+);
+CREATE TABLE IF NOT EXISTS refs(
+    code TEXT PRIMARY KEY,
+    owner_id INTEGER,
+    used_by_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS waitlist(
+    user_id INTEGER,
+    flavour_id INTEGER REFERENCES flavours(id) ON DELETE CASCADE,
+    PRIMARY KEY(user_id, flavour_id)
+);
+"""
+
+def v1_base(con):
+    t = _tables(con)
+    legacy_flv = []
+    if "products" in t:
+        cols = _cols(con, "products")
+        # самая старая схема: products.quantity + products.flavors "a, b, c"
+        if {"quantity","flavors"} <= cols:
+            for pid,qty,flv in con.execute("SELECT id,quantity,flavors FROM products").fetchall():
+                parts = [p.strip() for p in (flv or "").split(",") if p.strip()] or ["default"]
+                per = (qty or 0)//len(parts)
+                legacy_flv += [(pid,f,per) for f in parts]
+        for col,ddl in (("category","TEXT"), ("created","TEXT")):
+            if col not in cols: con.execute(f"ALTER TABLE products ADD COLUMN {col} {ddl}")
+    # схема migrate_once.py: orders(items, ts) несовместима — откладываем в сторону
+    if "orders" in t and "items" in _cols(con, "orders"):
+        con.execute("ALTER TABLE orders RENAME TO orders_legacy")
+    if "waitlist" in t and "flavor_id" in _cols(con, "waitlist"):
+        con.execute("ALTER TABLE waitlist RENAME TO waitlist_legacy")
+    if "orders" in _tables(con) and "reserved_until" not in _cols(con, "orders"):
+        con.execute("ALTER TABLE orders ADD COLUMN reserved_until TEXT")
+
+    run_script(con, BASE)
+
+    con.executemany("INSERT INTO flavours(product_id,name,stock) VALUES(?,?,?)", legacy_flv)
+    if "flavors" in t:
+        con.execute("""INSERT INTO flavours(id,product_id,name,stock)
+                       SELECT id,product_id,flavor,qty FROM flavors""")
+        con.execute("DROP TABLE flavors")
+    if "cart" in t:
+        con.execute("""INSERT OR IGNORE INTO carts(user_id,flavour_id,qty)
+                       SELECT user_id,flavor_id,SUM(qty) FROM cart
+                       WHERE flavor_id IN (SELECT id FROM flavours) GROUP BY 1,2""")
+        con.execute("DROP TABLE cart")
+    if "waitlist_legacy" in _tables(con):
+        con.execute("""INSERT OR IGNORE INTO waitlist(user_id,flavour_id)
+                       SELECT user_id,flavor_id FROM waitlist_legacy
+                       WHERE flavor_id IN (SELECT id FROM flavours)""")
+        con.execute("DROP TABLE waitlist_legacy")
+
+
+# ─────────────── v2: вторичные индексы ───────────────
+def v2_indexes(con):
+    run_script(con, """
+    CREATE INDEX IF NOT EXISTS products_cat      ON products(category, name);
+    CREATE INDEX IF NOT EXISTS flavours_product  ON flavours(product_id, name, price, stock);
+    CREATE INDEX IF NOT EXISTS orders_user       ON orders(user_id);
+    CREATE INDEX IF NOT EXISTS orders_status     ON orders(status, reserved_until);
+    CREATE INDEX IF NOT EXISTS order_items_order ON order_items(order_id, flavour_id, qty, price);
+    CREATE INDEX IF NOT EXISTS refs_used_by      ON refs(used_by_id, owner_id);
+    """)
+
+
+# ─────────────── v3: FSM-хранилище ───────────────
+def v3_fsm(con):
+    run_script(con, """
+    CREATE TABLE IF NOT EXISTS fsm(
+        chat INTEGER, user INTEGER,
+        state TEXT, data TEXT, ts REAL,
+        PRIMARY KEY(chat, user)
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS fsm_ts ON fsm(ts);
+    """)
+
+
+# ─────────────── v4: индексы под keyset-листалки ───────────────
+def v4_pages(con):
+    run_script(con, """
+    CREATE INDEX IF NOT EXISTS flavours_pid     ON flavours(product_id);
+    CREATE INDEX IF NOT EXISTS orders_status_id ON orders(status);
+    """)
+
+
+# ─────────────── v5: рассылка листа ожидания ───────────────
+def v5_waitlist(con):
+    # notified — когда строку взяли в рассылку (NULL — ещё ждёт), см. waitlist.py
+    if "notified" not in _cols(con, "waitlist"):
+        con.execute("ALTER TABLE waitlist ADD COLUMN notified INTEGER")
+    con.execute("CREATE INDEX IF NOT EXISTS waitlist_flavour ON waitlist(flavour_id, notified)")
+
+
+# ─────────────── v6: журнал кешбэка ───────────────
+def v6_ledger(con):
+    run_script(con, """
+    CREATE TABLE IF NOT EXISTS ledger(
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        order_id INTEGER,
+        kind TEXT NOT NULL,                     -- opening | earn | spend | ref
+        spent REAL NOT NULL DEFAULT 0,
+        cashback REAL NOT NULL DEFAULT 0,
+        reverses INTEGER REFERENCES ledger(id),
+        created TEXT DEFAULT (datetime('now'))
+    );
+    CREATE INDEX IF NOT EXISTS ledger_user  ON ledger(user_id);
+    CREATE INDEX IF NOT EXISTS ledger_order ON ledger(order_id, kind);
+    CREATE UNIQUE INDEX IF NOT EXISTS ledger_reverses ON ledger(reverses) WHERE reverses IS NOT NULL;
+    CREATE TRIGGER IF NOT EXISTS ledger_no_update BEFORE UPDATE ON ledger
+        BEGIN SELECT RAISE(ABORT, 'ledger is append-only'); END;
+    CREATE TRIGGER IF NOT EXISTS ledger_no_delete BEFORE DELETE ON ledger
+        BEGIN SELECT RAISE(ABORT, 'ledger is append-only'); END;
+    """)
+    # открытие журнала: выполненные заказы считаются покупками (без задним
+    # числом начисленного кешбэка), текущий кешбэк — входящим остатком
+    if con.execute("SELECT 1 FROM ledger LIMIT 1").fetchone(): return
+    con.execute("INSERT OR IGNORE INTO users(id) SELECT DISTINCT user_id FROM orders WHERE user_id IS NOT NULL")
+    con.execute("""INSERT INTO ledger(user_id,order_id,kind,spent)
+                   SELECT user_id,id,'earn',ROUND(MAX(0,total-discount),2) FROM orders WHERE status='done'""")
+    con.execute("""INSERT INTO ledger(user_id,kind,cashback)
+                   SELECT id,'opening',cashback FROM users WHERE cashback<>0""")
+    con.execute("""UPDATE users SET total_spent=COALESCE((SELECT SUM(spent) FROM ledger WHERE user_id=users.id),0)""")
+
+
+# ─────────────── v7: дневные агрегаты продаж ───────────────
+def v7_sales(con):
+    run_script(con, """
+    CREATE TABLE IF NOT EXISTS sales_day(
+        day TEXT, pay_method TEXT, status TEXT,
+        orders INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        discount REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, pay_method, status)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS sales_flavour(
+        day TEXT, flavour_id INTEGER,
+        units INTEGER NOT NULL DEFAULT 0,
+        revenue REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY(day, flavour_id)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS sales_backfill(next TEXT, stop TEXT);
+    CREATE INDEX IF NOT EXISTS orders_created ON orders(created);
+    """)
+    # историю досчитывает sales.backfill() в фоне, см. sales.py
+    con.execute("""INSERT INTO sales_backfill SELECT date(MIN(created)),date('now','+1 day') FROM orders
+                   HAVING MIN(created) IS NOT NULL""")
+
+
+# ─────────────── v8: полнотекстовый поиск ───────────────
+def v8_search(con):
+    # по строке на вкус, rowid = flavours.id; цена/остаток не индексируются
+    run_script(con, """
+    CREATE VIRTUAL TABLE IF NOT EXISTS search USING fts5(
+        product, description, flavour,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3 4 5 6'
+    );
+    CREATE TABLE IF NOT EXISTS search_defer(n INTEGER);
+    CREATE TRIGGER IF NOT EXISTS search_flv_ins AFTER INSERT ON flavours
+    WHEN NOT EXISTS(SELECT 1 FROM search_defer) BEGIN
+        INSERT INTO search(rowid,product,description,flavour)
+        SELECT new.id,p.name,COALESCE(p.description,''),new.name FROM products p WHERE p.id=new.product_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS search_flv_del AFTER DELETE ON flavours BEGIN
+        DELETE FROM search WHERE rowid=old.id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS search_flv_upd AFTER UPDATE OF name,product_id ON flavours BEGIN
+        DELETE FROM search WHERE rowid=old.id;
+        INSERT INTO search(rowid,product,description,flavour)
+        SELECT new.id,p.name,COALESCE(p.description,''),new.name FROM products p WHERE p.id=new.product_id;
+    END;
+    CREATE TRIGGER IF NOT EXISTS search_prd_upd AFTER UPDATE OF name,description ON products BEGIN
+        UPDATE search SET product=new.name, description=COALESCE(new.description,'')
+        WHERE rowid IN (SELECT id FROM flavours WHERE product_id=new.id);
+    END;
+    """)
+    # удаление товара чистит вкусы каскадом — срабатывает search_flv_del;
+    # search_defer — массовая вставка индексирует сама, см. search.deferred
+    con.execute("""INSERT INTO search(rowid,product,description,flavour)
+                   SELECT f.id,p.name,COALESCE(p.description,''),f.name
+                   FROM flavours f JOIN products p ON p.id=f.product_id""")
+
+
+# ─────────────── v9: снимок строки заказа, архив закрытых заказов ───────────────
+def v9_archive(con):
+    # название на момент покупки (цена в order_items и так снимок): удаление
+    # товара больше не стирает строки старых заказов
+    if "name" not in _cols(con, "order_items"):
+        con.execute("ALTER TABLE order_items ADD COLUMN name TEXT")
+    con.execute("""UPDATE order_items SET name=(SELECT COALESCE(p.name||' – ','')||f.name FROM flavours f
+                                                LEFT JOIN products p ON p.id=f.product_id WHERE f.id=order_items.flavour_id)
+                   WHERE name IS NULL""")
+    run_script(con, """
+    CREATE TABLE IF NOT EXISTS archive(
+        month TEXT PRIMARY KEY,                 -- YYYY-MM, файл orders-YYYY-MM.jsonl.gz
+        first_id INTEGER NOT NULL, last_id INTEGER NOT NULL,
+        orders INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS archive_until(day TEXT NOT NULL);
+    """)
+    # закрытые заказы, созданные до archive_until.day, могут быть уже в архиве
+    con.execute("INSERT INTO archive_until SELECT '' WHERE NOT EXISTS(SELECT 1 FROM archive_until)")
+
+
+# ─────────────── v10: шина событий между процессами ───────────────
+def v10_bus(con):
+    run_script(con, """
+    CREATE TABLE IF NOT EXISTS bus(
+        id INTEGER PRIMARY KEY,
+        origin INTEGER NOT NULL,                -- pid процесса-автора
+        kind TEXT NOT NULL,                     -- flavours | products | category | clear | restock
+        keys TEXT NOT NULL DEFAULT '[]'         -- JSON-список
+    );
+    """)
+
+
+# ─────────────── v11: доставка заказа (мастер order_flow.json) ───────────────
+def v11_delivery(con):
+    # сводка ответов мастера: «🚗 Курьер, 🌆 Новый город, Крюково, к. 1»; NULL — заказ до v11
+    if "delivery" not in _cols(con, "orders"):
+        con.execute("ALTER TABLE orders ADD COLUMN delivery TEXT")
+
+
+# ─────────────── v12: первый заказ пользователя — не по orders ───────────────
+def v12_first_order(con):
+    # реф-скидка — на первый заказ; orders для этого не годится: архив (v9)
+    # удаляет старые заказы, и пользователь снова стал бы «новым»
+    if "first_order" not in _cols(con, "users"):
+        con.execute("ALTER TABLE users ADD COLUMN first_order INTEGER")
+    con.execute("INSERT OR IGNORE INTO users(id) SELECT DISTINCT user_id FROM orders")
+    # заказы, уже ушедшие в архив, видны по журналу кешбэка (earn/spend покупателя)
+    con.execute("""UPDATE users SET first_order=COALESCE(
+                       (SELECT MIN(id) FROM orders WHERE user_id=users.id),
+                       (SELECT MIN(order_id) FROM ledger WHERE user_id=users.id AND kind IN ('earn','spend')))
+                   WHERE first_order IS NULL""")
+
+
+# ─────────────── v13: ждущие в листе ожидания ───────────────
+def v13_waitlist_pending(con):
+    # waitlist.READY на каждом проходе рассылки: вкусы, которых кто-то ещё ждёт
+    con.execute("CREATE INDEX IF NOT EXISTS waitlist_pending ON waitlist(notified, flavour_id)")
+
+
+# ─────────────── v14: первые заказы, ушедшие в архив до v12 ───────────────
+def v14_first_order_archive(con):
+    # v12 видит только orders и журнал кешбэка: заказ без кешбэка, уже лежащий
+    # в архиве, там не найти. Его дочитывает archive.first_orders() по файлам
+    # архива (папку знает только бот) при старте; до этого archive.run ждёт
+    con.execute("CREATE TABLE IF NOT EXISTS first_order_backfill(pending INTEGER)")
+    con.execute("""INSERT INTO first_order_backfill SELECT 1
+                   WHERE EXISTS(SELECT 1 FROM archive) AND NOT EXISTS(SELECT 1 FROM first_order_backfill)""")
+
+
+MIGRATIONS = [v1_base, v2_indexes, v3_fsm, v4_pages, v5_waitlist, v6_ledger, v7_sales, v8_search, v9_archive,
+              v10_bus, v11_delivery, v12_first_order, v13_waitlist_pending, v14_first_order_archive]
+
+
+def migrate(con):
+    v = con.execute("PRAGMA user_version").fetchone()[0]
+    for n, step in enumerate(MIGRATIONS[v:], v+1):
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            step(con); con.execute(f"PRAGMA user_version={n}")
+        except BaseException:
+            con.execute("ROLLBACK"); raise
+        con.execute("COMMIT")
+        log.info("schema v%s: %s", n, step.__name__)
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+# ─────────────── план горячих запросов ───────────────
+# SQL — те же константы, что исполняют модули (keyset — как его строит db.keyset),
+# аргументы — образец; проверка — tests/test_plans.py и migrate_once.py --check
+_IDS = ",".join("?"*3)
+HOT_QUERIES = {
+    "cat_open":       (catalog.PRODUCTS, ("x",)),
+    "product_card":   (catalog.FLAVOURS, (1,)),
+    "choose_qty":     (catalog.FLAVOUR, (1,)),
+    "flow_exists":    (catalog.BY_NAME, ("x","y")),
+    "warehouse":      (keyset_sql(catalog.WAREHOUSE, ("f.product_id","f.id")), (5,5,31)),
+    "warehouse_back": (keyset_sql(catalog.WAREHOUSE, ("f.product_id","f.id"), fwd=False), (5,5,31)),
+    "cart_show":      (shop.CART, (1,)),
+    "my_orders":      (keyset_sql(shop.MY_ORDERS, ("id",), desc=True), (1,2**62,11)),
+    "list_orders":    (keyset_sql(shop.orders_query("paid")[0], ("id",), desc=True), ("paid",2**62,11)),
+    "list_orders_all": (keyset_sql(shop.orders_query("all")[0], ("id",), fwd=False, desc=True), (5,11)),
+    "ord_view":       (shop.CARD, (1,)),
+    "checkout_ref":   (shop.REF_OWNER, (1,)),
+    "checkout_first": (shop.FIRST, (1,)),
+    "restock":        (shop.ITEMS, (1,)),
+    "expire":         (shop.EXPIRED, ()),
+    "my_cb":          (ledger.BALANCE, (1,)),
+    "ledger_order":   (ledger.OPEN, (1,)),
+    "ledger_kind":    (ledger.OPEN_KIND, (1,"earn")),
+    "sales_status":   (sales.BY_STATUS, ("2024-01-01",)),
+    "sales_method":   (sales.BY_METHOD, ("2024-01-01",)),
+    "sales_top":      (sales.TOP, ("2024-01-01",)),
+    "sales_rebuild":  (sales.REBUILD_DAY, ("2024-01-01","2024-02-01")),
+    "sales_rebuild_flv": (sales.REBUILD_FLAVOUR, ("2024-01-01","2024-02-01")),
+    "archive_take":   (archive.TAKE, ("2023-01-01","2024-01-01",500)),
+    "archive_items":  (archive.ITEMS.format(_IDS), (1,2,3)),
+    "search_rows":    (search.ROWS.format(_IDS), (1,2,3)),
+    # тело триггера search_prd_upd (v8_search)
+    "search_prd_upd": ("SELECT id FROM flavours WHERE product_id=?", (1,)),
+    "waitlist_claim": (waitlist.CLAIM, (1,100)),
+    "waitlist_ready": (waitlist.READY, ()),
+}
+
+def check_plans(con):
+    """→ {имя: [строки плана со SCAN]}; пусто — все запросы идут по индексам."""
+    bad = {}
+    for name,(sql,args) in HOT_QUERIES.items():
+        plan = [r[-1] for r in con.execute("EXPLAIN QUERY PLAN "+sql, args)]
+        # SCAN подзапроса (MATERIALIZE s / CO-ROUTINE s) — это его готовый результат, не таблица
+        subs = {p.split()[-1] for p in plan if p.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+        scans = [p for p in plan if p.startswith("SCAN") and p!="SCAN CONSTANT ROW"
+                 and p.split()[1] not in subs]
+        if scans: bad[name] = scans
+    return bad
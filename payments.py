@@ -0,0 +1,81 @@
+"""
+Клиент платёжки @wallet для TON-счетов.
+
+Одна aiohttp-сессия на всё время жизни бота (keep-alive пул, без TCP+TLS
+рукопожатия на каждый заказ), ограниченные таймауты и повтор с
+экспоненциальной задержкой на сетевых ошибках и 429/5xx (Retry-After
+сервера — только если он не длиннее таймаута, иначе сразу PayError).
+Повтор безопасен: ключ идемпотентности `order-<id>` уходит и в заголовке,
+и как externalId, поэтому провайдер вернёт тот же счёт, а не создаст второй.
+"""
+
+import asyncio, json, logging, random
+import aiohttp
+
+log = logging.getLogger("payments")
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class PayError(Exception):
+    pass
+
+
+class _Retry(Exception):
+    def __init__(self, status, delay=None):
+        super().__init__(f"HTTP {status}"); self.delay = delay
+
+
+class TonPay:
+    URL = "https://pay.wallet.tg/wpay/api/v1/createInvoice"
+
+    def __init__(self, token:str, url:str=URL, timeout:float=10, retries:int=3, backoff:float=0.5):
+        self.token, self.url = token, url
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=min(3, timeout))
+        self.retries, self.backoff = retries, backoff
+        self._cs = None
+
+    def _session(self):
+        if self._cs is None or self._cs.closed:
+            self._cs = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=20, keepalive_timeout=60, ttl_dns_cache=300),
+                timeout=self.timeout, json_serialize=json.dumps)
+        return self._cs
+
+    async def create_invoice(self, order_id:int, ton_amount:float, callback_url:str) -> str:
+        key = f"order-{order_id}"
+        params = {
+            "amount": f"{ton_amount:.2f}",
+            "currency_code": "TON",
+            "description": f"Order #{order_id}",
+            "callback_url": callback_url,
+            "externalId": key,
+        }
+        headers = {"Authorization": f"Bearer {self.token}", "Idempotency-Key": key}
+        for attempt in range(self.retries+1):
+            try:
+                async with self._session().post(self.url, json=params, headers=headers) as r:
+                    if r.status in RETRY_STATUS:
+                        ra = r.headers.get("Retry-After")
+                        raise _Retry(r.status, float(ra) if ra and ra.isdigit() else None)
+                    if r.status >= 400:
+                        raise PayError(f"HTTP {r.status}: {(await r.text())[:200]}")
+                    try: js = await r.json(content_type=None)
+                    except ValueError as e:                 # 200 не JSON: страница ошибки прокси и т. п.
+                        raise PayError(f"order #{order_id}: not JSON: {e}") from e
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError, _Retry) as e:
+                if attempt == self.retries:
+                    raise PayError(f"order #{order_id}: {e!r}") from e
+                delay = getattr(e, "delay", None) or self.backoff * 2**attempt * (1 + random.random()/2)
+                # Retry-After больше таймаута запроса — не держать хендлер покупателя, а сдаться сразу
+                if delay > self.timeout.total:
+                    raise PayError(f"order #{order_id}: {e!r}, Retry-After {delay:g}s") from e
+                log.warning("order #%s: %r, retry %s in %.1fs", order_id, e, attempt+1, delay)
+                await asyncio.sleep(delay)
+                continue
+            if not isinstance(js, dict) or not js.get("invoice_url"):
+                raise PayError(f"order #{order_id}: no invoice_url in {str(js)[:200]}")
+            return js["invoice_url"]
+
+    async def close(self):
+        if self._cs and not self._cs.closed: await self._cs.close()
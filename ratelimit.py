@@ -0,0 +1,51 @@
+"""
+Ограничители скорости для исходящих сообщений.
+
+Bucket — токен-бакет: в среднем rate штук в секунду, подряд не больше
+burst; pause(s) останавливает всех на s секунд (ответ 429 RetryAfter).
+ChatGap — не чаще одного сообщения в gap секунд в один чат (лимит Telegram
+на личный чат — около 1 в секунду): wait() перед отправкой, mark() — в момент
+отправки.
+"""
+
+import asyncio, time
+
+
+class Bucket:
+    def __init__(self, rate:float, burst:float=None):
+        self.rate, self.burst = rate, burst or rate
+        self.tokens, self.t = self.burst, time.monotonic()
+        self.paused = 0.0
+
+    def _fill(self, now):
+        self.tokens = min(self.burst, self.tokens+(now-self.t)*self.rate); self.t = now
+
+    def try_take(self) -> bool:
+        now = time.monotonic()
+        if now < self.paused: return False
+        self._fill(now)
+        if self.tokens < 1: return False
+        self.tokens -= 1; return True
+
+    async def take(self):
+        while not self.try_take():
+            now = time.monotonic()
+            await asyncio.sleep(max(self.paused-now, (1-self.tokens)/self.rate, 0.001))
+
+    def pause(self, s:float):
+        self.paused = max(self.paused, time.monotonic()+s)
+
+
+class ChatGap:
+    def __init__(self, gap:float=1.0):
+        self.gap, self.last = gap, {}
+
+    async def wait(self, chat):
+        """Дождаться, пока в чат снова можно писать; отправку отмечает mark()."""
+        if (t := self.last.get(chat)) is not None and (d := self.gap-(time.monotonic()-t)) > 0:
+            await asyncio.sleep(d)
+
+    def mark(self, chat):
+        now = self.last[chat] = time.monotonic()
+        if len(self.last) > 10_000:                     # старые отметки уже ничего не ограничивают
+            self.last = {c: t for c, t in self.last.items() if now-t < self.gap}
@@ -0,0 +1,114 @@
+"""
+Дневные агрегаты продаж для «📊 Статистика».
+
+sales_day(день, способ оплаты, статус) — число заказов, сумма и скидка;
+sales_flavour(день, вкус) — штуки и сумма по неотменённым заказам.
+День — дата создания заказа (UTC), поэтому смена статуса переносит заказ
+между строками того же дня. Агрегаты ведутся в той же транзакции, что и
+сам заказ (placed/moved из shop.py), и отчёт за любой период читает
+≤ дней × (способы × статусы) строк и ≤ дней × вкусов для топа, сколько
+бы ни было заказов.
+
+История, накопленная до появления таблиц, досчитывается фоновым
+backfill() кусками по дням (sales_backfill: next — курсор, stop — день
+миграции; дальше всё ведётся инкрементально). Кусок пересчитывается
+целиком в одной транзакции, так что живые заказы, пришедшие во время
+досчёта, не теряются и не удваиваются.
+"""
+
+import datetime as dt
+
+
+def today(): return dt.datetime.now(dt.timezone.utc).date()   # datetime('now') в SQLite — UTC
+
+
+_ORDER = """INSERT INTO sales_day(day,pay_method,status,orders,revenue,discount)
+            SELECT date(created),COALESCE(pay_method,''),?,?,?*total,?*discount FROM orders WHERE id=?
+            ON CONFLICT DO UPDATE SET orders=orders+excluded.orders, revenue=revenue+excluded.revenue,
+                                      discount=discount+excluded.discount"""
+_ITEMS = """INSERT INTO sales_flavour(day,flavour_id,units,revenue)
+            SELECT date(o.created),oi.flavour_id,?*SUM(oi.qty),?*SUM(oi.qty*oi.price)
+            FROM orders o JOIN order_items oi ON oi.order_id=o.id WHERE o.id=? GROUP BY oi.flavour_id
+            ON CONFLICT DO UPDATE SET units=units+excluded.units, revenue=revenue+excluded.revenue"""
+
+
+def _order(con, oid, status, sign): con.execute(_ORDER, (status, sign, sign, sign, oid))
+def _items(con, oid, sign):         con.execute(_ITEMS, (sign, sign, oid))
+
+
+def placed(con, oid:int):
+    """Новый заказ (pending)."""
+    _order(con, oid, "pending", 1); _items(con, oid, 1)
+
+def moved(con, oid:int, old:str, new:str):
+    """Смена статуса: заказ переезжает в другую строку, отмена вычитает штуки."""
+    if old == new: return
+    _order(con, oid, old, -1); _order(con, oid, new, 1)
+    if new == "cancel": _items(con, oid, -1)
+    elif old == "cancel": _items(con, oid, 1)
+
+
+# ─────────────── пересчёт из истории ───────────────
+REBUILD_DAY = """INSERT INTO sales_day(day,pay_method,status,orders,revenue,discount)
+                 SELECT date(created),COALESCE(pay_method,''),status,COUNT(*),SUM(total),SUM(discount)
+                 FROM orders WHERE created>=? AND created<? GROUP BY 1,2,3"""
+REBUILD_FLAVOUR = """INSERT INTO sales_flavour(day,flavour_id,units,revenue)
+                     SELECT date(o.created),oi.flavour_id,SUM(oi.qty),SUM(oi.qty*oi.price)
+                     FROM orders o JOIN order_items oi ON oi.order_id=o.id
+                     WHERE o.created>=? AND o.created<? AND o.status<>'cancel' GROUP BY 1,2"""
+
+def rebuild(con, since:str="", until:str="9999") -> int:
+    """Пересчитать дни [since, until) из orders/order_items. → строк sales_day.
+    Дни до archive_until не трогает: часть их заказов уже в архиве (archive.py)."""
+    since = max(since, con.execute("SELECT day FROM archive_until").fetchone()[0])
+    con.execute("DELETE FROM sales_day WHERE day>=? AND day<?", (since, until))
+    con.execute("DELETE FROM sales_flavour WHERE day>=? AND day<?", (since, until))
+    n = con.execute(REBUILD_DAY, (since, until)).rowcount
+    con.execute(REBUILD_FLAVOUR, (since, until))
+    return n
+
+async def backfill(db, days:int=1):
+    """Досчитать историю кусками по days дней, по транзакции на кусок
+    (день — короткая транзакция, checkout между кусками не ждёт)."""
+    while row := await db.fetchone("SELECT next,stop FROM sales_backfill"):
+        since, stop = row
+        until = min(stop, (dt.date.fromisoformat(since)+dt.timedelta(days=days)).isoformat())
+        def step(con):
+            rebuild(con, since, until)
+            if until < stop: con.execute("UPDATE sales_backfill SET next=?", (until,))
+            else:            con.execute("DELETE FROM sales_backfill")
+        await db.tx(step)
+
+
+# ─────────────── отчёт ───────────────
+# migrations.HOT_QUERIES проверяет планы этих запросов
+BY_STATUS = """SELECT status,SUM(orders),SUM(revenue-discount) FROM sales_day
+               WHERE day>=? GROUP BY status HAVING SUM(orders)<>0 ORDER BY 2 DESC"""
+BY_METHOD = """SELECT pay_method,SUM(orders),SUM(revenue),SUM(discount) FROM sales_day
+               WHERE day>=? AND status<>'cancel' GROUP BY pay_method HAVING SUM(orders)<>0 ORDER BY 3 DESC"""
+TOP       = """SELECT s.flavour_id,p.name,f.name,s.units,s.revenue FROM
+                 (SELECT flavour_id,SUM(units) units,SUM(revenue) revenue FROM sales_flavour
+                  WHERE day>=? GROUP BY flavour_id HAVING units>0 ORDER BY units DESC LIMIT 10) s
+               LEFT JOIN flavours f ON f.id=s.flavour_id
+               LEFT JOIN products p ON p.id=f.product_id
+               ORDER BY s.units DESC"""
+async def report(db, days:int):
+    """Последние days дней (включая сегодня) → текст."""
+    since = (today()-dt.timedelta(days=days-1)).isoformat()
+    by_status = await db.fetchall(BY_STATUS, (since,))
+    by_method = await db.fetchall(BY_METHOD, (since,))
+    top = await db.fetchall(TOP, (since,))
+    n = sum(o for _, o, _, _ in by_method)
+    rev = sum(r for _, _, r, _ in by_method); disc = sum(d for *_, d in by_method)
+    lines = [f"<b>📊 {'Сегодня' if days == 1 else f'{days} дней'}</b> (с {since})",
+             f"Заказов: {n} • выручка {rev-disc:.0f}₽ (скидки {disc:.0f}₽)" + (f" • чек {(rev-disc)/n:.0f}₽" if n else "")]
+    if by_method:
+        lines += ["", "<b>Оплата:</b>"] + [f"{m or '—'}: {o} • {r-d:.0f}₽" for m, o, r, d in by_method]
+    if by_status:
+        lines += ["", "<b>Статусы:</b>"] + [f"{s}: {o} • {r:.0f}₽" for s, o, r in by_status]
+    if top:
+        lines += ["", "<b>Топ вкусов:</b>"] + [f"{fid}. {pn or '?'} – {fn or 'удалён'}: {u} шт • {r:.0f}₽"
+                                               for fid, pn, fn, u, r in top]
+    if await db.fetchone("SELECT 1 FROM sales_backfill"):
+        lines += ["", "⏳ История ещё досчитывается."]
+    return "\n".join(lines)
@@ -0,0 +1,69 @@
+"""
+Полнотекстовый поиск по каталогу (SQLite FTS5).
+
+Таблица search — по строке на вкус (rowid = flavours.id): название
+товара, описание, название вкуса. Синхронизируется триггерами на
+products/flavours (см. migrations.v8_search); смена цены/остатка индекс
+не трогает, так что checkout за поиск не платит. Массовая вставка
+вкусов (импорт) идёт через deferred(): построчный триггер на каждой
+строке сбрасывал бы буфер FTS5 в отдельный сегмент.
+
+Запрос пользователя → слова (≥ 2 символов), все обязательны, каждое —
+префикс из первых PREFIX букв («затяжек» найдёт и «затяжка»). Префиксы
+до PREFIX букв лежат в индексе готовыми термами (prefix='2 3 4 5 6'),
+поэтому читаются лениво; более длинный префикс FTS5 собирал бы
+слиянием всех подходящих термов — O(совпадений) на каждый запрос.
+Ранжирование bm25 тоже стоит O(совпадений), поэтому сначала
+дешёвый подсчёт с LIMIT: до RANK_MAX совпадений — по релевантности
+(название товара весит больше вкуса, вкус — больше описания), шире —
+самые новые, по rowid, что FTS5 отдаёт без сортировки.
+"""
+
+import re
+from contextlib import contextmanager
+
+RANK_MAX = 1000
+PREFIX = 6                  # = наибольшая длина из prefix= в migrations.v8_search
+_WORD = re.compile(r"\w+")
+
+COUNT  = "SELECT COUNT(*) FROM (SELECT 1 FROM search WHERE search MATCH ? LIMIT ?)"
+RANKED = "SELECT rowid FROM search WHERE search MATCH ? ORDER BY bm25(search, 10.0, 1.0, 5.0) LIMIT ? OFFSET ?"
+NEWEST = "SELECT rowid FROM search WHERE search MATCH ? ORDER BY rowid DESC LIMIT ? OFFSET ?"
+ROWS   = """SELECT f.id,p.name,f.name,f.price,f.stock FROM flavours f JOIN products p ON p.id=f.product_id
+            WHERE f.id IN ({})"""
+
+
+def match(text:str):
+    """Текст → выражение MATCH или None, если искать нечего."""
+    words = [w for w in _WORD.findall((text or "").lower()) if len(w) >= 2][:8]
+    return " ".join(f'"{w[:PREFIX]}"*' for w in words) or None
+
+
+def find(con, text:str, limit:int=20, offset:int=0):
+    """→ [(fid, товар, вкус, цена, остаток)] в порядке выдачи."""
+    if not (q := match(text)): return []
+    n, = con.execute(COUNT, (q, RANK_MAX+1)).fetchone()
+    ids = [r for r, in con.execute(RANKED if n <= RANK_MAX else NEWEST, (q, limit, offset))]
+    if not ids: return []
+    rows = {r[0]: r for r in con.execute(ROWS.format(",".join("?"*len(ids))), ids)}
+    return [rows[i] for i in ids if i in rows]
+
+
+INDEX = """INSERT INTO search(rowid,product,description,flavour)
+           SELECT f.id,p.name,COALESCE(p.description,''),f.name
+           FROM flavours f JOIN products p ON p.id=f.product_id"""
+
+@contextmanager
+def deferred(con):
+    """Внутри транзакции: вставленные в блоке вкусы индексируются одним
+    INSERT … SELECT в конце, а не триггером по строке."""
+    last, = con.execute("SELECT COALESCE(MAX(id),0) FROM flavours").fetchone()
+    con.execute("INSERT INTO search_defer VALUES(1)")
+    yield
+    con.execute("DELETE FROM search_defer")
+    con.execute(INDEX+" WHERE f.id>?", (last,))
+
+def rebuild(con):
+    """Переиндексировать весь каталог (после сбоя или ручных правок в обход триггеров)."""
+    con.execute("DELETE FROM search")
+    con.execute(INDEX)
@@ -0,0 +1,144 @@
+"""
+Операции с заказами. Каждая функция получает соединение писателя и
+вызывается внутри db.tx(...) — то есть целиком в одной короткой
+транзакции BEGIN IMMEDIATE; исключение откатывает всё.
+Кешбэк меняется только через ledger.post, дневные агрегаты — через sales.
+"""
+
+import ledger, sales
+
+REF_BONUS = 300
+
+# запросы заказов (и хендлеров бота над ними); migrations.HOT_QUERIES проверяет их планы
+CART       = """SELECT f.name,c.qty,f.price FROM carts c JOIN flavours f ON f.id=c.flavour_id
+                WHERE c.user_id=?"""
+MY_ORDERS  = "SELECT id,created,status,total,discount FROM orders WHERE user_id=?"   # db.keyset
+ORDERS     = "SELECT id,user_id,status,total,discount FROM orders"
+CARD       = """SELECT o.user_id,o.created,o.status,o.total,o.discount,o.delivery,
+                       oi.flavour_id,oi.name,oi.qty,oi.price
+                FROM orders o JOIN order_items oi ON oi.order_id=o.id WHERE o.id=?"""
+FIRST      = "SELECT first_order FROM users WHERE id=?"
+REF_OWNER  = "SELECT owner_id FROM refs WHERE used_by_id=?"
+ITEMS      = "SELECT DISTINCT flavour_id FROM order_items WHERE order_id=?"
+EXPIRED    = "SELECT id,user_id FROM orders WHERE status='pending' AND reserved_until<datetime('now')"
+
+
+def orders_query(status:str):
+    """Список заказов админки для db.keyset: status или "all" → (sql, args)."""
+    return (ORDERS+" WHERE 1", ()) if status=="all" else (ORDERS+" WHERE status=?", (status,))
+
+
+class OutOfStock(Exception):
+    """Не хватает остатка; .short — [(вкус, нужно, есть), …]."""
+    def __init__(self, short):
+        super().__init__(short); self.short = short
+
+
+def place_order(con, uid:int, method:str, reserve_min:int=0, delivery:str=None):
+    """Корзина → заказ. None, если корзина пуста; OutOfStock, если не хватает.
+    delivery — сводка доставки из мастера оформления (для менеджера)."""
+    items=con.execute("""SELECT f.id,f.name,f.price,c.qty,f.stock
+                         FROM carts c JOIN flavours f ON f.id=c.flavour_id
+                         WHERE c.user_id=?""",(uid,)).fetchall()
+    if not items: return None
+    # условное списание одним UPDATE: строка меняется, только если остатка хватает
+    cur=con.execute("""UPDATE flavours
+                       SET stock=stock-(SELECT qty FROM carts WHERE user_id=:u AND flavour_id=flavours.id)
+                       WHERE id IN (SELECT flavour_id FROM carts WHERE user_id=:u)
+                         AND stock>=(SELECT qty FROM carts WHERE user_id=:u AND flavour_id=flavours.id)""",
+                    {"u":uid})
+    if cur.rowcount!=len(items):
+        raise OutOfStock([(n,q,s) for _,n,_,q,s in items if s<q])
+
+    total=sum(p*q for _,_,p,q,_ in items); discount=0
+    # TON скидка
+    if method=="ton": discount+=round(total*0.07,2)
+    # реф-скидка — на первый заказ; он в users.first_order, а не по orders: архив их удаляет
+    owner=None
+    first=not (con.execute(FIRST, (uid,)).fetchone() or (None,))[0]
+    if first and (row:=con.execute(REF_OWNER, (uid,)).fetchone()):
+        discount+=REF_BONUS; owner=row[0]
+    # кешбэк списание
+    row=con.execute("SELECT cashback FROM users WHERE id=?", (uid,)).fetchone()
+    use=round(max(0,min(row[0],total-discount)),2) if row and row[0] else 0
+    discount+=use
+
+    until=f"+{reserve_min} minutes" if reserve_min else None
+    oid=con.execute("""INSERT INTO orders(user_id,total,pay_method,discount,status,reserved_until,delivery)
+                       VALUES(?,?,?,?,'pending',datetime('now',?),?)""",
+                    (uid,total,method,discount,until,delivery)).lastrowid
+    if first: con.execute("""INSERT INTO users(id,first_order) VALUES(?,?)
+                             ON CONFLICT(id) DO UPDATE SET first_order=excluded.first_order""", (uid,oid))
+    if owner: ledger.post(con, owner, "ref", oid, cashback=REF_BONUS)
+    if use:   ledger.post(con, uid, "spend", oid, cashback=-use)
+    # название и цена — снимок на момент покупки
+    con.execute("""INSERT INTO order_items(order_id,flavour_id,qty,price,name)
+                   SELECT ?,c.flavour_id,c.qty,f.price,COALESCE(p.name||' – ','')||f.name
+                   FROM carts c JOIN flavours f ON f.id=c.flavour_id LEFT JOIN products p ON p.id=f.product_id
+                   WHERE c.user_id=?""",(oid,uid))
+    sales.placed(con, oid)
+    con.execute("DELETE FROM carts WHERE user_id=?", (uid,))
+    return oid, max(0,total-discount), [f for f,*_ in items]
+
+
+def _reserve(con, oid:int):
+    """Снова списать штуки отменённого заказа — тем же условным UPDATE, что
+    place_order; OutOfStock, если их уже раскупили (или вкус удалён)."""
+    items=con.execute("""SELECT oi.name,SUM(oi.qty),f.stock FROM order_items oi
+                         LEFT JOIN flavours f ON f.id=oi.flavour_id
+                         WHERE oi.order_id=? GROUP BY oi.flavour_id""",(oid,)).fetchall()
+    cur=con.execute("""UPDATE flavours
+                       SET stock=stock-(SELECT SUM(qty) FROM order_items WHERE order_id=:o AND flavour_id=flavours.id)
+                       WHERE id IN (SELECT flavour_id FROM order_items WHERE order_id=:o)
+                         AND stock>=(SELECT SUM(qty) FROM order_items WHERE order_id=:o AND flavour_id=flavours.id)""",
+                    {"o":oid})
+    if cur.rowcount!=len(items):
+        raise OutOfStock([(n,q,s or 0) for n,q,s in items if (s or 0)<q])
+
+
+def _restock(con, oid:int):
+    con.execute("""UPDATE flavours
+                   SET stock=stock+(SELECT SUM(qty) FROM order_items WHERE order_id=:o AND flavour_id=flavours.id)
+                   WHERE id IN (SELECT flavour_id FROM order_items WHERE order_id=:o)""", {"o":oid})
+    return [f for f, in con.execute(ITEMS, (oid,))]
+
+
+def set_status(con, oid:int, new:str):
+    """Смена статуса. Отмена неотгруженного заказа возвращает резерв на склад;
+    отмена окончательна — штуки уже снова в продаже, а кешбэк сторнирован
+    (вернуть заказ может только оплата, mark_paid).
+    → (старый статус, изменённые вкусы), ("cancel", None) — заказ отменён
+    и не меняется, или None, если заказа нет."""
+    row=con.execute("SELECT status FROM orders WHERE id=?", (oid,)).fetchone()
+    if not row: return None
+    old,fids=row[0],[]
+    if old=="cancel": return old, None
+    if new=="cancel" and old in ("pending","paid"): fids=_restock(con, oid)
+    con.execute("UPDATE orders SET status=?, reserved_until=NULL WHERE id=?", (new,oid))
+    ledger.settle(con, oid, new); sales.moved(con, oid, old, new)
+    return old, fids
+
+
+def expire_reservations(con):
+    """Неоплаченные заказы с истёкшим резервом → cancel. → [(oid, uid)], вкусы."""
+    rows=con.execute(EXPIRED).fetchall()
+    fids=set()
+    for oid,_ in rows: fids.update(set_status(con, oid, "cancel")[1])
+    return rows, fids
+
+
+def mark_paid(con, oid:int):
+    """Оплата подтверждена провайдером: pending → paid. Оплата отменённого
+    заказа (резерв истёк раньше, чем пришли деньги): штуки резервируются
+    снова, кешбэк и реф-бонус проводятся заново; не хватает штук —
+    OutOfStock, заказ остаётся отменённым; кешбэк уже потрачен — заказ
+    оплачен без его списания (ledger.reopen), разбирается менеджер.
+    → (user_id, старый статус, несписанный кешбэк) или None, если заказ
+    не ждёт оплаты (нет его или уже paid/done)."""
+    row=con.execute("SELECT user_id,status FROM orders WHERE id=?", (oid,)).fetchone()
+    if not row or row[1] not in ("pending","cancel"): return None
+    uid,old=row; short=0
+    if old=="cancel": _reserve(con, oid); short=ledger.reopen(con, oid)
+    con.execute("UPDATE orders SET status='paid', reserved_until=NULL WHERE id=?", (oid,))
+    sales.moved(con, oid, old, "paid")
+    return uid, old, short
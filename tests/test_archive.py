@@ -0,0 +1,38 @@
+"""
+Реф-скидка — только на первый заказ, и покупатель, чей заказ без кешбэка
+ушёл в архив ещё до v12, «новым» не становится (archive.first_orders).
+
+    python -m pytest tests
+"""
+import asyncio, os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import DB, connect
+import archive, migrations, shop
+
+
+def test_first_order_from_archive(tmp_path, monkeypatch):
+    path, folder = str(tmp_path/"shop.db"), str(tmp_path/"archive")
+    con = connect(path)
+    monkeypatch.setattr(migrations, "MIGRATIONS", migrations.MIGRATIONS[:11])   # база до v12
+    migrations.migrate(con)
+    con.execute("INSERT INTO flavours(id,name,price,stock) VALUES(1,'f',1000,10)")
+    con.execute("INSERT INTO users(id) VALUES(5)")
+    con.execute("INSERT INTO refs VALUES('R9',9,5)")
+    con.execute("""INSERT INTO orders(id,user_id,total,pay_method,discount,status,created)
+                   VALUES(1,5,1000,'card',0,'done','2020-01-01 10:00:00')""")
+    con.execute("BEGIN IMMEDIATE"); archive.move(con, folder, "2021-01-01"); con.execute("COMMIT")
+    monkeypatch.undo(); migrations.migrate(con)
+    con.close()
+
+    async def main():
+        db = DB(path)
+        assert await db.fetchone("SELECT first_order FROM users WHERE id=5") == (None,)   # v12 его не видит
+        assert await archive.run(db, folder, 1) == 0                 # ждёт first_orders
+        assert await archive.first_orders(db, folder) == 1
+        assert await archive.first_orders(db, folder) == 0           # один раз
+        await db.execute("INSERT INTO carts VALUES(5,1,1)")
+        oid = (await db.tx(lambda con: shop.place_order(con, 5, "card")))[0]
+        assert await db.fetchone("SELECT discount FROM orders WHERE id=?", (oid,)) == (0,)
+        assert await db.fetchone("SELECT first_order FROM users WHERE id=5") == (1,)
+        db.close()
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+"""
+Без перепродажи при настоящей гонке: несколько писателей на одном файле
+(отдельные db.DB — как воркеры cluster.py, и отдельные процессы) одновременно
+оформляют заказы на один вкус. Склад не уходит в минус, заказов ровно stock.
+
+    python -m pytest tests
+"""
+import asyncio, multiprocessing as mp, os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import DB, connect
+import migrations, shop
+
+STOCK, BUYERS = 7, 40
+
+
+def setup(path):
+    con = connect(path); migrations.migrate(con)
+    con.execute("INSERT INTO flavours(id,name,price,stock) VALUES(1,'hot',100,?)", (STOCK,))
+    con.executemany("INSERT INTO users(id) VALUES(?)", [(u,) for u in range(1, BUYERS+1)])
+    con.executemany("INSERT INTO carts VALUES(?,1,1)", [(u,) for u in range(1, BUYERS+1)])
+    con.close()
+
+def check(path, ok):
+    con = connect(path)
+    stock, = con.execute("SELECT stock FROM flavours WHERE id=1").fetchone()
+    orders, = con.execute("SELECT COUNT(*) FROM orders").fetchone()
+    sold, = con.execute("SELECT COALESCE(SUM(qty),0) FROM order_items").fetchone()
+    con.close()
+    assert stock == 0 and ok == orders == sold == STOCK
+
+
+def test_concurrent_writers(tmp_path):
+    path = str(tmp_path/"shop.db"); setup(path)
+    async def main():
+        dbs = [DB(path, readers=1) for _ in range(4)]
+        async def buy(uid):
+            try: return bool(await dbs[uid % len(dbs)].tx(lambda con: shop.place_order(con, uid, "card")))
+            except shop.OutOfStock: return False
+        ok = sum(await asyncio.gather(*(buy(u) for u in range(1, BUYERS+1))))
+        for db in dbs: db.close()
+        return ok
+    check(path, asyncio.run(main()))
+
+
+def _buyer(path, uids, start, out):
+    con = connect(path); ok = 0
+    start.wait()
+    for uid in uids:
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            ok += bool(shop.place_order(con, uid, "card")); con.execute("COMMIT")
+        except shop.OutOfStock:
+            con.execute("ROLLBACK")
+    out.put(ok)
+
+def test_concurrent_processes(tmp_path):
+    path = str(tmp_path/"shop.db"); setup(path)
+    ctx = mp.get_context("spawn"); start, out = ctx.Event(), ctx.Queue()
+    procs = [ctx.Process(target=_buyer, args=(path, range(i, BUYERS+1, 4), start, out)) for i in range(1, 5)]
+    for p in procs: p.start()
+    start.set()
+    ok = sum(out.get(timeout=60) for _ in procs)
+    for p in procs: p.join(10)
+    check(path, ok)
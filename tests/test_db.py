@@ -0,0 +1,26 @@
+"""
+db.DB: писатель после упавшего COMMIT не остаётся внутри транзакции.
+
+    python -m pytest tests
+"""
+import asyncio, os, sqlite3, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pytest
+from db import DB
+
+
+def test_failed_commit_rolls_back(tmp_path):
+    async def main():
+        db = DB(str(tmp_path/"db.db"))
+        # отложенный внешний ключ проверяется только на COMMIT
+        await db.raw(lambda con: con.executescript("""
+            PRAGMA foreign_keys=ON;
+            CREATE TABLE p(id INTEGER PRIMARY KEY);
+            CREATE TABLE c(pid REFERENCES p(id) DEFERRABLE INITIALLY DEFERRED);"""))
+        with pytest.raises(sqlite3.IntegrityError):
+            await db.execute("INSERT INTO c VALUES(5)")
+        await db.execute("INSERT INTO p VALUES(1)")        # писатель жив: новая транзакция проходит
+        assert await db.fetchall("SELECT * FROM p") == [(1,)]
+        assert await db.fetchall("SELECT * FROM c") == []
+        db.close()
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+"""
+Кешбэк не тратится дважды: оплата TON пришла после авто-отмены, а
+возвращённый отменой кешбэк уже ушёл на другой заказ.
+
+    python -m pytest tests
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import connect
+import ledger, migrations, shop
+
+
+def tx(con, fn):
+    con.execute("BEGIN IMMEDIATE")
+    try: res = fn(con)
+    except BaseException: con.execute("ROLLBACK"); raise
+    con.execute("COMMIT"); return res
+
+def order(con, uid):
+    con.execute("INSERT INTO carts VALUES(?,1,1)", (uid,))
+    return tx(con, lambda c: shop.place_order(c, uid, "ton"))[0]
+
+
+def test_late_payment_does_not_respend_cashback(tmp_path):
+    con = connect(str(tmp_path/"shop.db")); migrations.migrate(con)
+    con.execute("INSERT INTO flavours(id,name,price,stock) VALUES(1,'f',1000,10)")
+    tx(con, lambda c: ledger.post(c, 5, "opening", cashback=500))
+    a = order(con, 5)                                       # A списал 500
+    con.execute("UPDATE orders SET reserved_until=datetime('now','-1 minute')")
+    assert tx(con, shop.expire_reservations)[0] == [(a, 5)]   # резерв истёк: +500
+    order(con, 5)                                           # B снова списал 500
+    assert tx(con, lambda c: shop.mark_paid(c, a)) == (5, "cancel", 500)
+    assert con.execute("SELECT cashback FROM users WHERE id=5").fetchone()[0] == 0
+    assert con.execute("SELECT status FROM orders WHERE id=?", (a,)).fetchone()[0] == "paid"
+    assert ledger.check(con) == {}
+
+
+def test_late_payment_respends_cashback_still_on_balance(tmp_path):
+    con = connect(str(tmp_path/"shop.db")); migrations.migrate(con)
+    con.execute("INSERT INTO flavours(id,name,price,stock) VALUES(1,'f',1000,10)")
+    tx(con, lambda c: ledger.post(c, 5, "opening", cashback=500))
+    a = order(con, 5)
+    tx(con, lambda c: shop.set_status(c, a, "cancel"))
+    assert tx(con, lambda c: shop.mark_paid(c, a)) == (5, "cancel", 0)
+    assert con.execute("SELECT cashback FROM users WHERE id=5").fetchone()[0] == 0
+    assert ledger.check(con) == {}
+
+
+def test_check_reports_negative_balance(tmp_path):
+    con = connect(str(tmp_path/"shop.db")); migrations.migrate(con)
+    tx(con, lambda c: ledger.post(c, 5, "spend", cashback=-100))
+    assert list(ledger.check(con)) == ["negative"]
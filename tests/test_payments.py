@@ -0,0 +1,44 @@
+"""
+payments.TonPay против локального сервера: любой сбой провайдера — PayError,
+и хендлер покупателя не ждёт дольше таймаута.
+
+    python -m pytest tests
+"""
+import asyncio, os, sys, time
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pytest
+from aiohttp import web
+from payments import TonPay, PayError
+
+
+def invoice(handler, **kw):
+    async def main():
+        async def h(r):
+            res = handler(r)
+            return await res if asyncio.iscoroutine(res) else res
+        app = web.Application(); app.router.add_post("/", h)
+        runner = web.AppRunner(app); await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0); await site.start()
+        pay = TonPay("t", url=f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/", **kw)
+        try: return await pay.create_invoice(1, 1.0, "http://x/ton_paid")
+        finally: await pay.close(); await runner.cleanup()
+    return asyncio.run(main())
+
+
+def test_not_json():
+    with pytest.raises(PayError, match="not JSON"):
+        invoice(lambda r: web.Response(text="<html>502 Bad Gateway</html>"))
+
+def test_long_retry_after_fails_fast():
+    t = time.perf_counter()
+    with pytest.raises(PayError, match="Retry-After"):
+        invoice(lambda r: web.Response(status=429, headers={"Retry-After": "3600"}), timeout=2)
+    assert time.perf_counter()-t < 1
+
+def test_short_retry_after_retries():
+    calls = []
+    async def h(r):
+        calls.append(1)
+        if len(calls) == 1: return web.Response(status=429, headers={"Retry-After": "1"})
+        return web.json_response({"invoice_url": "https://pay/1"})
+    assert invoice(h, timeout=2) == "https://pay/1" and len(calls) == 2
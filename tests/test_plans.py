@@ -0,0 +1,22 @@
+"""
+Планы горячих запросов на свежей схеме: ни один не читает таблицу полным
+сканом. SQL — константы модулей, которые эти запросы исполняют
+(migrations.HOT_QUERIES), так что правка запроса в хендлере попадает сюда.
+
+    python -m pytest tests
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from db import connect
+import migrations
+
+
+def test_hot_queries_use_indexes(tmp_path):
+    con = connect(str(tmp_path/"plans.db")); migrations.migrate(con)
+    assert migrations.check_plans(con) == {}
+
+
+def test_check_plans_sees_scans(tmp_path, monkeypatch):
+    con = connect(str(tmp_path/"plans.db")); migrations.migrate(con)
+    monkeypatch.setattr(migrations, "HOT_QUERIES", {"bad": ("SELECT id FROM flavours WHERE price>?", (1,))})
+    assert list(migrations.check_plans(con)) == ["bad"]
@@ -0,0 +1,83 @@
+"""
+throttle.Throttle: двойной тап схлопывается, лимит — на пользователя,
+админы не ограничены (но двойной тап схлопывается и у них).
+Нагрузочный прогон на настоящем bot.py — bench/bench_throttle.py.
+
+    python -m pytest tests
+"""
+import asyncio, os, sys
+from types import SimpleNamespace as NS
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+import pytest
+from aiogram.dispatcher.handler import CancelHandler
+from throttle import Throttle
+
+ADMIN = 1
+
+
+def callback(uid, data):
+    async def answer(text=None, *a, **kw): answers.append(text)
+    answers = []
+    return NS(from_user=NS(id=uid), data=data, answer=answer, answers=answers)
+
+def message(uid): return NS(from_user=NS(id=uid))
+
+async def tap(th, c, handler):
+    """Как Dispatcher: pre → хендлер → post; False — отброшено до хендлера."""
+    data = {}
+    try: await th.on_pre_process_callback_query(c, data)
+    except CancelHandler: return False
+    try: await handler()
+    finally: await th.on_post_process_callback_query(c, [], data)
+    return True
+
+def th(): return Throttle({"*": (3, 10), "msg": (2, 8), "qty": (2, 6)}, collapse=("qty", "fw"), exempt={ADMIN})
+
+
+@pytest.mark.parametrize("uid", [5, ADMIN])
+def test_duplicate_tap_collapses(uid):
+    t, runs = th(), []
+    async def handler(): runs.append(1); await asyncio.sleep(0.05)     # «✅ Подтвердить» ещё оформляет заказ
+    async def main():
+        taps = [callback(uid, "fw:order:ok") for _ in range(20)]
+        ok = await asyncio.gather(*(tap(t, c, handler) for c in taps))
+        assert sum(ok) == len(runs) == 1 and t.stats["collapsed"] == 19
+        assert all(c.answers == ["⏳"] for c, o in zip(taps, ok) if not o)
+        assert await tap(t, callback(uid, "fw:order:ok"), handler)     # обработан — снова можно
+    asyncio.run(main())
+
+
+def test_per_user_limit():
+    t = th()
+    async def noop(): pass
+    async def main():
+        taps = [callback(5, "fav:1") for _ in range(30)]
+        ok = [await tap(t, c, noop) for c in taps]
+        assert sum(ok) == 10 and t.stats["throttled"] == 20
+        assert sum(c.answers == ["Слишком часто, подождите секунду"] for c in taps) == 1   # один ответ на серию
+        assert await tap(t, callback(6, "fav:1"), noop)             # чужой лимит не тратится
+        assert await tap(t, callback(5, "qty:1:1"), noop)           # у другого действия — свой бакет
+    asyncio.run(main())
+
+
+def test_messages_limited_per_user():
+    t = th()
+    async def send(uid):
+        try: await t.on_pre_process_message(message(uid), {}); return True
+        except CancelHandler: return False
+    async def main():
+        assert sum([await send(5) for _ in range(20)]) == 8
+        assert await send(6)
+    asyncio.run(main())
+
+
+def test_admin_exempt():
+    t = th()
+    async def noop(): pass
+    async def main():
+        for _ in range(100):
+            await t.on_pre_process_message(message(ADMIN), {})
+            await t.on_pre_process_inline_query(message(ADMIN), {})
+        assert all([await tap(t, callback(ADMIN, "set:1:paid"), noop) for _ in range(100)])
+        assert t.stats["throttled"] == 0
+    asyncio.run(main())
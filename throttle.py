@@ -0,0 +1,84 @@
+"""
+Троттлинг входящих апдейтов: токен-бакет на (пользователь, действие).
+
+Действие — префикс callback'а ("qty", "pay", …), "msg" для сообщений,
+"inline" для inline-запросов. limits = {действие: (в секунду, подряд)},
+"*" — для остальных. Состояние — [токены, время, предупреждён] в dict;
+раз в sweep секунд выкидываются бакеты, которые уже снова полные
+(их отсутствие ничем не отличается от полного бакета).
+
+collapse — префиксы, для которых одинаковый callback, пришедший, пока
+предыдущий такой же ещё обрабатывается (двойной тап по «✅ Подтвердить» заказа),
+отбрасывается, а не ставится в очередь.
+
+Лишнее отбрасывается до хендлера (CancelHandler). На отброшенный callback
+отвечаем один раз на серию, чтобы флуд не превращался в флуд Bot API.
+"""
+
+import time
+
+from aiogram.dispatcher.handler import CancelHandler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+
+
+class Throttle(BaseMiddleware):
+    def __init__(self, limits:dict, collapse=(), sweep:float=60, exempt=()):
+        super().__init__()
+        self.limits, self.collapse, self.exempt = limits, set(collapse), set(exempt)
+        self.buckets = {}           # (uid, action) -> [tokens, t, warned]
+        self.inflight = set()       # (uid, callback data)
+        self.sweep, self._swept = sweep, time.monotonic()
+        self.stats = {"throttled": 0, "collapsed": 0}
+
+    def _limit(self, action): return self.limits.get(action) or self.limits["*"]
+
+    def allow(self, uid, action) -> bool:
+        """Взять токен; False — лимит исчерпан."""
+        rate, burst = self._limit(action)
+        now = time.monotonic()
+        if now-self._swept > self.sweep: self._evict(now)
+        if (b := self.buckets.get((uid, action))) is None:
+            self.buckets[(uid, action)] = [burst-1, now, False]; return True
+        b[0] = min(burst, b[0]+(now-b[1])*rate); b[1] = now
+        if b[0] >= 1:
+            b[0] -= 1; b[2] = False; return True
+        self.stats["throttled"] += 1
+        return False
+
+    def _warn(self, uid, action) -> bool:
+        """Первый отказ в серии? (дальше молчим до следующего пропуска)"""
+        b = self.buckets[(uid, action)]
+        first, b[2] = not b[2], True
+        return first
+
+    def _evict(self, now):
+        self._swept = now
+        full = []
+        for k, (tok, t, _) in self.buckets.items():
+            rate, burst = self._limit(k[1])
+            if tok+(now-t)*rate >= burst: full.append(k)
+        for k in full: del self.buckets[k]
+
+    # ── aiogram ──
+    async def on_pre_process_message(self, m, data):
+        if m.from_user.id in self.exempt: return
+        if not self.allow(m.from_user.id, "msg"): raise CancelHandler()
+
+    async def on_pre_process_inline_query(self, q, data):
+        if q.from_user.id in self.exempt: return
+        if not self.allow(q.from_user.id, "inline"): raise CancelHandler()
+
+    async def on_pre_process_callback_query(self, c, data):
+        uid, action = c.from_user.id, (c.data or "").partition(":")[0]
+        if action in self.collapse:
+            if (uid, c.data) in self.inflight:
+                self.stats["collapsed"] += 1
+                await c.answer("⏳"); raise CancelHandler()
+        if uid not in self.exempt and not self.allow(uid, action):
+            if self._warn(uid, action): await c.answer("Слишком часто, подождите секунду")
+            raise CancelHandler()
+        if action in self.collapse:
+            self.inflight.add((uid, c.data)); data["_inflight"] = (uid, c.data)
+
+    async def on_post_process_callback_query(self, c, results, data):
+        if key := data.get("_inflight"): self.inflight.discard(key)
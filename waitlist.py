@@ -0,0 +1,110 @@
+"""
+Лист ожидания: «🔔 Сообщить» на распроданном вкусе → рассылка при поступлении.
+
+Очереди как таковой нет: работа — это вкусы с stock>0, у которых есть
+ожидающие (waitlist.notified IS NULL). Поэтому после рестарта всё
+продолжается само. Рассылка идёт пачками:
+  1) в одной транзакции пачка помечается notified=<время> («взята»);
+  2) сообщения уходят параллельно, но через общий Bucket (лимит бота)
+     и ChatGap (лимит на чат); 429 → пауза всем и повтор;
+  3) доставленные и заблокировавшие бота удаляются, сетевые сбои и
+     не начатые — снова NULL.
+При остановке текущая пачка дорабатывает (до grace секунд). Взятые, но
+не подтверждённые строки (падение процесса посреди пачки) на старте
+удаляются — лучше не сообщить, чем сообщить дважды.
+"""
+
+import asyncio, logging
+
+from aiogram.types import InlineKeyboardButton as IB, InlineKeyboardMarkup as IM
+from aiogram.utils.exceptions import RetryAfter, Unauthorized, ChatNotFound, NetworkError
+from aiogram.utils.markdown import quote_html
+
+from callbacks import FLV
+from ratelimit import Bucket, ChatGap
+
+log = logging.getLogger("waitlist")
+
+CLAIM = "SELECT user_id FROM waitlist WHERE flavour_id=? AND notified IS NULL ORDER BY rowid LIMIT ?"
+READY = """SELECT f.id,p.name,f.name FROM flavours f JOIN products p ON p.id=f.product_id
+           WHERE f.id IN (SELECT flavour_id FROM waitlist WHERE notified IS NULL) AND f.stock>0"""
+
+
+class Notifier:
+    def __init__(self, db, bot, rate:float=25, batch:int=100, chat_gap:float=1.0, poll:float=60, grace:float=5):
+        self.db, self.bot, self.batch, self.poll, self.grace = db, bot, batch, poll, grace
+        # burst=1: в любой секунде не больше rate сообщений — и сразу после рестарта
+        self.bucket, self.gap = Bucket(rate, burst=1), ChatGap(chat_gap)
+        self.wake = asyncio.Event()
+        self.stats = {"sent": 0, "blocked": 0, "retry": 0, "failed": 0, "dropped": 0}
+
+    def kick(self):
+        """Остаток вырос — разбудить рассылку."""
+        self.wake.set()
+
+    async def run(self):
+        n = (await self.db.execute("DELETE FROM waitlist WHERE notified IS NOT NULL")).rowcount
+        if n: self.stats["dropped"] += n; log.warning("waitlist: %s unconfirmed notifications dropped", n)
+        while True:
+            try:
+                await self.drain()
+            except Exception:
+                log.exception("waitlist")
+            try: await asyncio.wait_for(self.wake.wait(), self.poll)
+            except asyncio.TimeoutError: pass
+            self.wake.clear()
+
+    async def drain(self):
+        """Разослать всё, что можно; стоп, если пачка не продвинулась (сеть лежит)."""
+        while rows := await self.db.fetchall(READY):
+            for fid, pname, fname in rows:
+                kb = IM().add(IB("Выбрать количество", callback_data=FLV(fid)))
+                text = f"🔔 Снова в наличии: <b>{quote_html(pname)}</b> — {quote_html(fname)}"
+                while (done := await self._batch(fid, text, kb)) is not None:
+                    if not done: return
+
+    async def _batch(self, fid, text, kb):
+        """→ сколько строк закрыто, или None, если ждущих (или остатка) больше нет."""
+        def claim(con):
+            row = con.execute("SELECT stock FROM flavours WHERE id=?", (fid,)).fetchone()
+            if not row or row[0] <= 0: return []
+            uids = [u for u, in con.execute(CLAIM, (fid, self.batch))]
+            con.executemany("UPDATE waitlist SET notified=strftime('%s','now') WHERE user_id=? AND flavour_id=?",
+                            [(u, fid) for u in uids])
+            return uids
+        uids = await self.db.tx(claim)
+        if not uids: return None
+        state = dict.fromkeys(uids, "wait")         # wait → sending → sent | gone | again
+        sends = asyncio.gather(*(self._send(u, text, kb, state) for u in uids))
+        try:
+            await asyncio.shield(sends)
+        finally:
+            if not sends.done():                    # остановка бота: даём пачке дойти
+                await asyncio.wait([sends], timeout=self.grace)
+                sends.cancel()
+            close = [(u, fid) for u, s in state.items() if s in ("sent", "gone")]
+            again = [(u, fid) for u, s in state.items() if s in ("wait", "again")]
+            def settle(con):
+                con.executemany("DELETE FROM waitlist WHERE user_id=? AND flavour_id=?", close)
+                con.executemany("UPDATE waitlist SET notified=NULL WHERE user_id=? AND flavour_id=?", again)
+            await asyncio.shield(self.db.tx(settle))
+        return len(close)
+
+    async def _send(self, uid, text, kb, state):
+        while True:
+            # бакет — последним: ожидание чата не копит взятые токены в пачку
+            await self.gap.wait(uid); await self.bucket.take(); self.gap.mark(uid)
+            state[uid] = "sending"
+            try:
+                await self.bot.send_message(uid, text, reply_markup=kb)
+            except RetryAfter as e:
+                self.stats["retry"] += 1; self.bucket.pause(e.timeout); state[uid] = "wait"; continue
+            except (Unauthorized, ChatNotFound):
+                self.stats["blocked"] += 1; state[uid] = "gone"
+            except (NetworkError, asyncio.TimeoutError):
+                self.stats["failed"] += 1; state[uid] = "again"
+            except Exception as e:                        # остальное повтором не лечится
+                log.warning("waitlist: %s: %r", uid, e); self.stats["failed"] += 1; state[uid] = "gone"
+            else:
+                self.stats["sent"] += 1; state[uid] = "sent"
+            return